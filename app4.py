@@ -1,13 +1,15 @@
 import streamlit as st
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_community.tools.tavily_search import TavilySearchResults
-from ddgs import DDGS
 from dotenv import load_dotenv
 import os
 from datetime import datetime
 import uuid
 
+from stream_render import render_stream
+from llm_scheduler import ScheduledChatModel
+from single_flight import SingleFlightChatModel
+
 load_dotenv()
 
 st.set_page_config(page_title="LangChain Chat", page_icon="💬", layout="wide")
@@ -39,13 +41,18 @@ if "selected_model" not in st.session_state:
 if "search_engine" not in st.session_state:
     st.session_state.search_engine = None
 
+# 전역 스케줄러가 세션별 대기열을 구분하기 위한 ID (llm_scheduler.py)
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
+# 같은 요청이 다른 세션에서 진행 중이면 합류 (single_flight.py)
 if "llm" not in st.session_state:
-    st.session_state.llm = ChatOpenAI(
+    st.session_state.llm = SingleFlightChatModel(ScheduledChatModel(ChatOpenAI(
         model=MODELS[st.session_state.selected_model],
         temperature=0.7,
         streaming=True,
         api_key=os.getenv("OPENAI_API_KEY")
-    )
+    ), session_id=st.session_state.session_id))
 
 def create_new_conversation():
     new_id = str(uuid.uuid4())
@@ -75,6 +82,9 @@ def delete_conversation(conv_id):
 
 def search_tavily(query):
     try:
+        # 검색을 켰을 때만 import (앱 시작 시간 단축)
+        from langchain_community.tools.tavily_search import TavilySearchResults
+        
         api_key = os.getenv("TAVILY_API_KEY")
         if not api_key:
             return None, "❌ Tavily API 키가 설정되지 않았습니다. .env 파일에 TAVILY_API_KEY를 추가하세요."
@@ -97,6 +107,9 @@ def search_tavily(query):
 
 def search_duckduckgo(query):
     try:
+        # 검색을 켰을 때만 import (앱 시작 시간 단축)
+        from ddgs import DDGS
+        
         ddgs = DDGS()
         results = list(ddgs.text(query, max_results=5))
         
@@ -136,12 +149,12 @@ with st.sidebar:
     
     if model_choice != st.session_state.selected_model:
         st.session_state.selected_model = model_choice
-        st.session_state.llm = ChatOpenAI(
+        st.session_state.llm = SingleFlightChatModel(ScheduledChatModel(ChatOpenAI(
             model=MODELS[model_choice],
             temperature=0.7,
             streaming=True,
             api_key=os.getenv("OPENAI_API_KEY")
-        )
+        ), session_id=st.session_state.session_id))
         st.success(f"모델이 {model_choice}로 변경되었습니다.")
     
     st.divider()
@@ -283,14 +296,8 @@ if prompt := st.chat_input("메시지를 입력하세요..."):
         messages_with_system = messages_with_search
     
     with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        full_response = ""
-        
-        for chunk in st.session_state.llm.stream(messages_with_system):
-            full_response += chunk.content
-            message_placeholder.markdown(full_response + "▌")
-        
-        message_placeholder.markdown(full_response)
+        # 청크를 모아 50ms / 200자마다 한 번씩만 화면에 반영 (토큰마다 전체 답변을 다시 그리지 않음)
+        full_response = render_stream(st.session_state.llm.stream(messages_with_system))
     
     current_conv["messages"].append(AIMessage(content=full_response))
     st.rerun()
@@ -0,0 +1,639 @@
+"""
+llm_scheduler.py - 프로세스 전역 OpenAI 호출 스케줄러 (요청/토큰 한도 + 세션 간 공정 대기열)
+==========================================================================================
+
+목적:
+    Streamlit 세션마다 LLM/임베딩을 따로 호출하면 사용자가 몰릴 때 계정의 분당 요청 수(RPM)와
+    분당 토큰 수(TPM) 한도를 넘겨 모든 세션이 동시에 429 오류를 받습니다.
+    한 프로세스의 모든 OpenAI 호출을 스케줄러 하나에 통과시켜 한도 안에서만 요청을 보내고,
+    한도가 모자랄 때는 세션별 대기열에 줄을 세워 순서대로(라운드 로빈) 보냅니다.
+
+주요 기능:
+    1. 공유 토큰 버킷: RPM / TPM (호출 전 예상 토큰만큼 예약, 끝나면 실제 사용량으로 정산)
+    2. 세션 간 공정 대기열: 세션마다 대기열을 두고 한 번씩 돌아가며 허가
+       (한 세션이 요청을 많이 쌓아도 다른 세션이 뒤로 밀리지 않음)
+    3. 우선순위: 대화 응답(INTERACTIVE)이 백그라운드 인덱싱(BACKGROUND)보다 먼저
+       (BACKGROUND_MAX_WAIT_SECONDS 넘게 기다린 백그라운드 요청은 대화 응답과 같은 순위)
+    4. 429 응답을 받으면 Retry-After 동안 프로세스 전체가 요청을 멈춤
+    5. 마감 시각: 요청의 남은 시간 안에 허가를 받지 못하면 대기열에서 빠지고 SchedulerTimeoutError
+    6. 지표: 우선순위별 대기열 길이, 대기 시간 평균/p95, 동시 실행 수, 남은 한도
+    7. python llm_scheduler.py: 가짜 LLM으로 세션 간 공정성/우선순위 확인
+
+사용:
+    # 세션 ID / 우선순위 / 마감 시각은 contextvars로 전달 (작업 스레드로도 전달됨)
+    with scheduler_context(session_id, INTERACTIVE, deadline=time.monotonic() + 10):
+        response = llm.invoke(messages)
+
+    # ChatOpenAI / Embeddings를 감싸 모든 호출이 스케줄러를 거치도록 함
+    llm = ScheduledChatModel(ChatOpenAI(...), session_id=session_id)
+    embeddings = ScheduledEmbeddings(OpenAIEmbeddings(...))
+
+설정 (환경 변수, 그룹: CHAT / EMBEDDING):
+    OPENAI_CHAT_RPM, OPENAI_CHAT_TPM, OPENAI_CHAT_CONCURRENCY
+    OPENAI_EMBEDDING_RPM, OPENAI_EMBEDDING_TPM, OPENAI_EMBEDDING_CONCURRENCY
+
+주의:
+    Streamlit과 Agent가 스레드 기반이므로 asyncio가 아닌 스레드(threading.Condition)로
+    대기합니다. 대기 중인 호출은 자기 스레드에서 허가를 기다립니다.
+"""
+
+import argparse
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+# 우선순위 (숫자가 작을수록 먼저)
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# 세션 ID를 지정하지 않은 호출 (예: 여러 세션의 질의를 합친 임베딩 묶음 요청)
+DEFAULT_SESSION = "shared"
+
+# 그룹별 기본 한도 (OpenAI 계정 등급에 맞게 환경 변수로 조정)
+DEFAULT_LIMITS = {
+    "chat": {"rpm": 500, "tpm": 200_000, "concurrency": 32},
+    "embedding": {"rpm": 3_000, "tpm": 1_000_000, "concurrency": 16},
+}
+
+# 호출 전에 출력 토큰 수를 모를 때 예약할 토큰 수
+DEFAULT_OUTPUT_TOKENS = 600
+
+# 이보다 오래 기다린 백그라운드 요청은 대화 응답과 같은 순위로 올림 (무한 대기 방지)
+BACKGROUND_MAX_WAIT_SECONDS = 30.0
+
+# 429 응답에 Retry-After가 없을 때 전체 요청을 멈출 시간 (초)
+DEFAULT_RATE_LIMIT_PAUSE = 1.0
+
+# 한 번에 허가를 받을 임베딩 텍스트 수 (큰 인덱싱 요청 사이에 질의가 끼어들 수 있도록)
+EMBEDDING_CHUNK_SIZE = 256
+
+_session_var: contextvars.ContextVar = contextvars.ContextVar("llm_session", default=DEFAULT_SESSION)
+_priority_var: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+_deadline_var: contextvars.ContextVar = contextvars.ContextVar("llm_deadline", default=None)
+
+_schedulers: Dict[str, "LLMScheduler"] = {}
+_schedulers_lock = threading.Lock()
+
+
+class SchedulerTimeoutError(TimeoutError):
+    """마감 시각까지 스케줄러 허가를 받지 못한 경우 (요청은 보내지 않음)"""
+
+
+@contextmanager
+def scheduler_context(
+    session_id: Optional[str] = None,
+    priority: Optional[int] = None,
+    deadline: Optional[float] = None
+):
+    """
+    이 블록 안의 LLM/임베딩 호출에 세션 ID, 우선순위, 마감 시각을 지정합니다.
+
+    contextvars를 사용하므로 contextvars.copy_context()로 실행하는 작업 스레드
+    (request_budget.submit, 헤징 요청, LangGraph 노드)에도 그대로 전달됩니다.
+
+    Args:
+        deadline: 허가를 기다릴 수 있는 마지막 시각 (time.monotonic 기준,
+            바깥 블록에 더 이른 마감이 있으면 그 값을 유지)
+    """
+    tokens = []
+    if session_id is not None:
+        tokens.append((_session_var, _session_var.set(session_id)))
+    if priority is not None:
+        tokens.append((_priority_var, _priority_var.set(priority)))
+    if deadline is not None:
+        outer = _deadline_var.get()
+        tokens.append((_deadline_var, _deadline_var.set(deadline if outer is None else min(outer, deadline))))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def estimate_tokens(messages) -> int:
+    """
+    메시지(또는 문자열) 리스트의 입력 토큰 수를 추정합니다. (글자 수 / 2 + 메시지당 4)
+
+    한국어 기준으로 넉넉하게 잡으며, 호출이 끝나면 실제 사용량으로 정산합니다.
+    """
+    if isinstance(messages, str):
+        messages = [messages]
+    return sum(len(str(getattr(message, "content", message))) // 2 + 4 for message in messages)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """429 응답의 Retry-After 헤더 (초, 없으면 None)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    분당 한도를 초당 속도로 채우는 토큰 버킷 (잠금은 LLMScheduler가 담당)
+
+    한도보다 큰 요청(예: 큰 문서 묶음 임베딩)은 버킷이 가득 찼을 때 허가하고
+    잔량을 음수로 만들어, 그만큼 다음 요청을 늦춥니다.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount를 꺼낼 수 있을 때까지 남은 시간 (초, 지금 가능하면 0)"""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def give_back(self, amount: float):
+        """예약보다 적게 썼으면 돌려받고, 더 썼으면 추가로 차감 (amount < 0)"""
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    """대기 중이거나 실행 중인 요청 하나"""
+
+    __slots__ = ("session_id", "priority", "tokens", "used_tokens", "enqueued_at", "granted")
+
+    def __init__(self, session_id: str, priority: int, tokens: int):
+        self.session_id = session_id
+        self.priority = priority
+        self.tokens = tokens
+        self.used_tokens: Optional[int] = None
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class LLMScheduler:
+    """
+    RPM/TPM 버킷과 동시 실행 수 안에서 세션별 대기열을 라운드 로빈으로 허가하는 스케줄러
+
+    모든 스레드가 공유합니다. 별도 디스패처 스레드 없이, 대기 중인 스레드가
+    상태가 바뀔 때(요청 추가/종료, 버킷 충전 시각) 깨어나 허가할 요청을 정합니다.
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: int, concurrency: int):
+        """
+        Args:
+            name: 그룹 이름 (지표 표시용)
+            rpm: 분당 요청 수 한도
+            tpm: 분당 토큰 수 한도
+            concurrency: 동시에 실행할 최대 요청 수
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self._rpm = TokenBucket(rpm)
+        self._tpm = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        # 우선순위 → (세션 ID → 대기 요청) / 세션 순서가 라운드 로빈 순서
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {
+            priority: OrderedDict() for priority in PRIORITY_NAMES
+        }
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._waits: Dict[int, deque] = {priority: deque(maxlen=500) for priority in PRIORITY_NAMES}
+        self.stats = {
+            "granted": 0,
+            "queued": 0,
+            "rate_limited": 0,
+            "timed_out": 0,
+            "tokens_reserved": 0,
+            "tokens_used": 0
+        }
+
+    # ------------------------------------------------------------------
+    # 허가
+    # ------------------------------------------------------------------
+
+    def _next_ticket(self, now: float) -> Optional[_Ticket]:
+        """다음에 허가할 요청 (가장 높은 우선순위의 다음 차례 세션, 오래 기다린 백그라운드 우선)"""
+        for session_queue in self._queues[BACKGROUND].values():
+            if now - session_queue[0].enqueued_at >= BACKGROUND_MAX_WAIT_SECONDS:
+                return session_queue[0]
+        for priority in sorted(self._queues):
+            sessions = self._queues[priority]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    def _pop(self, ticket: _Ticket):
+        """요청을 대기열에서 빼고, 세션을 라운드 로빈 순서의 맨 뒤로 보냄"""
+        sessions = self._queues[ticket.priority]
+        session_queue = sessions[ticket.session_id]
+        session_queue.remove(ticket)
+        if session_queue:
+            sessions.move_to_end(ticket.session_id)
+        else:
+            del sessions[ticket.session_id]
+
+    def _abandon(self, ticket: _Ticket):
+        """마감이 지난 요청을 대기열에서 뺌 (세션 순서는 그대로, 뒤의 요청이 허가될 수 있는지 다시 확인)"""
+        sessions = self._queues[ticket.priority]
+        session_queue = sessions[ticket.session_id]
+        session_queue.remove(ticket)
+        if not session_queue:
+            del sessions[ticket.session_id]
+        self.stats["timed_out"] += 1
+        self._dispatch()
+        self._cond.notify_all()
+
+    def _dispatch(self) -> Optional[float]:
+        """
+        허가할 수 있는 요청을 모두 허가합니다. (잠금을 잡은 상태에서 호출)
+
+        Returns:
+            다음 요청을 허가할 수 있을 때까지의 시간 (초, 요청 종료를 기다려야 하면 None)
+        """
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        delay = None
+        granted = False
+        while self._in_flight < self.concurrency:
+            ticket = self._next_ticket(now)
+            if ticket is None:
+                break
+            wait = max(self._rpm.wait_time(1, now), self._tpm.wait_time(ticket.tokens, now))
+            if wait > 0:
+                delay = wait
+                break
+            self._pop(ticket)
+            self._rpm.take(1)
+            self._tpm.take(ticket.tokens)
+            self._in_flight += 1
+            ticket.granted = True
+            granted = True
+            waited = now - ticket.enqueued_at
+            self._waits[ticket.priority].append(waited)
+            self.stats["granted"] += 1
+            self.stats["tokens_reserved"] += ticket.tokens
+            if waited > 0.001:
+                self.stats["queued"] += 1
+
+        if granted:
+            self._cond.notify_all()
+        return delay
+
+    def acquire(
+        self,
+        tokens: int,
+        session_id: Optional[str] = None,
+        priority: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> _Ticket:
+        """
+        허가를 받을 때까지 기다립니다.
+
+        Args:
+            tokens: 예약할 토큰 수 (입력 + 예상 출력)
+            session_id: 세션 ID (None이면 scheduler_context로 지정한 값)
+            priority: INTERACTIVE / BACKGROUND (None이면 scheduler_context로 지정한 값)
+            timeout: 최대 대기 시간 (초, scheduler_context의 마감 시각과 더 이른 쪽 적용,
+                둘 다 없으면 무한 대기)
+
+        Returns:
+            release()에 넘길 허가증
+
+        Raises:
+            SchedulerTimeoutError: 마감 시각까지 허가를 받지 못한 경우 (대기열에서 빠짐)
+        """
+        ticket = _Ticket(
+            session_id if session_id is not None else _session_var.get(),
+            priority if priority is not None else _priority_var.get(),
+            max(1, int(tokens))
+        )
+        deadline = _deadline_var.get()
+        if timeout is not None:
+            limit = ticket.enqueued_at + timeout
+            deadline = limit if deadline is None else min(deadline, limit)
+
+        with self._cond:
+            self._queues[ticket.priority].setdefault(ticket.session_id, deque()).append(ticket)
+            while not ticket.granted:
+                delay = self._dispatch()
+                if ticket.granted:
+                    break
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        self._abandon(ticket)
+                        raise SchedulerTimeoutError(
+                            f"{self.name}: {time.monotonic() - ticket.enqueued_at:.1f}초 동안 허가를 받지 못함"
+                        )
+                    delay = left if delay is None else min(delay, left)
+                self._cond.wait(timeout=delay)
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        """요청 종료: 실제 사용 토큰으로 TPM을 정산하고 다음 요청을 허가합니다."""
+        with self._cond:
+            self._in_flight -= 1
+            if ticket.used_tokens is not None:
+                self._tpm.give_back(ticket.tokens - ticket.used_tokens)
+                self.stats["tokens_used"] += ticket.used_tokens
+            else:
+                self.stats["tokens_used"] += ticket.tokens
+            self._dispatch()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(
+        self,
+        tokens: int,
+        session_id: Optional[str] = None,
+        priority: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        """
+        허가를 받아 블록을 실행하고 끝나면 반납합니다.
+
+        블록 안에서 ticket.used_tokens에 실제 사용 토큰 수를 넣으면 TPM을 정산합니다.
+        """
+        ticket = self.acquire(tokens, session_id, priority, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def pause(self, seconds: float):
+        """429 응답을 받았을 때 seconds초 동안 모든 요청 허가를 멈춥니다."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.stats["rate_limited"] += 1
+            self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # 지표
+    # ------------------------------------------------------------------
+
+    def summary(self) -> dict:
+        """우선순위별 대기열 길이 / 대기 시간, 동시 실행 수, 남은 한도, 누적 통계"""
+        with self._cond:
+            now = time.monotonic()
+            self._rpm._refill(now)
+            self._tpm._refill(now)
+            queue_depth = {
+                PRIORITY_NAMES[priority]: sum(len(queue) for queue in sessions.values())
+                for priority, sessions in self._queues.items()
+            }
+            waiting_sessions = len({
+                session for sessions in self._queues.values() for session in sessions
+            })
+            waits = {priority: sorted(samples) for priority, samples in self._waits.items()}
+            result = {
+                "name": self.name,
+                "in_flight": self._in_flight,
+                "queue_depth": queue_depth,
+                "waiting_sessions": waiting_sessions,
+                "rpm_available": max(0.0, self._rpm.level),
+                "tpm_available": max(0.0, self._tpm.level),
+                "paused_s": max(0.0, self._paused_until - now),
+                **self.stats
+            }
+
+        result["wait_ms"] = {
+            PRIORITY_NAMES[priority]: {
+                "avg": sum(samples) / len(samples) * 1000 if samples else 0.0,
+                "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000 if samples else 0.0
+            }
+            for priority, samples in waits.items()
+        }
+        return result
+
+
+def get_scheduler(group: str = "chat") -> LLMScheduler:
+    """
+    그룹("chat" / "embedding")별 프로세스 전역 스케줄러
+
+    한도는 OPENAI_<그룹>_RPM / _TPM / _CONCURRENCY 환경 변수로 바꿀 수 있습니다.
+    """
+    with _schedulers_lock:
+        if group not in _schedulers:
+            limits = {
+                key: int(os.getenv(f"OPENAI_{group.upper()}_{key.upper()}") or default)
+                for key, default in DEFAULT_LIMITS[group].items()
+            }
+            _schedulers[group] = LLMScheduler(group, **limits)
+        return _schedulers[group]
+
+
+# ============================================================================
+# ChatOpenAI / Embeddings 래퍼
+# ============================================================================
+
+def _output_tokens(llm, kwargs: dict) -> int:
+    """예약할 출력 토큰 수 (max_tokens 설정이 있으면 그 값)"""
+    for value in (kwargs.get("max_tokens"), kwargs.get("max_completion_tokens"), getattr(llm, "max_tokens", None)):
+        if isinstance(value, int) and value > 0:
+            return value
+    return DEFAULT_OUTPUT_TOKENS
+
+
+def _usage_tokens(message) -> Optional[int]:
+    """응답의 실제 사용 토큰 수 (usage_metadata가 없으면 None)"""
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class ScheduledChatModel:
+    """
+    ChatOpenAI의 invoke / stream을 스케줄러 허가를 받은 뒤 실행하는 래퍼
+
+    스트리밍은 마지막 청크를 받을 때까지 동시 실행 자리를 차지합니다.
+    허가 대기는 호출할 때의 scheduler_context 마감 시각(요청의 남은 시간)과
+    max_wait 중 더 이른 쪽까지만 하고, 넘으면 SchedulerTimeoutError를 냅니다.
+    """
+
+    def __init__(
+        self,
+        llm,
+        session_id: Optional[str] = None,
+        group: str = "chat",
+        max_wait: Optional[float] = None
+    ):
+        """
+        Args:
+            llm: 실제 채팅 모델 (예: ChatOpenAI)
+            session_id: 이 모델을 쓰는 세션 ID (None이면 호출할 때의 scheduler_context 값)
+            group: 스케줄러 그룹
+            max_wait: 허가를 기다릴 최대 시간 (초, None이면 마감 시각까지만)
+        """
+        self.llm = llm
+        self.session_id = session_id
+        self.max_wait = max_wait
+        self.scheduler = get_scheduler(group)
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.llm, "model_name", "")
+
+    def _throttled(self, error: Exception):
+        if getattr(error, "status_code", None) == 429:
+            self.scheduler.pause(_retry_after(error) or DEFAULT_RATE_LIMIT_PAUSE)
+
+    def invoke(self, messages, **kwargs):
+        tokens = estimate_tokens(messages) + _output_tokens(self.llm, kwargs)
+        with self.scheduler.slot(tokens, self.session_id, timeout=self.max_wait) as ticket:
+            try:
+                response = self.llm.invoke(messages, **kwargs)
+            except Exception as e:
+                self._throttled(e)
+                raise
+            ticket.used_tokens = _usage_tokens(response)
+            return response
+
+    def stream(self, messages, **kwargs):
+        prompt_tokens = estimate_tokens(messages)
+        with self.scheduler.slot(
+            prompt_tokens + _output_tokens(self.llm, kwargs), self.session_id, timeout=self.max_wait
+        ) as ticket:
+            generated = 0
+            stream = self.llm.stream(messages, **kwargs)
+            try:
+                for chunk in stream:
+                    generated += len(str(chunk.content))
+                    used = _usage_tokens(chunk)
+                    if used:
+                        ticket.used_tokens = used
+                    yield chunk
+            except Exception as e:
+                self._throttled(e)
+                raise
+            finally:
+                stream.close()
+            if ticket.used_tokens is None:
+                ticket.used_tokens = prompt_tokens + generated // 2
+
+
+class ScheduledEmbeddings(Embeddings):
+    """
+    임베딩 요청을 스케줄러 허가를 받은 뒤 보내는 Embeddings 래퍼
+
+    큰 문서 묶음은 chunk_size개씩 나눠 허가를 받으므로,
+    백그라운드 인덱싱 중에도 대화의 검색 질의가 사이에 끼어들 수 있습니다.
+    """
+
+    def __init__(self, embeddings: Embeddings, chunk_size: int = EMBEDDING_CHUNK_SIZE, group: str = "embedding"):
+        self.embeddings = embeddings
+        self.chunk_size = chunk_size
+        self.scheduler = get_scheduler(group)
+
+    def _call(self, fn, texts):
+        with self.scheduler.slot(estimate_tokens(texts)):
+            try:
+                return fn(texts)
+            except Exception as e:
+                if getattr(e, "status_code", None) == 429:
+                    self.scheduler.pause(_retry_after(e) or DEFAULT_RATE_LIMIT_PAUSE)
+                raise
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.chunk_size):
+            vectors.extend(self._call(self.embeddings.embed_documents, texts[start:start + self.chunk_size]))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call(self.embeddings.embed_query, text)
+
+
+# ============================================================================
+# 시뮬레이션: 요청을 많이 쌓는 세션 / 백그라운드 인덱싱 / 일반 세션
+# ============================================================================
+
+class _FakeLLM:
+    """지연 시간만 흉내 내는 가짜 LLM"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def invoke(self, messages, **kwargs):
+        time.sleep(self.latency * random.uniform(0.8, 1.2))
+        return type("Response", (), {"content": "ok", "usage_metadata": None})()
+
+
+def simulate(rpm: int, concurrency: int, sessions: int, turns: int, flood: int, background: int,
+             latency: float) -> Dict[str, List[float]]:
+    """
+    일반 세션(turns번 순차 질문), 한 번에 flood개 요청을 쌓는 세션,
+    background개 요청을 보내는 인덱싱 작업을 동시에 실행하고 그룹별 턴 지연 시간을 반환합니다.
+    """
+    scheduler = LLMScheduler("simulation", rpm=rpm, tpm=10_000_000, concurrency=concurrency)
+    llm = _FakeLLM(latency)
+    latencies: Dict[str, List[float]] = {"interactive": [], "flood": [], "background": []}
+    lock = threading.Lock()
+
+    def call(group: str, session_id: str, priority: int):
+        start = time.perf_counter()
+        with scheduler.slot(100, session_id, priority):
+            llm.invoke("질문")
+        with lock:
+            latencies[group].append(time.perf_counter() - start)
+
+    def interactive(i: int):
+        for _ in range(turns):
+            call("interactive", f"user-{i}", INTERACTIVE)
+
+    threads = [threading.Thread(target=call, args=("flood", "flood", INTERACTIVE)) for _ in range(flood)]
+    threads += [threading.Thread(target=call, args=("background", "ingest", BACKGROUND)) for _ in range(background)]
+    threads += [threading.Thread(target=interactive, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary = scheduler.summary()
+    print(f"허가 {summary['granted']}회 | 대기 후 허가 {summary['queued']}회 | "
+          f"대기 p95: interactive {summary['wait_ms']['interactive']['p95']:.0f}ms, "
+          f"background {summary['wait_ms']['background']['p95']:.0f}ms")
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 스케줄러 공정성/우선순위 시뮬레이션 (가짜 LLM)")
+    parser.add_argument("--rpm", type=int, default=600, help="분당 요청 수 한도")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시 실행 수 한도")
+    parser.add_argument("--sessions", type=int, default=5, help="일반 대화 세션 수")
+    parser.add_argument("--turns", type=int, default=4, help="일반 세션당 순차 질문 수")
+    parser.add_argument("--flood", type=int, default=40, help="한 세션이 한꺼번에 보내는 요청 수")
+    parser.add_argument("--background", type=int, default=40, help="백그라운드 인덱싱 요청 수")
+    parser.add_argument("--latency", type=float, default=0.1, help="LLM 응답 지연 (초)")
+    args = parser.parse_args()
+
+    latencies = simulate(args.rpm, args.concurrency, args.sessions, args.turns,
+                         args.flood, args.background, args.latency)
+    for group, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        print(f"{group:>12}: 요청 {len(values):3d}개 | p50 {values[len(values) // 2] * 1000:7.0f}ms | "
+              f"최대 {values[-1] * 1000:7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,11 @@ from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from dotenv import load_dotenv
 import os
+import uuid
+
+from stream_render import render_stream
+from llm_scheduler import ScheduledChatModel
+from single_flight import SingleFlightChatModel
 
 load_dotenv()
 
@@ -32,13 +37,18 @@ if "pending" not in st.session_state:
 if "validation" not in st.session_state:
     st.session_state.validation = {}
 
+# 전역 스케줄러가 세션별 대기열을 구분하기 위한 ID (llm_scheduler.py)
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
+# 같은 요청이 다른 세션에서 진행 중이면 합류 (single_flight.py)
 if "llm" not in st.session_state:
-    st.session_state.llm = ChatOpenAI(
+    st.session_state.llm = SingleFlightChatModel(ScheduledChatModel(ChatOpenAI(
         model=MODELS[st.session_state.selected_model],
         temperature=0.7,
         streaming=True,
         api_key=os.getenv("OPENAI_API_KEY")
-    )
+    ), session_id=st.session_state.session_id))
 
 def validate_response(response):
     response_sentences = response.split(". ")
@@ -67,12 +77,12 @@ with st.sidebar:
     
     if model_choice != st.session_state.selected_model:
         st.session_state.selected_model = model_choice
-        st.session_state.llm = ChatOpenAI(
+        st.session_state.llm = SingleFlightChatModel(ScheduledChatModel(ChatOpenAI(
             model=MODELS[model_choice],
             temperature=0.7,
             streaming=True,
             api_key=os.getenv("OPENAI_API_KEY")
-        )
+        ), session_id=st.session_state.session_id))
         st.success(f"모델이 {model_choice}로 변경되었습니다.")
     
     st.divider()
@@ -116,14 +126,8 @@ if st.session_state.stage == "user":
             st.markdown(prompt)
         
         with st.chat_message("assistant"):
-            message_placeholder = st.empty()
-            full_response = ""
-            
-            for chunk in st.session_state.llm.stream(st.session_state.messages):
-                full_response += chunk.content
-                message_placeholder.markdown(full_response + "▌")
-            
-            message_placeholder.markdown(full_response)
+            # 청크를 모아 50ms / 200자마다 한 번씩만 화면에 반영 (토큰마다 전체 답변을 다시 그리지 않음)
+            full_response = render_stream(st.session_state.llm.stream(st.session_state.messages))
         
         st.session_state.pending = full_response
         st.session_state.stage = "validate"
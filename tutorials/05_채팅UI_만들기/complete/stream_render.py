@@ -0,0 +1,184 @@
+"""
+stream_render.py - 스트리밍 답변을 묶어서 화면에 반영
+====================================================
+
+목적:
+    토큰마다 full_response += chunk.content 후 placeholder.markdown(full_response)를
+    호출하면 매번 지금까지의 답변 전체를 다시 보내고 다시 Markdown으로 해석하므로
+    답변 길이에 대해 비용이 제곱으로 늘어납니다. (긴 답변에서 화면이 모델을 못 따라감)
+    청크를 리스트에 모았다가 일정 시간/글자 수마다 한 번씩만 화면에 반영합니다.
+
+주요 기능:
+    1. throttle_chunks: LangChain 청크 스트림을 50ms 또는 200자 단위 텍스트로 묶음
+    2. render_stream: st.write_stream으로 묶인 텍스트를 이어서 표시하고 전체 답변 반환
+       (write_stream이 없는 Streamlit 버전은 placeholder에 같은 간격으로 반영)
+    3. python stream_render.py: 긴 답변(수천 토큰)에서 토큰별 반영과 묶음 반영 비교
+
+사용:
+    with st.chat_message("assistant"):
+        full_response = render_stream(st.session_state.llm.stream(messages))
+"""
+
+import argparse
+import time
+from typing import Iterable, Iterator
+
+
+# 화면 반영 간격 (초) / 이만큼 글자가 모이면 간격과 관계없이 반영
+FLUSH_INTERVAL_SECONDS = 0.05
+FLUSH_MAX_CHARS = 200
+
+
+def _text(chunk) -> str:
+    """LangChain 메시지 청크 또는 문자열에서 텍스트만 꺼냄"""
+    return chunk if isinstance(chunk, str) else (getattr(chunk, "content", "") or "")
+
+
+def throttle_chunks(
+    chunks: Iterable,
+    interval: float = FLUSH_INTERVAL_SECONDS,
+    max_chars: int = FLUSH_MAX_CHARS
+) -> Iterator[str]:
+    """
+    청크를 모았다가 interval초가 지나거나 max_chars자가 모이면 한 덩어리로 내보냅니다.
+
+    다음 청크가 도착할 때 반영 여부를 판단하므로, 모델이 잠시 멈추면
+    모인 텍스트는 다음 청크(또는 스트림 끝)까지 기다립니다.
+    """
+    buffer = []
+    size = 0
+    last_flush = time.perf_counter()
+
+    for chunk in chunks:
+        text = _text(chunk)
+        if not text:
+            continue
+        buffer.append(text)
+        size += len(text)
+
+        now = time.perf_counter()
+        if size >= max_chars or now - last_flush >= interval:
+            yield "".join(buffer)
+            buffer.clear()
+            size = 0
+            last_flush = now
+
+    if buffer:
+        yield "".join(buffer)
+
+
+def render_stream(
+    chunks: Iterable,
+    interval: float = FLUSH_INTERVAL_SECONDS,
+    max_chars: int = FLUSH_MAX_CHARS
+) -> str:
+    """
+    스트리밍 답변을 현재 Streamlit 컨테이너에 표시하고 전체 답변을 반환합니다.
+
+    Args:
+        chunks: llm.stream(...) 결과 (메시지 청크 또는 문자열)
+        interval: 화면 반영 간격 (초)
+        max_chars: 간격 전이라도 반영할 글자 수
+
+    Returns:
+        전체 답변 문자열
+    """
+    import streamlit as st
+
+    pieces = throttle_chunks(chunks, interval, max_chars)
+
+    if hasattr(st, "write_stream"):
+        response = st.write_stream(pieces)
+        return response if isinstance(response, str) else "".join(map(str, response))
+
+    # 구버전 Streamlit: 같은 간격으로 placeholder에 반영
+    placeholder = st.empty()
+    parts = []
+    for piece in pieces:
+        parts.append(piece)
+        placeholder.markdown("".join(parts) + "▌")
+    full_response = "".join(parts)
+    placeholder.markdown(full_response)
+    return full_response
+
+
+# ============================================================================
+# 벤치마크
+# ============================================================================
+
+class _CountingPlaceholder:
+    """화면 반영 횟수와 전송한 글자 수를 세는 가짜 placeholder"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chars = 0
+
+    def markdown(self, text: str):
+        self.calls += 1
+        self.chars += len(text)
+
+
+def _fake_stream(tokens: int, tokens_per_sec: float) -> Iterator[str]:
+    token = "토큰 "
+    for i in range(tokens):
+        yield "\n\n" if i % 80 == 79 else token
+        if tokens_per_sec:
+            time.sleep(1.0 / tokens_per_sec)
+
+
+def benchmark(tokens: int, tokens_per_sec: float, interval: float, max_chars: int) -> dict:
+    """
+    토큰별 반영(기존 방식)과 묶음 반영의 화면 반영 횟수 / 전송 글자 수 / 소요 시간 비교
+
+    전송 글자 수는 placeholder.markdown이 매번 보내고 해석해야 하는 양으로,
+    브라우저/서버 부하에 비례합니다.
+    """
+    results = {}
+
+    placeholder = _CountingPlaceholder()
+    start = time.perf_counter()
+    full_response = ""
+    for text in _fake_stream(tokens, tokens_per_sec):
+        full_response += text
+        placeholder.markdown(full_response + "▌")
+    placeholder.markdown(full_response)
+    results["per_token"] = {
+        "flushes": placeholder.calls,
+        "chars_sent": placeholder.chars,
+        "elapsed_s": time.perf_counter() - start
+    }
+
+    placeholder = _CountingPlaceholder()
+    start = time.perf_counter()
+    parts = []
+    for piece in throttle_chunks(_fake_stream(tokens, tokens_per_sec), interval, max_chars):
+        # st.write_stream처럼 새로 받은 부분을 이어 붙여 표시 (여기서는 누적 텍스트 길이로 집계)
+        parts.append(piece)
+        placeholder.markdown("".join(parts) + "▌")
+    placeholder.markdown("".join(parts))
+    results["throttled"] = {
+        "flushes": placeholder.calls,
+        "chars_sent": placeholder.chars,
+        "elapsed_s": time.perf_counter() - start
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="스트리밍 화면 반영 방식 벤치마크")
+    parser.add_argument("--tokens", type=int, default=4000, help="답변 토큰 수")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0,
+                        help="생성 속도 (0이면 지연 없이 최대 속도)")
+    parser.add_argument("--interval", type=float, default=FLUSH_INTERVAL_SECONDS)
+    parser.add_argument("--max-chars", type=int, default=FLUSH_MAX_CHARS)
+    args = parser.parse_args()
+
+    results = benchmark(args.tokens, args.tokens_per_sec, args.interval, args.max_chars)
+    print(f"답변 {args.tokens} 토큰, 반영 간격 {args.interval * 1000:.0f}ms / {args.max_chars}자")
+    for name, stats in results.items():
+        print(f"{name:>10}: 반영 {stats['flushes']:>6}회 | "
+              f"전송 {stats['chars_sent'] / 1024:>10.1f} KB | {stats['elapsed_s']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
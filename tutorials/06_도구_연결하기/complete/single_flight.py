@@ -0,0 +1,374 @@
+"""
+single_flight.py - 동일한 LLM 요청 중복 제거 (Single-flight)
+============================================================
+
+목적:
+    여러 사용자가 같은 순간 같은 질문(예: 앱의 추천 질문, 수업 실습 질문)을 보내면
+    세션마다 똑같은 llm.invoke / llm.stream 요청이 따로 나갑니다.
+    요청 전체 지문(모델, 메시지, 파라미터)이 같은 요청이 이미 진행 중이면
+    새 요청을 보내지 않고 진행 중인 요청에 합류하여 같은 결과를 받습니다.
+
+주요 기능:
+    1. request_fingerprint: 모델 파라미터 + 메시지 + 호출 인자로 만든 SHA-256 지문
+    2. invoke 합류: 먼저 온 호출(leader)의 응답을 기다렸다가 복사본을 받음
+    3. stream 합류: 업스트림 스트림은 전용 스레드가 공유 토큰 버퍼에 채우고,
+       모든 호출자는 버퍼를 처음부터 읽음 (늦게 합류한 호출자는 이미 나온 청크를 먼저 재생)
+    4. 모든 호출자가 스트림을 닫으면 업스트림도 닫음
+    5. python single_flight.py: 가짜 LLM으로 동시 중복 요청의 업스트림 호출 수 비교
+
+주의:
+    진행 중인 요청에만 합류하며, 끝난 요청의 결과를 저장해 두지는 않습니다. (응답 캐시 아님)
+    합류한 호출자도 같은 응답을 받으므로 temperature가 있어도 답변이 같아집니다.
+"""
+
+import argparse
+import contextvars
+import copy
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+
+def _message_key(message) -> list:
+    """메시지에서 요청 내용에 영향을 주는 값만 추출 (메시지 id 등은 제외)"""
+    if isinstance(message, str):
+        return ["human", message]
+    return [
+        getattr(message, "type", type(message).__name__),
+        getattr(message, "content", str(message)),
+        getattr(message, "name", None),
+        getattr(message, "tool_calls", None),
+        getattr(message, "tool_call_id", None)
+    ]
+
+
+def request_fingerprint(mode: str, params: dict, messages, kwargs: Optional[dict] = None) -> str:
+    """
+    요청 전체 지문을 만듭니다.
+
+    Args:
+        mode: "invoke" 또는 "stream" (같은 메시지라도 서로 합류하지 않음)
+        params: 모델 이름, temperature 등 응답에 영향을 주는 모델 설정
+        messages: 메시지 리스트 (또는 문자열)
+        kwargs: invoke/stream에 넘긴 인자 (response_format 등)
+    """
+    if isinstance(messages, str):
+        messages = [messages]
+    payload = {
+        "mode": mode,
+        "params": params,
+        "messages": [_message_key(message) for message in messages],
+        "kwargs": kwargs or {}
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class _StreamFlight:
+    """
+    진행 중인 스트림 하나 (공유 토큰 버퍼)
+
+    업스트림은 전용 스레드(pump)가 읽어 chunks에 추가하고,
+    각 호출자는 자기 읽기 위치부터 버퍼를 읽습니다.
+    """
+
+    def __init__(self):
+        self.chunks: list = []
+        self.done = False
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self.readers = 0
+        self.cond = threading.Condition()
+
+    def pump(self, stream: Iterable, on_done: Callable[[], None]):
+        """업스트림 청크를 버퍼에 채움 (읽는 호출자가 모두 떠나면 중단)"""
+        try:
+            for chunk in stream:
+                with self.cond:
+                    if self.cancelled:
+                        break
+                    self.chunks.append(chunk)
+                    self.cond.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+            on_done()
+
+    def read(self, on_leave: Callable[["_StreamFlight"], None]) -> Iterator:
+        """버퍼를 처음부터 읽고, 새 청크가 들어오면 이어서 읽음 (attach 후 호출)"""
+        index = 0
+        try:
+            while True:
+                with self.cond:
+                    while index >= len(self.chunks) and not self.done:
+                        self.cond.wait()
+                    if index < len(self.chunks):
+                        pending = self.chunks[index:]
+                        index = len(self.chunks)
+                    elif self.error is not None:
+                        raise self.error
+                    else:
+                        return
+                for chunk in pending:
+                    yield chunk
+        finally:
+            with self.cond:
+                self.readers -= 1
+                left_alone = self.readers == 0 and not self.done
+                if left_alone:
+                    self.cancelled = True
+            if left_alone:
+                on_leave(self)
+
+
+class SingleFlight:
+    """
+    지문이 같은 진행 중 요청을 하나로 합치는 그룹 (모든 스레드 공유)
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "invoke_calls": 0,
+            "invoke_joined": 0,
+            "stream_calls": 0,
+            "stream_joined": 0,
+            "replayed_chunks": 0,
+            "cancelled_streams": 0
+        }
+
+    def invoke(self, key: str, fn: Callable[[], object]):
+        """
+        같은 key의 호출이 진행 중이면 그 결과를, 아니면 fn()을 실행한 결과를 반환합니다.
+
+        합류한 호출자는 응답의 얕은 복사본을 받습니다. (세션 간 객체 공유 방지)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.stats["invoke_calls"] += 1
+            else:
+                self.stats["invoke_joined"] += 1
+
+        if not leader:
+            return copy.copy(future.result())
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stream(self, key: str, factory: Callable[[], Iterable]) -> Iterator:
+        """
+        같은 key의 스트림이 진행 중이면 그 버퍼에 합류하고, 아니면 factory()로 새 스트림을 엽니다.
+
+        업스트림은 호출한 스레드의 contextvars(스케줄러 세션 등)를 복사한 전용 스레드에서 읽습니다.
+        """
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is not None:
+                with flight.cond:
+                    joined = not flight.cancelled
+                    if joined:
+                        flight.readers += 1
+                        self.stats["replayed_chunks"] += len(flight.chunks)
+            if flight is None or not joined:
+                flight = _StreamFlight()
+                flight.readers = 1
+                self._streams[key] = flight
+                self.stats["stream_calls"] += 1
+                leader = True
+            else:
+                self.stats["stream_joined"] += 1
+                leader = False
+
+        if leader:
+            context = contextvars.copy_context()
+            threading.Thread(
+                target=context.run,
+                args=(self._run_stream, key, flight, factory),
+                name="single-flight-stream",
+                daemon=True
+            ).start()
+        return flight.read(lambda left: self._discard(key, left, cancelled=True))
+
+    def _run_stream(self, key: str, flight: _StreamFlight, factory: Callable[[], Iterable]):
+        try:
+            stream = factory()
+        except Exception as e:
+            with flight.cond:
+                flight.error = e
+                flight.done = True
+                flight.cond.notify_all()
+            self._discard(key, flight)
+            return
+        flight.pump(stream, lambda: self._discard(key, flight))
+
+    def _discard(self, key: str, flight: _StreamFlight, cancelled: bool = False):
+        """끝났거나 취소된 스트림을 진행 중 목록에서 제거 (새 요청은 새 스트림을 엶)"""
+        with self._lock:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            if cancelled:
+                self.stats["cancelled_streams"] += 1
+
+    def summary(self) -> dict:
+        """업스트림 호출 수, 합류한 호출 수(절약한 요청 수), 재생한 청크 수"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls) + len(self._streams)
+        stats["calls_saved"] = stats["invoke_joined"] + stats["stream_joined"]
+        return stats
+
+
+_shared = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """프로세스 전역 SingleFlight (모든 세션이 같은 그룹을 써야 합류할 수 있음)"""
+    return _shared
+
+
+def _base_model(llm):
+    """래퍼(.llm)를 벗겨 실제 채팅 모델을 찾음"""
+    while hasattr(llm, "llm"):
+        llm = llm.llm
+    return llm
+
+
+def model_params(llm) -> dict:
+    """응답에 영향을 주는 모델 설정 (ChatOpenAI의 _default_params + API 주소)"""
+    base = _base_model(llm)
+    params = getattr(base, "_default_params", None)
+    params = dict(params) if isinstance(params, dict) else {}
+    params["model"] = getattr(base, "model_name", None) or getattr(base, "model", None)
+    params["base_url"] = getattr(base, "openai_api_base", None)
+    return params
+
+
+class SingleFlightChatModel:
+    """
+    invoke / stream을 프로세스 전역 SingleFlight로 보내는 채팅 모델 래퍼
+
+    세션마다 다른 인스턴스를 써도 지문이 같으면 같은 요청에 합류합니다.
+    """
+
+    def __init__(self, llm, group: Optional[SingleFlight] = None):
+        self.llm = llm
+        self.group = group or get_single_flight()
+        self._params = model_params(llm)
+
+    @property
+    def model_name(self) -> str:
+        return self._params["model"] or ""
+
+    def invoke(self, messages, **kwargs):
+        key = request_fingerprint("invoke", self._params, messages, kwargs)
+        return self.group.invoke(key, lambda: self.llm.invoke(messages, **kwargs))
+
+    def stream(self, messages, **kwargs):
+        key = request_fingerprint("stream", self._params, messages, kwargs)
+        return self.group.stream(key, lambda: self.llm.stream(messages, **kwargs))
+
+
+# ============================================================================
+# 벤치마크: 같은 질문을 동시에 보내는 사용자들
+# ============================================================================
+
+class _FakeStreamingLLM:
+    """첫 토큰 지연 후 일정 속도로 토큰을 내보내는 가짜 LLM"""
+
+    def __init__(self, first_token_latency: float, tokens: int, tokens_per_sec: float):
+        self.first_token_latency = first_token_latency
+        self.tokens = tokens
+        self.tokens_per_sec = tokens_per_sec
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def stream(self, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.first_token_latency)
+        for i in range(self.tokens):
+            time.sleep(1 / self.tokens_per_sec)
+            yield f"t{i} "
+
+
+def _run_users(llm, users: int, spread: float) -> dict:
+    """users명이 spread초 동안 나눠 같은 질문을 스트리밍으로 보냄"""
+    answers, ttft = [], []
+    lock = threading.Lock()
+
+    def user(i: int):
+        time.sleep(spread * i / max(users - 1, 1))
+        start = time.perf_counter()
+        first = None
+        pieces = []
+        for piece in llm.stream("CNN의 구조를 설명해주세요"):
+            if first is None:
+                first = time.perf_counter() - start
+            pieces.append(piece)
+        with lock:
+            answers.append("".join(pieces))
+            ttft.append(first)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ttft.sort()
+    return {"complete": len(set(answers)) == 1, "ttft_p50_ms": ttft[len(ttft) // 2] * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="동일 LLM 요청 중복 제거 벤치마크 (가짜 LLM)")
+    parser.add_argument("--users", type=int, default=20, help="같은 질문을 보내는 동시 사용자 수")
+    parser.add_argument("--spread", type=float, default=1.0, help="사용자들이 질문을 보내는 시간 범위 (초)")
+    parser.add_argument("--tokens", type=int, default=200, help="답변 토큰 수")
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    direct = _FakeStreamingLLM(args.first_token_latency, args.tokens, args.tokens_per_sec)
+    direct_result = _run_users(direct, args.users, args.spread)
+
+    backend = _FakeStreamingLLM(args.first_token_latency, args.tokens, args.tokens_per_sec)
+    group = SingleFlight()
+    deduped = SingleFlightChatModel(backend, group)
+    deduped_result = _run_users(deduped, args.users, args.spread)
+    summary = group.summary()
+
+    print(f"사용자 {args.users}명이 {args.spread}초 안에 같은 질문 (답변 {args.tokens}토큰)")
+    for name, result, calls in (
+        ("개별 요청", direct_result, direct.calls),
+        ("중복 제거", deduped_result, backend.calls),
+    ):
+        print(f"{name}: 업스트림 요청 {calls}회 | TTFT p50 {result['ttft_p50_ms']:.0f}ms | "
+              f"모든 답변 동일: {result['complete']}")
+    print(f"합류 {summary['stream_joined']}회 | 재생한 청크 {summary['replayed_chunks']}개")
+
+
+if __name__ == "__main__":
+    main()
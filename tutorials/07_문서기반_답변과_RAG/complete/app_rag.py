@@ -7,15 +7,18 @@ app_rag.py - PDF 기반 RAG 채팅 애플리케이션
     다중 세션 RAG 채팅 애플리케이션
 
 주요 기능:
-    1. PDF 파일 업로드 및 실시간 처리 진행 상황 표시
+    1. PDF 파일 업로드 및 백그라운드 처리 (배치 단위 진행 상황 표시)
     2. 여러 대화 세션 관리 (app2.py 기반)
     3. LangGraph 기반 RAG Agent 통합
     4. 문서 기반 질의응답
+    5. 모든 세션의 OpenAI 호출을 공정하게 나눠 보내는 전역 스케줄러 (llm_scheduler.py)
 
 사용 기술:
     - Streamlit: 웹 인터페이스
     - rag_processor.py: PDF 전처리
+    - ingest_worker.py: 백그라운드 인덱싱 작업 큐
     - rag_agent.py: LangGraph RAG Agent
+    - llm_scheduler.py: 요청/토큰 한도 + 세션 간 공정 대기열
 """
 
 import streamlit as st
@@ -27,15 +30,63 @@ import uuid
 
 from rag_processor import RAGProcessor
 from rag_agent import RAGAgent
+from ingest_worker import IngestionWorker, delete_index
+from llm_scheduler import INTERACTIVE, scheduler_context
 
 load_dotenv()
 
+# 대화 체크포인트/이력 저장 파일 (RAGAgent memory_path)
+MEMORY_PATH = "./rag_memory.sqlite"
+
 st.set_page_config(
     page_title="RAG Chat - 문서 기반 대화",
     page_icon="📚",
     layout="wide"
 )
 
+# ============================================================================
+# 백그라운드 인덱싱 작업 큐 (모든 세션이 공유)
+# ============================================================================
+
+@st.cache_resource
+def get_ingestion_worker():
+    """프로세스 전역 인덱싱 작업 큐를 반환합니다. (캐시됨)"""
+    return IngestionWorker(max_workers=2, pages_per_batch=10)
+
+@st.cache_resource
+def get_reranker():
+    """
+    재정렬 단계를 반환합니다. (캐시됨, ENABLE_RERANKER=1일 때만 사용)
+    
+    후보 30개를 가져와 로컬 Cross-Encoder(없으면 BM25)로 재정렬한 뒤 상위 5개만 사용합니다.
+    """
+    if os.getenv("ENABLE_RERANKER", "0") != "1":
+        return None
+    # 재정렬을 켰을 때만 import (sentence-transformers 로딩 비용 회피)
+    from reranker import Reranker
+    return Reranker(fetch_k=30, top_k=5)
+
+@st.cache_resource
+def get_processor():
+    """모든 세션이 공유하는 PDF 처리기를 반환합니다. (캐시됨, 세션별 상태 없음)"""
+    return RAGProcessor(api_key=os.getenv("OPENAI_API_KEY"))
+
+@st.cache_resource
+def get_rag_agent():
+    """
+    모든 세션이 공유하는 RAG Agent를 반환합니다. (캐시됨)
+    
+    세션마다 다른 문서 검색기는 invoke(retriever=...)로 넘기므로
+    LLM 클라이언트와 컴파일된 그래프는 프로세스당 한 번만 만듭니다.
+    대화 이력은 대화 ID별로 MEMORY_PATH에 저장되고 최근 메시지만 읽습니다.
+    """
+    return RAGAgent(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_iterations=3,
+        reranker=get_reranker(),
+        memory_path=MEMORY_PATH
+    )
+
 # ============================================================================
 # Session State 초기화
 # ============================================================================
@@ -53,15 +104,16 @@ if "conversations" not in st.session_state:
     }
     st.session_state.active_conversation_id = first_id
 
+# 스케줄러가 세션별 대기열을 구분하기 위한 ID
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
 # RAG 관련 상태
 if "vectorstore" not in st.session_state:
     st.session_state.vectorstore = None
 
-if "rag_agent" not in st.session_state:
-    st.session_state.rag_agent = None
-
-if "processor" not in st.session_state:
-    st.session_state.processor = None
+if "retriever" not in st.session_state:
+    st.session_state.retriever = None
 
 if "pdf_processed" not in st.session_state:
     st.session_state.pdf_processed = False
@@ -69,6 +121,9 @@ if "pdf_processed" not in st.session_state:
 if "current_pdf_name" not in st.session_state:
     st.session_state.current_pdf_name = None
 
+if "ingest_job_id" not in st.session_state:
+    st.session_state.ingest_job_id = None
+
 # ============================================================================
 # 헬퍼 함수들
 # ============================================================================
@@ -102,76 +157,115 @@ def delete_conversation(conv_id):
     """대화 세션 삭제"""
     if len(st.session_state.conversations) > 1:
         del st.session_state.conversations[conv_id]
+        get_rag_agent().forget(conv_id)
         
         if st.session_state.active_conversation_id == conv_id:
             st.session_state.active_conversation_id = list(
                 st.session_state.conversations.keys()
             )[0]
 
-def process_pdf(uploaded_file):
+def start_pdf_ingestion(uploaded_file):
     """
-    업로드된 PDF 파일을 처리합니다.
+    업로드된 PDF 파일을 백그라운드 작업으로 제출합니다.
+    
+    작업이 진행되는 동안에도 이미 임베딩된 청크로 검색할 수 있도록
+    부분 인덱스를 바라보는 검색기를 바로 생성합니다.
     
     Args:
         uploaded_file: Streamlit의 UploadedFile 객체
         
     Returns:
-        성공 여부 (bool)
+        작업 ID (str)
     """
-    # Processor 초기화
-    if st.session_state.processor is None:
-        st.session_state.processor = RAGProcessor(
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+    processor = get_processor()
     
-    # 진행 상황 표시
-    with st.status("PDF 처리 중...", expanded=True) as status:
-        # PDF 처리
-        vectorstore, progress = st.session_state.processor.process_pdf_file(
-            uploaded_file
-        )
-        
-        # 단계별 진행 상황 표시
-        if "load" in progress["steps"]:
-            st.write(progress["steps"]["load"]["message"])
-        
-        if "chunk" in progress["steps"]:
-            st.write(progress["steps"]["chunk"]["message"])
+    # 이전 업로드 인덱스는 더 이상 쓰지 않으므로 삭제 (메모리 컬렉션은 프로세스 전역에 남음)
+    delete_index(st.session_state.vectorstore)
+    
+    job = get_ingestion_worker().submit(processor, uploaded_file)
+    
+    # 벡터 스토어 및 Agent 설정 (부분 인덱스)
+    st.session_state.ingest_job_id = job.job_id
+    st.session_state.vectorstore = job.vectorstore
+    st.session_state.pdf_processed = False
+    st.session_state.current_pdf_name = uploaded_file.name
+    
+    # 이 세션의 문서 검색기 (Agent는 모든 세션이 공유)
+    st.session_state.retriever = processor.get_retriever(job.vectorstore, k=5)
+    
+    return job.job_id
+
+def get_active_job():
+    """현재 세션에서 진행 중인 인덱싱 작업을 반환합니다."""
+    return get_ingestion_worker().get_job(st.session_state.ingest_job_id)
+
+def has_searchable_index():
+    """부분 인덱스라도 검색 가능한 벡터가 있는지 확인합니다."""
+    if st.session_state.pdf_processed:
+        return True
+    if st.session_state.vectorstore is None:
+        return False
+    return st.session_state.vectorstore._collection.count() > 0
+
+def format_eta(seconds):
+    """예상 남은 시간을 사람이 읽기 쉬운 문자열로 변환"""
+    if seconds is None:
+        return "계산 중..."
+    seconds = int(seconds)
+    if seconds >= 60:
+        return f"약 {seconds // 60}분 {seconds % 60}초"
+    return f"약 {seconds}초"
+
+@st.fragment(run_every=1.0)
+def render_ingestion_progress():
+    """
+    백그라운드 인덱싱 진행 상황을 1초마다 갱신하여 표시합니다.
+    
+    fragment만 다시 실행되므로 채팅 영역은 그대로 유지됩니다.
+    작업이 끝나면 전체 앱을 다시 실행하여 상태를 반영합니다.
+    """
+    job = get_active_job()
+    if job is None:
+        return
+    
+    progress = job.snapshot()
+    info = progress["file_info"]
+    
+    if job.done:
+        st.session_state.ingest_job_id = None
         
-        if "embed" in progress["steps"]:
-            st.write(progress["steps"]["embed"]["message"])
+        # 결과를 세션에 반영했으므로 작업 목록에서 제거 (실패한 부분 인덱스는 삭제)
+        succeeded = progress["status"] == "완료"
+        get_ingestion_worker().release(job.job_id, delete=not succeeded)
         
-        # 처리 결과 확인
-        if progress["status"] == "완료":
-            status.update(
-                label="✅ PDF 처리 완료!",
-                state="complete"
-            )
-            
-            # 벡터 스토어 및 Agent 설정
-            st.session_state.vectorstore = vectorstore
+        if succeeded:
             st.session_state.pdf_processed = True
-            st.session_state.current_pdf_name = uploaded_file.name
-            
-            # RAG Agent 초기화
-            retriever = st.session_state.processor.get_retriever(vectorstore, k=5)
-            st.session_state.rag_agent = RAGAgent(
-                retriever=retriever,
-                api_key=os.getenv("OPENAI_API_KEY"),
-                max_iterations=3
-            )
-            
-            return True
         else:
-            status.update(
-                label="❌ PDF 처리 실패",
-                state="error"
-            )
-            
+            st.session_state.vectorstore = None
+            st.session_state.retriever = None
+            st.session_state.current_pdf_name = None
             if "error" in progress["steps"]:
-                st.error(progress["steps"]["error"]["message"])
-            
-            return False
+                st.session_state.ingest_error = progress["steps"]["error"]["message"]
+            else:
+                st.session_state.ingest_error = "❌ PDF 처리 실패"
+        
+        st.rerun()
+    
+    total_pages = info["total_pages"]
+    ratio = info["pages"] / total_pages if total_pages else 0.0
+    
+    st.progress(
+        min(ratio, 1.0),
+        text=f"⏳ {progress['current_step']} ({info['pages']}/{total_pages or '?'} 페이지)"
+    )
+    st.caption(
+        f"청크 임베딩: {info['chunks_embedded']}개 | "
+        f"중복 제거: {info.get('duplicates_removed', 0)}개 | "
+        f"배치: {progress['batches']}개 | "
+        f"남은 시간: {format_eta(progress['eta_seconds'])}"
+    )
+    if info["chunks_embedded"] > 0:
+        st.caption("💡 인덱싱 중에도 지금까지 처리된 내용으로 질문할 수 있습니다.")
 
 # ============================================================================
 # 현재 활성 대화
@@ -213,16 +307,26 @@ with st.container():
             file_size_mb = uploaded_file.size / (1024 * 1024)
             st.caption(f"📎 {uploaded_file.name} ({file_size_mb:.2f} MB)")
             
-            # 처리 버튼
-            if st.button("🚀 문서 처리 시작", type="primary"):
-                success = process_pdf(uploaded_file)
-                
-                if success:
-                    st.success("문서 처리가 완료되었습니다! 이제 대화를 시작하세요.")
-                    st.rerun()
+            # 처리 버튼 (진행 중인 작업이 있으면 비활성화)
+            if st.button(
+                "🚀 문서 처리 시작",
+                type="primary",
+                disabled=get_active_job() is not None
+            ):
+                start_pdf_ingestion(uploaded_file)
+                st.rerun()
+        
+        if get_active_job() is not None:
+            render_ingestion_progress()
+        
+        if st.session_state.get("ingest_error"):
+            st.error(st.session_state.pop("ingest_error"))
     
     with col_status:
-        if st.session_state.pdf_processed:
+        if get_active_job() is not None:
+            st.info("⏳ 문서 처리 중")
+            st.caption(f"📄 {st.session_state.current_pdf_name}")
+        elif st.session_state.pdf_processed:
             st.success("✅ 문서 준비 완료")
             st.info(f"📄 {st.session_state.current_pdf_name}")
             
@@ -309,9 +413,12 @@ for message in current_conv["messages"]:
 
 # 새 메시지 입력
 if prompt := st.chat_input("문서에 대해 질문하세요..."):
-    # PDF가 처리되지 않은 경우 경고
-    if not st.session_state.pdf_processed:
-        st.warning("⚠️ 먼저 PDF 문서를 업로드하고 처리해주세요.")
+    # 검색 가능한 문서가 없는 경우 경고 (처리 중이라도 일부 청크가 있으면 진행)
+    if not has_searchable_index():
+        if get_active_job() is not None:
+            st.warning("⏳ 아직 임베딩된 내용이 없습니다. 잠시 후 다시 질문해주세요.")
+        else:
+            st.warning("⚠️ 먼저 PDF 문서를 업로드하고 처리해주세요.")
         st.stop()
     
     # 사용자 메시지 추가
@@ -327,20 +434,18 @@ if prompt := st.chat_input("문서에 대해 질문하세요..."):
         
         # RAG Agent 실행
         with st.spinner("문서를 검색하고 답변을 생성하는 중..."):
-            # 대화 이력 전달 (현재 대화만)
-            chat_history = [
-                msg for msg in current_conv["messages"][:-1]  # 방금 추가한 메시지 제외
-                if isinstance(msg, (HumanMessage, AIMessage))
-            ]
-            
-            # Agent 호출
-            result = st.session_state.rag_agent.invoke(
-                question=prompt,
-                chat_history=chat_history
-            )
+            # Agent 호출 (대화 이력은 Agent가 대화 ID로 저장소에서 최근 메시지만 읽음,
+            # LLM/임베딩 호출은 이 세션의 대기열에서 백그라운드 인덱싱보다 먼저 차례를 받음)
+            with scheduler_context(st.session_state.session_id, INTERACTIVE):
+                result = get_rag_agent().invoke(
+                    question=prompt,
+                    retriever=st.session_state.retriever,
+                    conversation_id=current_conv["id"]
+                )
             
             answer = result["answer"]
             iterations = result["iterations"]
+            rerank_ms = result.get("rerank_ms", 0.0)
         
         # 답변 표시
         message_placeholder.markdown(answer)
@@ -348,6 +453,10 @@ if prompt := st.chat_input("문서에 대해 질문하세요..."):
         # 검색 정보 표시 (접을 수 있는 영역)
         with st.expander("🔍 검색 정보"):
             st.caption(f"반복 횟수: {iterations}")
+            if rerank_ms:
+                st.caption(f"재정렬 시간: {rerank_ms:.1f}ms")
+            if not st.session_state.pdf_processed:
+                st.caption("⏳ 인덱싱 진행 중 - 부분 인덱스로 생성된 답변입니다.")
             if result["search_results"]:
                 st.text_area(
                     "검색된 문서",
@@ -365,7 +474,7 @@ if prompt := st.chat_input("문서에 대해 질문하세요..."):
 # ============================================================================
 # 하단 안내
 # ============================================================================
-if not st.session_state.pdf_processed:
+if not st.session_state.pdf_processed and get_active_job() is None:
     st.info("""
     ### 📖 사용 방법
     
@@ -377,5 +486,6 @@ if not st.session_state.pdf_processed:
     - 여러 대화를 동시에 관리할 수 있습니다
     - 각 대화는 독립적인 히스토리를 유지합니다
     - LangGraph 기반 RAG Agent가 문서를 지능적으로 검색합니다
+    - 큰 PDF는 백그라운드에서 처리되며, 처리 중에도 질문할 수 있습니다
     """)
 
@@ -0,0 +1,119 @@
+"""
+batch_runner.py - 여러 질문을 동시에 처리하는 배치 실행기
+=======================================================
+
+목적:
+    평가, FAQ 사전 계산, 회귀 확인처럼 수백 개의 질문을 오프라인으로 처리할 때
+    Agent.invoke를 한 개씩 순서대로 부르지 않고 동시에 실행합니다.
+    끝난 순서대로 결과를 내보내고, 결과를 JSONL 체크포인트에 기록해
+    중간에 실패하거나 중단돼도 남은 질문만 다시 실행할 수 있습니다.
+
+주요 기능:
+    1. 최대 동시 실행 수 제한 (max_concurrency)
+    2. 끝난 순서대로 결과 스트리밍 (질문별 지연 시간 포함)
+    3. 체크포인트: 성공한 질문은 기록해 두고 재실행 시 건너뜀 (실패한 질문만 다시 실행)
+       (Agent가 오류를 답변 문구로 바꿔 반환해도 결과의 "error"가 있으면 실패로 기록)
+
+사용:
+    for item in agent.batch(questions, max_concurrency=8, checkpoint_path="run.jsonl"):
+        print(item["index"], item["ok"], item["latency_s"])
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# 기본 동시 실행 수
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+def load_checkpoint(path: Optional[str]) -> Dict[int, dict]:
+    """
+    체크포인트 파일에서 성공한 질문의 결과를 읽습니다.
+
+    Returns:
+        {질문 번호: 기록} (파일이 없으면 빈 딕셔너리, 같은 번호는 마지막 기록 사용)
+    """
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 중단되며 잘린 마지막 줄
+            if record.get("ok"):
+                done[record["index"]] = record
+            else:
+                done.pop(record.get("index"), None)
+    return done
+
+
+def pending_items(questions: List[str], checkpoint_path: Optional[str] = None) -> List[Tuple[int, str]]:
+    """
+    아직 성공하지 못한 (질문 번호, 질문) 목록
+
+    체크포인트에 같은 번호가 있어도 질문 내용이 다르면 다시 실행합니다.
+    """
+    done = load_checkpoint(checkpoint_path)
+    return [
+        (index, question)
+        for index, question in enumerate(questions)
+        if done.get(index, {}).get("question") != question
+    ]
+
+
+def run_batch(
+    fn: Callable[[int, str], dict],
+    items: List[Tuple[int, str]],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    checkpoint_path: Optional[str] = None
+) -> Iterator[dict]:
+    """
+    fn(질문 번호, 질문)을 동시에 실행하고 끝난 순서대로 결과를 내보냅니다.
+
+    한 질문이 실패해도 나머지는 계속 실행하며, 실패 기록은 ok=False로 남깁니다.
+    fn이 예외를 내거나, 반환한 결과의 "error"가 비어 있지 않으면 실패입니다.
+
+    Args:
+        fn: 질문 하나를 처리해 결과 딕셔너리를 반환하는 함수
+        items: (질문 번호, 질문) 목록
+        max_concurrency: 최대 동시 실행 수
+        checkpoint_path: 결과를 한 줄씩 추가할 JSONL 파일 (None이면 기록 안 함)
+
+    Yields:
+        {"index", "question", "ok", "result", "error" (실패 시), "latency_s", "finished_s"}
+        (finished_s: 배치 시작부터 이 질문이 끝날 때까지의 시간)
+    """
+    lock = threading.Lock()
+    batch_start = time.perf_counter()
+
+    def run_one(index: int, question: str) -> dict:
+        start = time.perf_counter()
+        record = {"index": index, "question": question}
+        try:
+            result = fn(index, question)
+            error = result.get("error") if isinstance(result, dict) else None
+            record.update(ok=not error, result=result)
+            if error:
+                record["error"] = error
+        except Exception as e:
+            record.update(ok=False, error=f"{type(e).__name__}: {e}")
+        end = time.perf_counter()
+        record.update(latency_s=end - start, finished_s=end - batch_start)
+
+        if checkpoint_path:
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            with lock, open(checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return record
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="batch") as executor:
+        futures = [executor.submit(run_one, index, question) for index, question in items]
+        for future in as_completed(futures):
+            yield future.result()
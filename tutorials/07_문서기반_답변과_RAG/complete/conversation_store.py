@@ -0,0 +1,118 @@
+"""
+conversation_store.py - 대화 이력 SQLite 저장소 (추가 전용)
+==========================================================
+
+목적:
+    매 질문마다 전체 대화 이력을 AgentState.messages로 넘기면
+    대화가 길어질수록 직렬화/복사 비용이 계속 늘어납니다.
+    대화 메시지는 SQLite에 한 줄씩 추가만 하고, Agent는 최근 몇 개만 읽어
+    턴당 비용이 대화 길이와 관계없이 일정하도록 합니다.
+
+주요 기능:
+    1. append: 이번 턴의 새 메시지만 추가 (기존 메시지는 다시 쓰지 않음)
+    2. recent: 최근 N개 메시지만 조회 (인덱스로 바로 찾음)
+    3. range: 오래된 메시지를 필요할 때만 구간으로 조회 (MessageWindow.older)
+    4. 모든 스레드 공유 (check_same_thread=False + 잠금, WAL 모드)
+"""
+
+import sqlite3
+import threading
+import time
+from typing import List
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+
+# 메시지 종류 ↔ 저장할 역할 이름
+_ROLES = {HumanMessage: "human", AIMessage: "ai", SystemMessage: "system"}
+_CLASSES = {role: cls for cls, role in _ROLES.items()}
+
+
+class ConversationStore:
+    """
+    대화 ID별 메시지를 순서대로 저장하는 SQLite 저장소
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite 파일 경로 (RAGAgent는 LangGraph 체크포인터와 같은 파일 사용)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversation_messages (
+                conversation_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (conversation_id, seq)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def append(self, conversation_id: str, messages: List[BaseMessage]):
+        """대화 끝에 새 메시지를 추가합니다."""
+        rows = [
+            (_ROLES.get(type(message), "human"), str(message.content))
+            for message in messages
+        ]
+        if not rows:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            (last,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) FROM conversation_messages WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()
+            self._conn.executemany(
+                "INSERT INTO conversation_messages VALUES (?, ?, ?, ?, ?)",
+                [
+                    (conversation_id, last + 1 + i, role, content, now)
+                    for i, (role, content) in enumerate(rows)
+                ]
+            )
+
+    def recent(self, conversation_id: str, limit: int) -> List[BaseMessage]:
+        """최근 limit개 메시지를 오래된 순서로 반환합니다."""
+        if limit <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM conversation_messages "
+                "WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?",
+                (conversation_id, limit)
+            ).fetchall()
+        return [_CLASSES.get(role, HumanMessage)(content=content) for role, content in reversed(rows)]
+
+    def range(self, conversation_id: str, start: int, end: int) -> List[BaseMessage]:
+        """start번째부터 end번째 전까지의 메시지 (0부터, 오래된 순서)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM conversation_messages "
+                "WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (conversation_id, start, end)
+            ).fetchall()
+        return [_CLASSES.get(role, HumanMessage)(content=content) for role, content in rows]
+
+    def count(self, conversation_id: str) -> int:
+        """저장된 메시지 수 (seq가 0부터 연속이므로 기본 키 인덱스로 바로 계산)"""
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM conversation_messages WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()
+        return count
+
+    def delete(self, conversation_id: str):
+        """대화의 모든 메시지를 삭제합니다."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM conversation_messages WHERE conversation_id = ?",
+                (conversation_id,)
+            )
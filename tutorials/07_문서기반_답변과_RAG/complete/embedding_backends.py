@@ -0,0 +1,257 @@
+"""
+embedding_backends.py - 임베딩 백엔드 선택 (OpenAI API / 로컬 CPU) 및 인덱스 매니페스트
+======================================================================================
+
+목적:
+    모든 질의가 임베딩 API 왕복을 거치고 인덱싱이 API 요청 한도에 묶이지 않도록
+    OpenAIEmbeddings 대신 로컬 CPU에서 도는 양자화 ONNX 임베딩 모델(FastEmbed)을
+    같은 Embeddings 인터페이스로 골라 쓸 수 있게 합니다.
+    벡터 스토어를 만들 때 사용한 백엔드/모델을 매니페스트 파일에 기록하고,
+    다른 모델로 만든 인덱스를 검색하려 하면 바로 오류를 냅니다.
+    (차원이 같아도 다른 모델의 벡터끼리는 비교할 수 없음)
+
+주요 기능:
+    1. make_embeddings: 백엔드 이름으로 Embeddings 생성
+       - openai: text-embedding-3-small (API, 프로세스 전역 스케줄러를 거침: llm_scheduler.py)
+       - fastembed: BAAI/bge-small-en-v1.5 (양자화 ONNX, CPU, 배치 크기/스레드 수 설정)
+    2. 매니페스트 기록/확인 (embedding_manifest.json, 벡터 스토어 폴더 안)
+       - 축소 차원 인덱스이면 Chroma에 저장한 차원도 기록 (two_stage_search.py)
+    3. python embedding_backends.py: 백엔드별 질의 지연 시간 / 문서 임베딩 처리량 비교
+
+설정 (환경 변수):
+    EMBEDDING_BACKEND=openai | fastembed
+    EMBEDDING_MODEL=모델 이름 (생략하면 백엔드 기본 모델)
+    EMBEDDING_THREADS=로컬 모델 ONNX Runtime 스레드 수 (생략하면 CPU 코어 수)
+    EMBEDDING_DIMENSIONS=새 인덱스를 만들 때 Chroma에 저장할 차원 (생략하면 원래 차원)
+
+설치 (로컬 백엔드 사용 시):
+    pip install fastembed
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+# 백엔드별 기본 모델
+DEFAULT_MODELS: Dict[str, str] = {
+    "openai": "text-embedding-3-small",
+    "fastembed": "BAAI/bge-small-en-v1.5",
+}
+DEFAULT_BACKEND = "openai"
+
+# 로컬 모델 문서 임베딩 배치 크기
+LOCAL_BATCH_SIZE = 64
+
+# 매니페스트가 없는 기존 인덱스는 이 설정으로 만들어진 것으로 간주
+LEGACY_BACKEND = ("openai", "text-embedding-3-small")
+
+MANIFEST_FILE = "embedding_manifest.json"
+
+
+class EmbeddingMismatchError(RuntimeError):
+    """인덱스를 만든 임베딩 모델과 현재 설정이 다른 경우"""
+
+
+def resolve_backend(backend: Optional[str] = None, model: Optional[str] = None) -> Dict[str, str]:
+    """
+    인자 → 환경 변수 → 기본값 순서로 백엔드와 모델을 정합니다.
+
+    Returns:
+        {"backend", "model"}
+
+    Raises:
+        ValueError: 알 수 없는 백엔드
+    """
+    backend = backend or os.getenv("EMBEDDING_BACKEND") or DEFAULT_BACKEND
+    if backend not in DEFAULT_MODELS:
+        raise ValueError(f"알 수 없는 임베딩 백엔드: {backend} (선택: {', '.join(DEFAULT_MODELS)})")
+    # EMBEDDING_MODEL은 EMBEDDING_BACKEND로 정한 백엔드에만 적용
+    if not model and backend == (os.getenv("EMBEDDING_BACKEND") or DEFAULT_BACKEND):
+        model = os.getenv("EMBEDDING_MODEL")
+    model = model or DEFAULT_MODELS[backend]
+    return {"backend": backend, "model": model}
+
+
+def backend_key(spec: Dict[str, str]) -> str:
+    """공유 캐시 키 / 표시용 이름 (예: "fastembed:BAAI/bge-small-en-v1.5")"""
+    return f"{spec['backend']}:{spec['model']}"
+
+
+def batches_queries(spec: Dict[str, str]) -> bool:
+    """
+    질의 임베딩을 embed_documents로 묶어 보내도 되는 백엔드인지 확인합니다.
+
+    OpenAI는 질의/문서 임베딩이 같지만, FastEmbed는 질의 전용 임베딩(query_embed)을 사용합니다.
+    """
+    return spec["backend"] == "openai"
+
+
+def make_embeddings(
+    backend: Optional[str] = None,
+    model: Optional[str] = None,
+    api_key: Optional[str] = None,
+    threads: Optional[int] = None,
+    batch_size: int = LOCAL_BATCH_SIZE
+) -> Embeddings:
+    """
+    설정한 백엔드의 Embeddings를 만듭니다.
+
+    Args:
+        backend: "openai" 또는 "fastembed" (None이면 EMBEDDING_BACKEND)
+        model: 모델 이름 (None이면 EMBEDDING_MODEL 또는 백엔드 기본 모델)
+        api_key: OpenAI API 키 (openai 백엔드)
+        threads: ONNX Runtime 스레드 수 (fastembed, None이면 EMBEDDING_THREADS 또는 코어 수)
+        batch_size: 로컬 모델이 한 번에 계산할 문서 수
+
+    Raises:
+        ImportError: fastembed 백엔드인데 패키지가 설치되지 않은 경우
+    """
+    spec = resolve_backend(backend, model)
+
+    if spec["backend"] == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        from llm_scheduler import ScheduledEmbeddings
+        # API 요청 수/토큰 한도를 채팅 세션, 인덱싱 작업과 함께 관리
+        return ScheduledEmbeddings(OpenAIEmbeddings(model=spec["model"], api_key=api_key))
+
+    try:
+        from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+        import fastembed  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "로컬 임베딩 백엔드를 사용하려면 fastembed를 설치하세요: pip install fastembed"
+        ) from e
+
+    if threads is None and os.getenv("EMBEDDING_THREADS"):
+        threads = int(os.getenv("EMBEDDING_THREADS"))
+    # 여러 세션이 한 프로세스를 공유하므로 스레드 수를 제한해 CPU 과다 할당을 막을 수 있음
+    return FastEmbedEmbeddings(model_name=spec["model"], threads=threads, batch_size=batch_size)
+
+
+# ============================================================================
+# 인덱스 매니페스트
+# ============================================================================
+
+def read_manifest(persist_directory: str) -> Optional[dict]:
+    """벡터 스토어 폴더의 매니페스트 (없으면 None)"""
+    path = Path(persist_directory) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(persist_directory: str, spec: Dict[str, str], dimensions: Optional[int] = None):
+    """
+    벡터 스토어를 만든 임베딩 백엔드/모델을 기록합니다.
+
+    Args:
+        dimensions: Chroma에 축소 차원 벡터를 저장했으면 그 차원 (None이면 원래 차원)
+    """
+    path = Path(persist_directory)
+    path.mkdir(parents=True, exist_ok=True)
+    manifest = {**spec, "created_at": datetime.now().isoformat(timespec="seconds")}
+    if dimensions:
+        manifest["dimensions"] = dimensions
+    with open(path / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def check_manifest(persist_directory: str, spec: Dict[str, str]):
+    """
+    기존 인덱스가 현재 임베딩 설정으로 만들어졌는지 확인합니다.
+
+    매니페스트가 없는 인덱스는 이 기능 이전에 OpenAI 임베딩으로 만든 것으로 봅니다.
+
+    Raises:
+        EmbeddingMismatchError: 백엔드나 모델이 다른 경우
+    """
+    manifest = read_manifest(persist_directory)
+    built_with = (
+        (manifest["backend"], manifest["model"]) if manifest else LEGACY_BACKEND
+    )
+    if built_with != (spec["backend"], spec["model"]):
+        raise EmbeddingMismatchError(
+            f"{persist_directory}는 {built_with[0]}:{built_with[1]}로 만든 인덱스입니다. "
+            f"현재 설정({backend_key(spec)})으로 검색할 수 없으니 같은 설정을 사용하거나 "
+            f"인덱스를 다시 만드세요."
+        )
+
+
+def index_dimensions(persist_directory: str) -> Optional[int]:
+    """기존 인덱스의 축소 차원 (원래 차원 인덱스이거나 매니페스트가 없으면 None)"""
+    return (read_manifest(persist_directory) or {}).get("dimensions")
+
+
+def configured_dimensions() -> Optional[int]:
+    """새 인덱스에 사용할 축소 차원 (EMBEDDING_DIMENSIONS, 없거나 0이면 None)"""
+    return int(os.getenv("EMBEDDING_DIMENSIONS") or 0) or None
+
+
+# ============================================================================
+# 벤치마크
+# ============================================================================
+
+def _benchmark_backend(backend: str, texts: List[str], queries: List[str]) -> dict:
+    """질의 하나씩 임베딩할 때의 지연 시간과 문서 묶음 임베딩 처리량"""
+    start = time.perf_counter()
+    embeddings = make_embeddings(backend, api_key=os.getenv("OPENAI_API_KEY"))
+    embeddings.embed_query("warm-up")  # 모델 로딩 / 연결 수립 비용 제외
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    docs_s = time.perf_counter() - start
+
+    return {
+        "load_s": load_s,
+        "dimension": len(vectors[0]) if vectors else 0,
+        "query_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "query_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "docs_per_sec": len(texts) / docs_s if docs_s else 0.0
+    }
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="임베딩 백엔드 지연 시간 / 처리량 비교")
+    parser.add_argument("--backends", nargs="+", default=list(DEFAULT_MODELS), choices=list(DEFAULT_MODELS))
+    parser.add_argument("--texts", type=int, default=256, help="문서 임베딩 개수")
+    parser.add_argument("--queries", type=int, default=30, help="질의 임베딩 횟수")
+    args = parser.parse_args()
+
+    sample = ("Gradient descent updates the parameters in the direction of the negative gradient. "
+              "The learning rate controls the step size. ") * 4
+    texts = [f"{i}. {sample}" for i in range(args.texts)]
+    queries = [f"What is gradient descent? ({i})" for i in range(args.queries)]
+
+    for backend in args.backends:
+        try:
+            result = _benchmark_backend(backend, texts, queries)
+        except Exception as e:
+            print(f"⚠️ {backend}: 실행 실패 ({type(e).__name__}: {e})")
+            continue
+        print(f"{backend_key(resolve_backend(backend))} (차원 {result['dimension']}, 준비 {result['load_s']:.1f}s)")
+        print(f"   질의: p50 {result['query_p50_ms']:.1f}ms | p95 {result['query_p95_ms']:.1f}ms")
+        print(f"   문서: {result['docs_per_sec']:.1f} texts/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+ingest_worker.py - 백그라운드 PDF 인덱싱 작업 큐
+================================================
+
+목적:
+    PDF 로딩/청킹/임베딩 파이프라인을 Streamlit 스크립트 스레드가 아닌
+    백그라운드 스레드 풀에서 실행하여, 큰 PDF를 처리하는 동안에도
+    UI가 멈추지 않도록 합니다.
+
+주요 기능:
+    1. 작업 ID 기반 작업 제출 및 조회
+    2. 배치 단위 진행 상황 (페이지, 청크, 예상 남은 시간)
+    3. 인덱싱 중에도 부분 인덱스로 검색 가능
+    4. 인덱싱 임베딩 요청은 대화 응답보다 낮은 우선순위로 전역 스케줄러에 들어감 (llm_scheduler.py)
+    5. 끝난 작업 정리: 세션이 결과를 가져가면(release) 또는 FINISHED_JOB_TTL_SECONDS가 지나면
+       작업 목록에서 제거 (실패한 작업의 부분 인덱스는 컬렉션까지 삭제)
+
+사용 기술:
+    - ThreadPoolExecutor: 백그라운드 작업 실행
+    - threading.Lock: 진행 상황 스냅샷 보호
+    - RAGProcessor.process_pdf_file_in_batches: 배치 단위 파이프라인
+"""
+
+import copy
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Optional
+
+from langchain_community.vectorstores import Chroma
+
+from llm_scheduler import BACKGROUND, scheduler_context
+from rag_processor import RAGProcessor
+
+
+# 끝난 작업을 조회용으로 남겨 둘 시간 (초, 세션이 release하지 않은 경우)
+FINISHED_JOB_TTL_SECONDS = 600.0
+
+
+def delete_index(vectorstore: Optional[Chroma]):
+    """
+    업로드 인덱스의 컬렉션을 삭제합니다.
+
+    메모리 Chroma 컬렉션은 프로세스 전역 클라이언트에 남으므로, 참조를 버리는 것만으로는
+    메모리가 해제되지 않습니다. 더 이상 쓰지 않는 인덱스는 이 함수로 삭제합니다.
+    """
+    if vectorstore is None:
+        return
+    try:
+        vectorstore.delete_collection()
+    except Exception as e:
+        print(f"⚠️ 인덱스 삭제 실패: {str(e)}")
+
+
+class IngestionJob:
+    """
+    하나의 PDF 인덱싱 작업
+
+    진행 상황은 작업 스레드가 갱신하고 UI 스레드가 읽으므로
+    항상 락을 잡고 복사본(snapshot)으로 주고받습니다.
+    """
+
+    def __init__(self, job_id: str, file_name: str, vectorstore: Chroma):
+        """
+        Args:
+            job_id: 작업 ID
+            file_name: 업로드된 파일명
+            vectorstore: 청크가 추가되는 벡터 스토어 (부분 인덱스)
+        """
+        self.job_id = job_id
+        self.file_name = file_name
+        self.vectorstore = vectorstore
+        self.future: Optional[Future] = None
+        self.finished_at: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._progress = {
+            "status": "대기중",
+            "current_step": "대기중",
+            "steps": {},
+            "file_info": {
+                "name": file_name,
+                "pages": 0,
+                "total_pages": 0,
+                "chunks": 0,
+                "chunks_embedded": 0
+            },
+            "batches": 0,
+            "elapsed_seconds": 0.0,
+            "eta_seconds": None
+        }
+
+    def update(self, progress: dict):
+        """작업 스레드에서 호출: 진행 상황 갱신"""
+        with self._lock:
+            self._progress = copy.deepcopy(progress)
+
+    def snapshot(self) -> dict:
+        """UI 스레드에서 호출: 진행 상황 복사본 반환"""
+        with self._lock:
+            return copy.deepcopy(self._progress)
+
+    @property
+    def done(self) -> bool:
+        """작업이 끝났는지 여부 (성공/실패 모두 포함)"""
+        return self.future is not None and self.future.done()
+
+    @property
+    def succeeded(self) -> bool:
+        """작업이 끝났고 인덱싱에 성공했는지 여부"""
+        return self.done and self.snapshot()["status"] == "완료"
+
+
+class IngestionWorker:
+    """
+    프로세스 전역 PDF 인덱싱 작업 큐
+
+    Streamlit에서는 @st.cache_resource로 한 번만 생성하여
+    모든 세션이 같은 스레드 풀을 공유하도록 사용합니다.
+    작업은 벡터 스토어를 들고 있으므로, 끝난 작업은 release()나 TTL로 목록에서 제거합니다.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        pages_per_batch: int = 10,
+        finished_ttl_seconds: float = FINISHED_JOB_TTL_SECONDS
+    ):
+        """
+        Args:
+            max_workers: 동시에 처리할 최대 작업 수
+            pages_per_batch: 진행 상황을 갱신할 페이지 배치 크기
+            finished_ttl_seconds: 끝난 작업을 목록에 남겨 둘 시간 (초)
+        """
+        self.pages_per_batch = pages_per_batch
+        self.finished_ttl_seconds = finished_ttl_seconds
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="pdf-ingest"
+        )
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, processor: RAGProcessor, uploaded_file) -> IngestionJob:
+        """
+        PDF 인덱싱 작업을 제출합니다.
+
+        빈 벡터 스토어를 먼저 만들어 반환하므로, 호출 측은 작업이 끝나기 전에도
+        job.vectorstore로 검색기를 만들어 부분 인덱스에 질문할 수 있습니다.
+
+        Args:
+            processor: PDF 처리에 사용할 RAGProcessor
+            uploaded_file: Streamlit의 UploadedFile 객체
+
+        Returns:
+            제출된 작업 (job.job_id로 다시 조회 가능)
+        """
+        self._prune_finished()
+        job_id = str(uuid.uuid4())
+
+        # 업로드마다 별도의 컬렉션을 사용하여 문서가 섞이지 않도록 함
+        vectorstore = processor.create_empty_vectorstore(
+            collection_name=f"upload_{job_id.replace('-', '')}"
+        )
+        job = IngestionJob(job_id, uploaded_file.name, vectorstore)
+
+        with self._lock:
+            self._jobs[job_id] = job
+
+        job.future = self._executor.submit(self._run, processor, uploaded_file, job)
+        job.future.add_done_callback(lambda _: setattr(job, "finished_at", time.monotonic()))
+        return job
+
+    def _run(self, processor: RAGProcessor, uploaded_file, job: IngestionJob) -> dict:
+        """작업 스레드 본체: 임베딩 요청이 대화 응답을 밀어내지 않도록 백그라운드 우선순위로 실행"""
+        with scheduler_context(f"ingest:{job.job_id}", BACKGROUND):
+            return processor.process_pdf_file_in_batches(
+                uploaded_file,
+                job.vectorstore,
+                job.update,
+                self.pages_per_batch
+            )
+
+    def get_job(self, job_id: Optional[str]) -> Optional[IngestionJob]:
+        """
+        작업 ID로 작업을 조회합니다.
+
+        Args:
+            job_id: 작업 ID
+
+        Returns:
+            작업 객체 (없으면 None)
+        """
+        if job_id is None:
+            return None
+        self._prune_finished()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def release(self, job_id: str, delete: bool = False):
+        """
+        끝난 작업을 목록에서 제거합니다. (세션이 결과를 반영한 뒤 호출)
+
+        Args:
+            job_id: 작업 ID
+            delete: True이면 부분 인덱스 컬렉션도 삭제 (실패한 작업 등 세션이 쓰지 않는 경우)
+        """
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None and delete:
+            delete_index(job.vectorstore)
+
+    def _prune_finished(self):
+        """TTL이 지난 끝난 작업 제거 (가져가는 세션이 없던 실패 작업은 인덱스도 삭제)"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                job for job in self._jobs.values()
+                if job.finished_at is not None and now - job.finished_at > self.finished_ttl_seconds
+            ]
+            for job in expired:
+                del self._jobs[job.job_id]
+        for job in expired:
+            if not job.succeeded:
+                delete_index(job.vectorstore)
@@ -0,0 +1,201 @@
+"""
+message_window.py - AgentState용 최근 대화 창 (크기 제한 리듀서)
+===============================================================
+
+목적:
+    AgentState.messages를 Annotated[List[BaseMessage], operator.add]로 두면
+    노드가 상태를 갱신할 때마다 전체 대화 이력을 이어 붙인 새 리스트가 만들어지지만,
+    노드가 실제로 읽는 것은 최근 몇 개 메시지뿐입니다.
+    상태에는 최근 N개 메시지만 담은 MessageWindow를 두고,
+    그보다 오래된 메시지는 필요할 때만 원본(대화 리스트 또는 저장소)에서 읽습니다.
+
+주요 기능:
+    1. MessageWindow: 최근 N개 메시지 + 전체 메시지 수 + 오래된 메시지 지연 로더
+    2. window_reducer(N): 새 메시지 리스트는 창 뒤에 추가(최근 N개만 유지), MessageWindow는 교체
+       (빈 갱신은 복사 없이 그대로 반환 → 노드당 비용이 대화 길이와 무관)
+    3. python message_window.py: 1,000개 메시지 대화에서 operator.add와 노드당 비용 비교
+
+사용:
+    class AgentState(TypedDict):
+        messages: Annotated[MessageWindow, window_reducer(8)]
+
+    initial_state = {"messages": MessageWindow.from_history(chat_history, 8), ...}
+    history = state["messages"].last(4)
+"""
+
+import argparse
+import operator
+import pickle
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+
+# (시작 번호, 끝 번호) → 그 구간의 메시지 (전체 대화 기준 번호, 끝 번호 미포함)
+MessageLoader = Callable[[int, int], List[BaseMessage]]
+
+
+@dataclass
+class MessageWindow:
+    """
+    최근 메시지 창
+
+    recent에는 최근 메시지만, total에는 대화 전체 메시지 수가 들어 있습니다.
+    오래된 메시지 로더는 체크포인트에 직렬화되지 않도록 필드가 아닌 속성으로 둡니다.
+    (체크포인트에서 복원한 창은 from_loader로 로더를 다시 연결해야 older()가 동작)
+    """
+    recent: List[BaseMessage] = field(default_factory=list)
+    total: int = 0
+
+    @classmethod
+    def from_history(cls, history: Optional[Sequence[BaseMessage]], size: int) -> "MessageWindow":
+        """대화 리스트의 최근 size개로 창을 만듭니다. (리스트는 복사하지 않고 참조만 보관)"""
+        history = history or []
+        window = cls(list(history[-size:]) if size > 0 else [], len(history))
+        if len(history) > size:
+            window._loader = lambda start, end: list(history[start:end])
+        return window
+
+    @classmethod
+    def from_loader(cls, recent: List[BaseMessage], total: int, loader: MessageLoader) -> "MessageWindow":
+        """저장소에서 읽은 최근 메시지와 오래된 메시지 로더로 창을 만듭니다."""
+        window = cls(list(recent), total)
+        window._loader = loader
+        return window
+
+    def __getstate__(self) -> dict:
+        # 로더(원본 리스트/저장소 참조)는 직렬화하지 않음
+        state = dict(self.__dict__)
+        state.pop("_loader", None)
+        return state
+
+    def __len__(self) -> int:
+        return len(self.recent)
+
+    def last(self, n: int) -> List[BaseMessage]:
+        """최근 n개 메시지 (창 크기보다 크면 창 전체)"""
+        return self.recent[-n:] if n > 0 else []
+
+    def older(self, limit: Optional[int] = None) -> List[BaseMessage]:
+        """
+        창보다 오래된 메시지를 원본에서 읽습니다. (호출할 때만 비용 발생)
+
+        Args:
+            limit: 창 바로 앞에서부터 최대 몇 개 (None이면 전부)
+
+        Returns:
+            오래된 순서의 메시지 리스트
+        """
+        end = self.total - len(self.recent)
+        loader = getattr(self, "_loader", None)
+        if end <= 0 or loader is None:
+            return []
+        start = 0 if limit is None else max(0, end - limit)
+        return loader(start, end)
+
+    def extended(self, messages: Sequence[BaseMessage], size: int) -> "MessageWindow":
+        """새 메시지를 뒤에 붙이고 최근 size개만 남긴 창 (최대 size + 새 메시지 수만큼만 복사)"""
+        window = MessageWindow((self.recent + list(messages))[-size:], self.total + len(messages))
+        loader = getattr(self, "_loader", None)
+        if loader is not None:
+            window._loader = loader
+        return window
+
+
+def window_reducer(size: int) -> Callable:
+    """
+    LangGraph 상태 리듀서: 최근 size개 메시지만 유지
+
+    - MessageWindow 갱신: 교체 (invoke의 초기 상태)
+    - 메시지 리스트 갱신: 창 뒤에 추가
+    - 빈 갱신: 기존 창을 그대로 반환 (복사 없음)
+    """
+    def reduce(left: Optional[MessageWindow], right) -> MessageWindow:
+        if isinstance(right, MessageWindow):
+            return right
+        left = left if isinstance(left, MessageWindow) else MessageWindow.from_history(left, size)
+        if not right:
+            return left
+        return left.extended(right, size)
+
+    return reduce
+
+
+# ============================================================================
+# 벤치마크: 긴 대화에서 노드당 상태 갱신/읽기 비용
+# ============================================================================
+
+def _history(n: int) -> List[BaseMessage]:
+    return [
+        HumanMessage(content=f"질문 {i} " * 20) if i % 2 == 0 else AIMessage(content=f"답변 {i} " * 80)
+        for i in range(n)
+    ]
+
+
+def benchmark(messages: int, nodes: int, window: int, read: int, repeat: int) -> dict:
+    """
+    한 턴(nodes개 노드, 마지막 노드만 메시지 2개 추가)의 상태 처리 비용 비교
+
+    노드마다: 상태 갱신(리듀서) + 최근 read개 읽기 + 상태 직렬화
+    (직렬화 크기는 LangGraph 체크포인트 직렬화기 기준, 설치되어 있지 않으면 pickle)
+    """
+    try:
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+        serde = JsonPlusSerializer()
+        serialize = lambda value: serde.dumps_typed(value)[1]
+    except ImportError:
+        serialize = pickle.dumps
+
+    history = _history(messages)
+    new_turn = [HumanMessage(content="새 질문"), AIMessage(content="새 답변")]
+    reducer = window_reducer(window)
+    results = {}
+
+    for name, initial, reduce, recent in (
+        ("operator.add", lambda: list(history), operator.add, lambda value: value[-read:]),
+        ("window", lambda: MessageWindow.from_history(history, window), reducer, lambda value: value.last(read)),
+    ):
+        reduce_s = read_s = 0.0
+        state_bytes = 0
+        for _ in range(repeat):
+            value = initial()
+            for node in range(nodes):
+                update = new_turn if node == nodes - 1 else []
+                start = time.perf_counter()
+                value = reduce(value, update)
+                reduce_s += time.perf_counter() - start
+
+                start = time.perf_counter()
+                recent(value)
+                read_s += time.perf_counter() - start
+
+                state_bytes = len(serialize(value))
+        calls = repeat * nodes
+        results[name] = {
+            "reduce_us": reduce_s / calls * 1e6,
+            "read_us": read_s / calls * 1e6,
+            "state_kb": state_bytes / 1024
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="대화 이력 상태 표현 벤치마크")
+    parser.add_argument("--messages", type=int, default=1000, help="기존 대화 메시지 수")
+    parser.add_argument("--nodes", type=int, default=4, help="한 턴에 실행되는 노드 수")
+    parser.add_argument("--window", type=int, default=8, help="상태에 유지할 최근 메시지 수")
+    parser.add_argument("--read", type=int, default=4, help="노드가 읽는 최근 메시지 수")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    results = benchmark(args.messages, args.nodes, args.window, args.read, args.repeat)
+    print(f"대화 {args.messages}개 메시지, 턴당 노드 {args.nodes}개, 창 {args.window}개")
+    for name, stats in results.items():
+        print(f"{name:>13}: 노드당 갱신 {stats['reduce_us']:8.1f}µs | 읽기 {stats['read_us']:6.2f}µs | "
+              f"직렬화 {stats['state_kb']:8.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,35 +9,85 @@ rag_agent.py - LangGraph 기반 RAG Agent
 주요 기능:
     1. ReAct 패턴 (Thought-Action-Observation)
     2. 문서 검색 (VectorDB)
-    3. 검색 결과 평가
-    4. 대화 컨텍스트 유지
+    3. 검색 결과 평가 (JSON Schema 구조화 출력) 및 토큰 예산에 맞춘 컨텍스트 패킹
+    4. 대화 컨텍스트 유지: 대화 ID별 체크포인트(최근 대화 창) + 추가 전용 이력 저장소
     5. 재시도 메커니즘
+    6. 프롬프트 접두사 캐싱: 고정 지시문은 system 메시지, 질문/검색 결과는 마지막 user 메시지
+    7. 배치 처리: 여러 질문을 동시에 실행 (질의 임베딩은 한 번에 계산)
+    8. 세션 공유: 검색기를 호출마다 config로 받아 하나의 Agent를 모든 세션이 함께 사용
 
 사용 기술:
     - LangGraph: 상태 그래프
     - LangChain: LLM, 검색기
-    - SqliteSaver: 대화 메모리
+    - SqliteSaver: 대화 ID(thread_id)별 그래프 상태 체크포인트 (대화마다 최신 1개만 유지)
+    - ConversationStore: 대화 메시지 SQLite 저장소 (conversation_store.py)
 """
 
-import json
 from typing import TypedDict, Annotated, List, Optional
-import operator
+import sqlite3
+import time
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 
+from batch_runner import DEFAULT_MAX_CONCURRENCY, pending_items, run_batch
+from context_packer import ContextPacker, embed_queries, retrieve_with_scores
+from conversation_store import ConversationStore
+from message_window import MessageWindow, window_reducer
+from prompt_layout import PromptCacheStats, build_messages
+from reranker import Reranker
+from resilient_llm import ResilientChatModel
+from structured_output import RELEVANCE_SCHEMA, json_schema_format, parse_json_object
+
+
+# 검색 결과 평가 프롬프트에 넣을 참고 자료 토큰 수
+EVAL_CONTEXT_TOKENS = 400
+
+# 답변 프롬프트에 넣을 최근 대화 메시지 수
+ANSWER_HISTORY_MESSAGES = 6
+
+# 고정 프롬프트 (요청마다 글자 하나 바뀌지 않아야 접두사 캐시가 적중)
+EVAL_SYSTEM_PROMPT = """검색 결과가 질문에 답할 수 있을 만큼 충분한지 평가해주세요.
+마지막 user 메시지에 질문과 검색 결과가 있습니다.
+
+다음 형식으로 JSON 응답:
+{
+    "is_relevant": true/false,
+    "reason": "평가 이유"
+}"""
+
+ANSWER_SYSTEM_PROMPT = """참고 문서를 바탕으로 사용자 질문에 답하는 AI 어시스턴트입니다.
+
+- 마지막 user 메시지의 참고 문서를 바탕으로 질문에 대해 정확하고 상세한 답변을 작성해주세요.
+- 문서에서 답을 찾을 수 없다면 솔직하게 말씀해주세요.
+- 이전 대화가 있으면 맥락을 이어서 답변해주세요."""
+
+
+def _checkpoint_serde():
+    """MessageWindow를 역직렬화 허용 목록에 등록한 체크포인트 직렬화기"""
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+    try:
+        return JsonPlusSerializer(allowed_msgpack_modules=[MessageWindow])
+    except TypeError:
+        # 허용 목록을 지원하지 않는 이전 버전은 모든 타입을 역직렬화
+        return JsonPlusSerializer()
+
 
 class AgentState(TypedDict):
     """
     Agent의 상태를 정의하는 TypedDict
     """
-    messages: Annotated[List[BaseMessage], operator.add]  # 대화 이력
+    messages: Annotated[MessageWindow, window_reducer(ANSWER_HISTORY_MESSAGES)]  # 최근 대화
     question: str  # 현재 질문
-    search_results: str  # 검색 결과
+    search_results: str  # 검색 결과 (답변용, 모델별 토큰 예산)
+    eval_context: str  # 검색 결과 요약 (평가용, 작은 토큰 예산)
+    rerank_ms: float  # 재정렬 지연 시간 (재정렬을 사용하지 않으면 0)
     is_relevant: bool  # 검색 결과가 관련 있는지
     iteration: int  # 현재 반복 횟수
     final_answer: str  # 최종 답변
+    query_embedding: Optional[List[float]]  # 배치 처리에서 미리 계산한 질의 임베딩
+    error: str  # 실패한 단계와 오류 (비어 있으면 정상 답변, 배치 재실행 기준)
 
 
 class RAGAgent:
@@ -48,38 +98,70 @@ class RAGAgent:
     1. Thought: 검색 필요성 판단
     2. Action: 문서 검색 수행
     3. Observation: 결과 평가 및 답변 생성
+    
+    요청별 데이터는 AgentState로, 세션별 검색기는 config["configurable"]["retriever"]로
+    전달되므로 하나의 인스턴스를 여러 세션/스레드가 동시에 사용할 수 있습니다.
     """
     
     def __init__(
         self, 
-        retriever, 
-        api_key: str,
+        retriever=None, 
+        api_key: Optional[str] = None,
         model: str = "gpt-4.1-mini-2025-04-14",
-        max_iterations: int = 3
+        max_iterations: int = 3,
+        reranker: Optional[Reranker] = None,
+        memory_path: Optional[str] = None
     ):
         """
         Args:
-            retriever: 벡터 스토어 검색기
+            retriever: 기본 검색기 (None이면 invoke/batch에서 retriever를 넘겨야 함)
             api_key: OpenAI API 키
             model: 사용할 LLM 모델
             max_iterations: 최대 재시도 횟수
+            reranker: 재정렬 단계 (None이면 검색 결과를 그대로 사용)
+            memory_path: 대화 체크포인트/이력을 저장할 SQLite 파일
+                (None이면 저장하지 않고 호출마다 chat_history를 받음)
         """
         self.retriever = retriever
+        self.model = model
         self.max_iterations = max_iterations
+        self.reranker = reranker
         
-        # LLM 초기화
-        self.llm = ChatOpenAI(
+        # LLM 초기화 (일시적 오류 재시도, 느린 응답 헤징, 서킷 브레이커 + 저렴한 모델 대체)
+        self.llm = ResilientChatModel(
             model=model,
             temperature=0.3,
             api_key=api_key
         )
         
-        # Agent 그래프 생성
-        self.agent = self._build_graph()
+        # 검색 결과를 토큰 예산에 맞게 묶는 패커
+        self.context_packer = ContextPacker(model)
+        
+        # 프롬프트 접두사 캐시 적중 통계
+        self.prompt_cache = PromptCacheStats()
+        
+        # 대화 저장소: 그래프 상태(최근 대화 창)는 대화 ID별로 체크포인트하고,
+        # 전체 메시지는 추가만 하는 이력 저장소에 보관 (오래된 메시지가 필요할 때만 읽음)
+        self.history_store = None
+        self.checkpointer = None
+        if memory_path:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+            self.history_store = ConversationStore(memory_path)
+            self.checkpointer = SqliteSaver(
+                sqlite3.connect(memory_path, check_same_thread=False),
+                serde=_checkpoint_serde()
+            )
+        
+        # Agent 그래프 생성 (대화 ID 없는 호출(배치 등)은 체크포인트 없이 실행)
+        self.agent = self._build_graph(self.checkpointer)
+        self._stateless_agent = self._build_graph() if self.checkpointer else self.agent
     
-    def _build_graph(self):
+    def _build_graph(self, checkpointer=None):
         """
         LangGraph 상태 그래프를 구성합니다.
+        
+        Args:
+            checkpointer: 대화 ID(thread_id)별 상태 저장소 (None이면 저장하지 않음)
         """
         workflow = StateGraph(AgentState)
         
@@ -98,29 +180,14 @@ class RAGAgent:
             {"continue": "thought", "end": END}
         )
         
-        # 메모리 없이 컴파일 (각 대화는 독립적)
-        return workflow.compile()
+        return workflow.compile(checkpointer=checkpointer)
     
-    def _format_history(self, messages: List[BaseMessage]) -> str:
-        """
-        대화 히스토리를 문자열로 포맷합니다.
-        
-        Args:
-            messages: 메시지 리스트
-            
-        Returns:
-            포맷된 히스토리 문자열
-        """
-        if not messages:
-            return ""
-        
-        history = "\n이전 대화:\n"
-        for msg in messages[-6:]:  # 최근 6개만
-            role = "사용자" if isinstance(msg, HumanMessage) else "AI"
-            content = msg.content[:200] if len(msg.content) > 200 else msg.content
-            history += f"{role}: {content}\n"
-        
-        return history
+    def _invoke_llm(self, messages: List[BaseMessage], **kwargs):
+        """LLM을 호출하고 프롬프트 캐시 사용량을 기록합니다."""
+        start = time.perf_counter()
+        response = self.llm.invoke(messages, **kwargs)
+        self.prompt_cache.record(response, time.perf_counter() - start, self.model)
+        return response
     
     def _thought_node(self, state: AgentState) -> dict:
         """
@@ -143,12 +210,20 @@ class RAGAgent:
         
         return {"iteration": iteration + 1}
     
-    def _action_node(self, state: AgentState) -> dict:
+    def _resolve_retriever(self, retriever=None):
+        """호출에 넘긴 검색기, 없으면 생성 시 지정한 기본 검색기"""
+        retriever = retriever if retriever is not None else self.retriever
+        if retriever is None:
+            raise ValueError("검색기가 없습니다. invoke(retriever=...)로 전달하세요.")
+        return retriever
+    
+    def _action_node(self, state: AgentState, config: RunnableConfig) -> dict:
         """
         Action 노드: 문서 검색을 수행합니다.
         
         Args:
             state: 현재 Agent 상태
+            config: 실행 설정 (configurable.retriever: 이번 호출의 검색기)
             
         Returns:
             업데이트할 상태 딕셔너리
@@ -156,22 +231,47 @@ class RAGAgent:
         question = state["question"]
         
         try:
-            # 벡터 스토어에서 관련 문서 검색
-            docs = self.retriever.invoke(question)
+            retriever = self._resolve_retriever(
+                (config.get("configurable") or {}).get("retriever")
+            )
+            
+            # 벡터 스토어에서 관련 문서 검색 (관련도 점수 포함)
+            # 재정렬을 사용하면 후보를 넉넉히 가져온 뒤 상위 문서만 남김
+            rerank_ms = 0.0
+            if self.reranker is not None:
+                scored_docs = self.reranker.retrieve(
+                    retriever, question, embedding=state.get("query_embedding")
+                )
+                rerank_ms = self.reranker.last_stats.get("latency_ms", 0.0)
+            else:
+                scored_docs = retrieve_with_scores(
+                    retriever, question, embedding=state.get("query_embedding")
+                )
             
-            # 검색 결과를 하나의 문자열로 결합
-            if docs:
-                results = "\n\n".join([
-                    f"[문서 {i+1}]\n{doc.page_content}" 
-                    for i, doc in enumerate(docs)
-                ])
+            # 검색 결과를 토큰 예산에 맞춰 하나의 문자열로 결합
+            if scored_docs:
+                results = self.context_packer.pack(scored_docs)
+                eval_context = self.context_packer.pack(
+                    scored_docs, max_tokens=EVAL_CONTEXT_TOKENS
+                )
             else:
                 results = "관련 문서를 찾을 수 없습니다."
+                eval_context = results
             
-            return {"search_results": results}
+            return {
+                "search_results": results,
+                "eval_context": eval_context,
+                "rerank_ms": state.get("rerank_ms", 0.0) + rerank_ms,
+                "error": ""
+            }
             
         except Exception as e:
-            return {"search_results": f"검색 중 오류 발생: {str(e)}"}
+            error = f"검색 중 오류 발생: {str(e)}"
+            return {
+                "search_results": error,
+                "eval_context": error,
+                "error": f"action: {type(e).__name__}: {e}"
+            }
     
     def _observation_node(self, state: AgentState) -> dict:
         """
@@ -185,30 +285,25 @@ class RAGAgent:
         """
         question = state["question"]
         results = state["search_results"]
+        eval_context = state.get("eval_context") or results
         iteration = state.get("iteration", 0)
-        messages = state.get("messages", [])
+        messages = state["messages"]
         
         # 1단계: 검색 결과 평가
-        eval_prompt = f"""검색 결과가 질문에 답할 수 있을 만큼 충분한지 평가해주세요.
-
-질문: {question}
-
-검색 결과:
-{results[:1000]}...
-
-다음 형식으로 JSON 응답:
-{{
-    "is_relevant": true/false,
-    "reason": "평가 이유"
-}}
-"""
+        eval_messages = build_messages(
+            EVAL_SYSTEM_PROMPT, [("질문", question), ("검색 결과", eval_context)]
+        )
         
         try:
-            eval_response = self.llm.invoke([SystemMessage(content=eval_prompt)])
-            eval_result = json.loads(eval_response.content)
-            is_relevant = eval_result.get("is_relevant", False)
-        except:
-            # JSON 파싱 실패 시 기본값
+            # 스키마로 출력 형식을 제한하고, 코드 블록/설명 문장이 섞여도 JSON 부분만 해석
+            eval_response = self._invoke_llm(
+                eval_messages,
+                response_format=json_schema_format("relevance", RELEVANCE_SCHEMA)
+            )
+            eval_result = parse_json_object(eval_response.content)
+            is_relevant = bool(eval_result.get("is_relevant", False))
+        except Exception:
+            # 평가 실패 시 재검색 없이 현재 결과로 답변
             is_relevant = True
         
         # 2단계: 검색 결과가 부족하고 재시도 가능한 경우
@@ -216,30 +311,29 @@ class RAGAgent:
             return {"is_relevant": False}
         
         # 3단계: 최종 답변 생성
-        history = self._format_history(messages)
-        
-        answer_prompt = f"""{history}
-
-질문: {question}
-
-참고 문서:
-{results}
-
-위 문서를 바탕으로 질문에 대해 정확하고 상세한 답변을 작성해주세요.
-문서에서 답을 찾을 수 없다면 솔직하게 말씀해주세요."""
+        # [고정 지시문] → [최근 대화] → [참고 문서 + 질문] 순서 (앞부분일수록 요청 간 공통)
+        answer_messages = build_messages(
+            ANSWER_SYSTEM_PROMPT,
+            [("참고 문서", results), ("질문", question)],
+            messages.last(ANSWER_HISTORY_MESSAGES)
+        )
 
         try:
-            response = self.llm.invoke([SystemMessage(content=answer_prompt)])
-            answer = response.content
+            response = self._invoke_llm(answer_messages)
         except Exception as e:
-            answer = f"답변 생성 중 오류가 발생했습니다: {str(e)}"
+            return {
+                "is_relevant": True,
+                "final_answer": f"답변 생성 중 오류가 발생했습니다: {str(e)}",
+                "error": f"observation: {type(e).__name__}: {e}"
+            }
         
+        # 이번 질문/답변을 대화 창에 추가 (체크포인트에 최근 메시지만 남음)
         return {
             "is_relevant": True,
-            "final_answer": answer,
+            "final_answer": response.content,
             "messages": [
                 HumanMessage(content=question),
-                AIMessage(content=answer)
+                AIMessage(content=response.content)
             ]
         }
     
@@ -261,13 +355,28 @@ class RAGAgent:
         else:
             return "continue"
     
-    def invoke(self, question: str, chat_history: Optional[List[BaseMessage]] = None) -> dict:
+    def invoke(
+        self,
+        question: str,
+        chat_history: Optional[List[BaseMessage]] = None,
+        query_embedding: Optional[List[float]] = None,
+        retriever=None,
+        conversation_id: Optional[str] = None
+    ) -> dict:
         """
         질문에 대한 답변을 생성합니다.
         
+        conversation_id가 있고 memory_path로 만든 Agent이면 대화 ID를 thread_id로
+        체크포인트에서 최근 대화 창(ANSWER_HISTORY_MESSAGES개)을 이어 받고,
+        이력 저장소에는 이번 질문/답변 두 메시지만 추가합니다.
+        (chat_history는 무시, 턴당 비용이 대화 길이와 관계없이 일정)
+        
         Args:
             question: 사용자 질문
-            chat_history: 이전 대화 이력 (선택사항)
+            chat_history: 이전 대화 이력 (저장소를 쓰지 않을 때, 최근 메시지만 사용)
+            query_embedding: 미리 계산한 질의 임베딩 (batch()에서 사용)
+            retriever: 이번 호출에 사용할 검색기 (None이면 기본 검색기, 세션별 문서 검색용)
+            conversation_id: 대화 ID (체크포인트 thread_id 및 이력 저장소 키)
             
         Returns:
             결과 딕셔너리
@@ -275,30 +384,138 @@ class RAGAgent:
                 "question": 질문,
                 "answer": 답변,
                 "search_results": 검색 결과,
-                "iterations": 반복 횟수
+                "iterations": 반복 횟수,
+                "rerank_ms": 재정렬 지연 시간 합계 (ms),
+                "error": 검색/답변 단계의 오류 (정상 답변이면 빈 문자열)
             }
         """
+        config = {"configurable": {"retriever": self._resolve_retriever(retriever)}}
+        stateful = bool(conversation_id) and self.checkpointer is not None
+        if stateful:
+            config["configurable"]["thread_id"] = conversation_id
+            store = self.history_store
+            
+            def load_older(start: int, end: int) -> List[BaseMessage]:
+                return store.range(conversation_id, start, end)
+            
+            # 이전 턴의 체크포인트에서 최근 대화 창을 이어 받음
+            # (로더는 저장되지 않으므로 다시 연결, 체크포인트가 없으면 저장소에서 최근 메시지를 읽음)
+            window = self.agent.get_state(config).values.get("messages")
+            if isinstance(window, MessageWindow):
+                history = MessageWindow.from_loader(window.recent, window.total, load_older)
+            else:
+                history = MessageWindow.from_loader(
+                    store.recent(conversation_id, ANSWER_HISTORY_MESSAGES),
+                    store.count(conversation_id),
+                    load_older
+                )
+        else:
+            history = MessageWindow.from_history(chat_history, ANSWER_HISTORY_MESSAGES)
+        
         # 초기 상태 설정
         initial_state = {
-            "messages": chat_history or [],
+            "messages": history,
             "question": question,
             "search_results": "",
+            "eval_context": "",
+            "rerank_ms": 0.0,
             "is_relevant": False,
             "iteration": 0,
-            "final_answer": ""
+            "final_answer": "",
+            "query_embedding": query_embedding,
+            "error": ""
         }
         
-        # Agent 실행
-        result = self.agent.invoke(initial_state)
+        # Agent 실행 (검색기는 상태가 아닌 실행 설정으로 전달)
+        agent = self.agent if stateful else self._stateless_agent
+        result = agent.invoke(initial_state, config=config)
+        answer = result.get("final_answer", "답변을 생성할 수 없습니다.")
+        
+        if stateful:
+            self._prune_checkpoints(conversation_id)
+            # 실패한 턴은 체크포인트 대화 창에도 추가되지 않으므로 저장소에도 남기지 않음
+            if not result.get("error"):
+                self.history_store.append(
+                    conversation_id, [HumanMessage(content=question), AIMessage(content=answer)]
+                )
         
         return {
             "question": question,
-            "answer": result.get("final_answer", "답변을 생성할 수 없습니다."),
+            "answer": answer,
             "search_results": result.get("search_results", ""),
-            "iterations": result.get("iteration", 0)
+            "iterations": result.get("iteration", 0),
+            "rerank_ms": result.get("rerank_ms", 0.0),
+            "error": result.get("error", "")
         }
     
-    def stream(self, question: str, chat_history: Optional[List[BaseMessage]] = None):
+    def _prune_checkpoints(self, conversation_id: str):
+        """
+        대화의 최신 체크포인트만 남기고 이전 체크포인트/중간 기록을 삭제합니다.
+        
+        다음 턴은 최신 상태만 이어 받으므로, 노드마다 쌓이는 체크포인트를
+        지워 대화가 길어져도 파일 크기가 대화 수에만 비례하게 합니다.
+        """
+        latest = self.checkpointer.get_tuple({"configurable": {"thread_id": conversation_id}})
+        if latest is None:
+            return
+        checkpoint_id = latest.config["configurable"]["checkpoint_id"]
+        with self.checkpointer.cursor() as cur:
+            cur.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id != ?",
+                (conversation_id, checkpoint_id)
+            )
+            cur.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_id != ?",
+                (conversation_id, checkpoint_id)
+            )
+    
+    def forget(self, conversation_id: str):
+        """저장된 대화 체크포인트와 이력을 삭제합니다."""
+        if self.checkpointer is not None:
+            self.checkpointer.delete_thread(conversation_id)
+        if self.history_store is not None:
+            self.history_store.delete(conversation_id)
+    
+    def batch(
+        self,
+        questions: List[str],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        checkpoint_path: Optional[str] = None,
+        retriever=None
+    ):
+        """
+        여러 질문을 동시에 처리하고 끝난 순서대로 결과를 내보냅니다.
+        
+        질의 임베딩은 한 번의 임베딩 호출로 미리 계산하고, 각 질문은
+        대화 이력 없이 독립적으로 처리합니다. 검색/답변 단계가 실패한 질문은
+        ok=False로 기록되어 다시 실행하면 재시도됩니다.
+        
+        Args:
+            questions: 질문 리스트
+            max_concurrency: 동시에 실행할 최대 질문 수
+            checkpoint_path: 결과를 기록할 JSONL 파일 (다시 실행하면 성공한 질문은 건너뜀)
+            retriever: 사용할 검색기 (None이면 기본 검색기)
+        
+        Yields:
+            {"index", "question", "ok", "result" (invoke 결과), "error" (실패 시), "latency_s", "finished_s"}
+        """
+        retriever = self._resolve_retriever(retriever)
+        items = pending_items(questions, checkpoint_path)
+        vectors = embed_queries(retriever, [question for _, question in items])
+        embeddings = {index: vector for (index, _), vector in zip(items, vectors)}
+        
+        def answer(index: int, question: str) -> dict:
+            return self.invoke(question, query_embedding=embeddings[index], retriever=retriever)
+        
+        yield from run_batch(answer, items, max_concurrency, checkpoint_path)
+    
+    def stream(
+        self,
+        question: str,
+        chat_history: Optional[List[BaseMessage]] = None,
+        retriever=None,
+        conversation_id: Optional[str] = None
+    ):
         """
         스트리밍 방식으로 답변을 생성합니다.
         (현재는 invoke와 동일하게 동작, 향후 확장 가능)
@@ -306,11 +523,15 @@ class RAGAgent:
         Args:
             question: 사용자 질문
             chat_history: 이전 대화 이력
+            retriever: 이번 호출에 사용할 검색기
+            conversation_id: 대화 ID (저장소 사용 시)
             
         Yields:
             답변 청크
         """
-        result = self.invoke(question, chat_history)
+        result = self.invoke(
+            question, chat_history, retriever=retriever, conversation_id=conversation_id
+        )
         
         # 답변을 단어 단위로 나누어 반환 (스트리밍 효과)
         answer = result["answer"]
@@ -7,29 +7,48 @@ rag_processor.py - PDF 파일 전처리 및 벡터 스토어 관리
     벡터 스토어를 생성합니다.
 
 주요 기능:
-    1. PDF 파일 로딩
-    2. 텍스트 청킹 (Chunking)
-    3. 임베딩 생성 (Embedding)
-    4. 벡터 스토어 구축 (Chroma)
-    5. 진행 상황 추적
+    1. PDF 파일 로딩 (업로드 버퍼에서 직접 파싱, 큰 파일만 임시 파일 사용)
+    2. 텍스트 청킹 (Chunking, 토큰 기준 + 제목/코드/수식 인식)
+    3. 유사 중복 청크 제거 (SimHash)
+    4. 임베딩 생성 (Embedding, 검색 질의는 세션 간 묶음 처리: embedding_batcher.py)
+    5. 벡터 스토어 구축 (Chroma)
+    6. 진행 상황 추적 (배치 단위 진행률 / 예상 남은 시간)
 
 사용 기술:
-    - PyMuPDFLoader: PDF 문서 로딩
-    - RecursiveCharacterTextSplitter: 텍스트 분할
-    - OpenAIEmbeddings: 임베딩 생성
+    - PyMuPDFParser / PyMuPDFLoader: PDF 문서 로딩
+    - StructuredTokenSplitter: 토큰 기반 구조 인식 텍스트 분할 (text_chunker.py)
+    - NearDuplicateFilter: 유사 중복 청크 제거 (chunk_dedup.py)
+    - make_embeddings: 임베딩 생성 (OpenAI API 또는 로컬 CPU 모델, embedding_backends.py)
     - Chroma: 벡터 스토어
 """
 
 import os
+import time
+import shutil
 import tempfile
+from contextlib import closing
 from pathlib import Path
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional, List, Callable, Iterator
 
 from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
+from langchain_community.document_loaders.parsers import PyMuPDFParser
+from langchain_core.document_loaders import Blob
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from embedding_backends import (
+    backend_key, batches_queries, check_manifest, configured_dimensions, index_dimensions,
+    make_embeddings, read_manifest, resolve_backend, write_manifest
+)
+from embedding_batcher import shared_batching_embeddings
+from two_stage_search import truncated_embeddings
+from text_chunker import StructuredTokenSplitter
+from chunk_dedup import NearDuplicateFilter
+
+
+# 이 크기를 넘는 PDF는 메모리 대신 임시 파일을 거쳐 로딩합니다.
+MAX_IN_MEMORY_PDF_BYTES = 200 * 1024 * 1024  # 200MB
 
 
 class RAGProcessor:
@@ -44,17 +63,22 @@ class RAGProcessor:
             api_key: OpenAI API 키
         """
         self.api_key = api_key
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            api_key=api_key
+        # 임베딩 백엔드 (EMBEDDING_BACKEND / EMBEDDING_MODEL, 기본값은 OpenAI API)
+        self.embedding_spec = resolve_backend()
+        # 모든 세션이 공유하는 임베딩 (검색 질의는 몇 ms씩 모아 한 번에 요청, 문서 임베딩은 그대로)
+        self.embeddings = shared_batching_embeddings(
+            f"{backend_key(self.embedding_spec)}:{api_key}",
+            lambda: make_embeddings(**self.embedding_spec, api_key=api_key),
+            batch_queries=batches_queries(self.embedding_spec)
         )
         
-        # 청킹 설정
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
+        # 업로드 버퍼를 직접 파싱하는 PDF 파서
+        self.pdf_parser = PyMuPDFParser()
+        
+        # 청킹 설정 (토큰 기준, 오버랩은 10% 수준으로 작게)
+        self.text_splitter = StructuredTokenSplitter(
+            chunk_tokens=400,
+            overlap_tokens=40
         )
     
     def load_pdf(self, file_path: str) -> Tuple[List[Document], str]:
@@ -78,6 +102,67 @@ class RAGProcessor:
         except Exception as e:
             return [], f"❌ PDF 로딩 실패: {str(e)}"
     
+    def lazy_load_uploaded_pdf(self, uploaded_file) -> Iterator[Document]:
+        """
+        업로드된 PDF를 페이지 단위로 하나씩 로드합니다.
+        
+        일반적인 크기의 파일은 업로드 메모리 버퍼를 PyMuPDF에 스트림으로
+        그대로 넘겨 디스크를 거치지 않습니다. MAX_IN_MEMORY_PDF_BYTES보다 큰
+        파일만 임시 파일로 복사한 뒤 로딩하며, 임시 파일은 예외가 발생해도
+        항상 삭제됩니다.
+        
+        Args:
+            uploaded_file: Streamlit의 UploadedFile 객체 (BytesIO 호환)
+            
+        Yields:
+            페이지 단위 Document
+        """
+        if uploaded_file.size <= MAX_IN_MEMORY_PDF_BYTES:
+            # getvalue()는 수정되지 않은 BytesIO의 내부 버퍼를 복사 없이 반환
+            blob = Blob.from_data(
+                uploaded_file.getvalue(),
+                path=uploaded_file.name,
+                mime_type="application/pdf"
+            )
+            yield from self.pdf_parser.lazy_parse(blob)
+            return
+        
+        # 아주 큰 파일: 버퍼를 조각 단위로 디스크에 복사 (한 번에 전체를 복사하지 않음)
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+                tmp_path = tmp_file.name
+                uploaded_file.seek(0)
+                shutil.copyfileobj(uploaded_file, tmp_file, length=1024 * 1024)
+            
+            for page in PyMuPDFLoader(tmp_path).lazy_load():
+                page.metadata["source"] = uploaded_file.name
+                yield page
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    
+    def load_uploaded_pdf(self, uploaded_file) -> Tuple[List[Document], str]:
+        """
+        업로드된 PDF 파일을 로드합니다. (임시 파일 없이 메모리에서 파싱)
+        
+        Args:
+            uploaded_file: Streamlit의 UploadedFile 객체
+            
+        Returns:
+            (문서 리스트, 상태 메시지)
+        """
+        try:
+            with closing(self.lazy_load_uploaded_pdf(uploaded_file)) as pages:
+                documents = list(pages)
+            
+            if not documents:
+                return [], "PDF 파일이 비어있습니다."
+            
+            return documents, f"✅ {len(documents)}개의 페이지를 로드했습니다."
+        except Exception as e:
+            return [], f"❌ PDF 로딩 실패: {str(e)}"
+    
     def split_documents(self, documents: List[Document]) -> Tuple[List[Document], str]:
         """
         문서를 청크로 분할합니다.
@@ -94,14 +179,71 @@ class RAGProcessor:
             if not chunks:
                 return [], "문서 분할 결과가 없습니다."
             
-            # 청크 통계
-            chunk_lengths = [len(chunk.page_content) for chunk in chunks]
-            avg_length = sum(chunk_lengths) / len(chunk_lengths)
+            # 청크 통계 (토큰 기준)
+            chunk_tokens = [
+                self.text_splitter.count_tokens(chunk.page_content) for chunk in chunks
+            ]
+            avg_tokens = sum(chunk_tokens) / len(chunk_tokens)
             
-            return chunks, f"✅ {len(chunks)}개의 청크로 분할했습니다. (평균 {int(avg_length)}자)"
+            return chunks, f"✅ {len(chunks)}개의 청크로 분할했습니다. (평균 {int(avg_tokens)}토큰)"
         except Exception as e:
             return [], f"❌ 청킹 실패: {str(e)}"
     
+    def deduplicate_chunks(
+        self,
+        chunks: List[Document],
+        dedup_filter: Optional[NearDuplicateFilter] = None
+    ) -> Tuple[List[Document], str]:
+        """
+        거의 같은 청크를 하나로 합칩니다. (반복 머리글, 라이선스 문구, 코드 예제 등)
+        
+        Args:
+            chunks: 청크 리스트
+            dedup_filter: 이전 배치와의 중복까지 제거할 때 공유할 필터 (None이면 새로 생성)
+            
+        Returns:
+            (중복이 제거된 청크 리스트, 상태 메시지)
+        """
+        if dedup_filter is None:
+            dedup_filter = self.create_dedup_filter()
+        
+        unique = dedup_filter.filter(chunks)
+        return unique, dedup_filter.summary()
+    
+    def create_dedup_filter(self) -> NearDuplicateFilter:
+        """문서 하나를 처리하는 동안 공유할 중복 제거 필터를 생성합니다."""
+        return NearDuplicateFilter(
+            max_distance=3,
+            count_tokens=self.text_splitter.count_tokens
+        )
+    
+    def store_embeddings(self, persist_directory: Optional[str]) -> Embeddings:
+        """
+        벡터 스토어에 사용할 임베딩을 반환합니다.
+        
+        저장 경로의 기존 인덱스가 현재 임베딩 설정으로 만들어졌는지 확인하고 매니페스트를 남깁니다.
+        EMBEDDING_DIMENSIONS가 설정되어 있으면(기존 인덱스는 매니페스트의 차원)
+        Chroma에는 축소 차원 벡터를 저장하고 검색 시 원래 벡터로 재채점합니다. (two_stage_search.py)
+        
+        Raises:
+            EmbeddingMismatchError: 다른 임베딩 모델로 만든 인덱스가 이미 있는 경우
+        """
+        if not persist_directory:
+            return truncated_embeddings(self.embeddings, configured_dimensions())
+        
+        path = Path(persist_directory)
+        existing = path.exists() and any(path.iterdir())
+        if existing:
+            check_manifest(persist_directory, self.embedding_spec)
+        if read_manifest(persist_directory) is None:
+            # 매니페스트 없는 기존 인덱스는 원래 차원으로 만든 것
+            write_manifest(
+                persist_directory,
+                self.embedding_spec,
+                None if existing else configured_dimensions()
+            )
+        return truncated_embeddings(self.embeddings, index_dimensions(persist_directory), persist_directory)
+    
     def create_vectorstore(
         self, 
         chunks: List[Document], 
@@ -124,7 +266,7 @@ class RAGProcessor:
             # 벡터 스토어 생성
             vectorstore = Chroma.from_documents(
                 documents=chunks,
-                embedding=self.embeddings,
+                embedding=self.store_embeddings(persist_directory),
                 persist_directory=persist_directory
             )
             
@@ -157,13 +299,15 @@ class RAGProcessor:
             "steps": {
                 "load": {"message": "메시지", "success": True/False},
                 "chunk": {"message": "메시지", "success": True/False},
+                "dedup": {"message": "메시지", "success": True/False},
                 "embed": {"message": "메시지", "success": True/False}
             },
             "file_info": {
                 "name": "파일명",
                 "size": 파일크기,
                 "pages": 페이지수,
-                "chunks": 청크수
+                "chunks": 청크수 (중복 제거 후),
+                "duplicates_removed": 제거된 중복 청크수
             }
         }
         """
@@ -175,20 +319,15 @@ class RAGProcessor:
                 "name": uploaded_file.name,
                 "size": uploaded_file.size,
                 "pages": 0,
-                "chunks": 0
+                "chunks": 0,
+                "duplicates_removed": 0
             }
         }
         
         try:
-            # 1단계: 임시 파일로 저장
-            progress["current_step"] = "파일 저장"
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_path = tmp_file.name
-            
-            # 2단계: PDF 로딩
+            # 1단계: PDF 로딩 (업로드 버퍼에서 직접 파싱)
             progress["current_step"] = "PDF 로딩"
-            documents, load_msg = self.load_pdf(tmp_path)
+            documents, load_msg = self.load_uploaded_pdf(uploaded_file)
             progress["steps"]["load"] = {
                 "message": load_msg,
                 "success": len(documents) > 0
@@ -197,23 +336,31 @@ class RAGProcessor:
             
             if not documents:
                 progress["status"] = "실패"
-                os.unlink(tmp_path)
                 return None, progress
             
-            # 3단계: 청킹
+            # 2단계: 청킹
             progress["current_step"] = "텍스트 청킹"
             chunks, chunk_msg = self.split_documents(documents)
             progress["steps"]["chunk"] = {
                 "message": chunk_msg,
                 "success": len(chunks) > 0
             }
-            progress["file_info"]["chunks"] = len(chunks)
             
             if not chunks:
                 progress["status"] = "실패"
-                os.unlink(tmp_path)
                 return None, progress
             
+            # 3단계: 유사 중복 청크 제거
+            progress["current_step"] = "중복 청크 제거"
+            unique_chunks, dedup_msg = self.deduplicate_chunks(chunks)
+            progress["steps"]["dedup"] = {
+                "message": dedup_msg,
+                "success": True
+            }
+            progress["file_info"]["chunks"] = len(unique_chunks)
+            progress["file_info"]["duplicates_removed"] = len(chunks) - len(unique_chunks)
+            chunks = unique_chunks
+            
             # 4단계: 벡터 스토어 생성
             progress["current_step"] = "임베딩 및 벡터 스토어 생성"
             vectorstore, embed_msg = self.create_vectorstore(chunks, persist_directory)
@@ -222,9 +369,6 @@ class RAGProcessor:
                 "success": vectorstore is not None
             }
             
-            # 임시 파일 삭제
-            os.unlink(tmp_path)
-            
             if vectorstore is None:
                 progress["status"] = "실패"
                 return None, progress
@@ -243,6 +387,186 @@ class RAGProcessor:
             }
             return None, progress
     
+    def create_empty_vectorstore(
+        self,
+        collection_name: str,
+        persist_directory: Optional[str] = None
+    ) -> Chroma:
+        """
+        비어 있는 벡터 스토어를 생성합니다.
+        
+        배치 단위 처리에서 먼저 빈 컬렉션을 만들어 두면, 
+        인덱싱이 진행되는 동안에도 이미 저장된 청크로 검색할 수 있습니다.
+        
+        Args:
+            collection_name: 컬렉션 이름 (업로드마다 고유해야 함)
+            persist_directory: 벡터 스토어 저장 경로 (None이면 메모리만)
+            
+        Returns:
+            빈 Chroma 벡터 스토어
+        """
+        return Chroma(
+            collection_name=collection_name,
+            embedding_function=self.store_embeddings(persist_directory),
+            persist_directory=persist_directory
+        )
+    
+    def process_pdf_file_in_batches(
+        self,
+        uploaded_file,
+        vectorstore: Chroma,
+        on_progress: Optional[Callable[[dict], None]] = None,
+        pages_per_batch: int = 10
+    ) -> dict:
+        """
+        업로드된 PDF를 페이지 배치 단위로 로딩/청킹/임베딩합니다.
+        
+        각 배치가 끝날 때마다 on_progress 콜백으로 진행 상황을 전달하므로
+        백그라운드 작업에서 페이지/청크 단위 진행률과 예상 남은 시간을 
+        표시할 수 있습니다. 임베딩된 청크는 곧바로 vectorstore에 추가됩니다.
+        
+        Args:
+            uploaded_file: Streamlit의 UploadedFile 객체
+            vectorstore: 청크를 추가할 벡터 스토어 (create_empty_vectorstore)
+            on_progress: 배치마다 호출되는 콜백 (진행 상황 딕셔너리 전달)
+            pages_per_batch: 한 번에 처리할 페이지 수
+            
+        Returns:
+            진행 상황 딕셔너리 (process_pdf_file과 동일한 구조 + 배치 정보)
+            
+        추가 필드:
+        {
+            "file_info": {..., "total_pages": 전체 페이지수, "chunks_embedded": 임베딩된 청크수,
+                          "duplicates_removed": 제거된 중복 청크수},
+            "batches": 완료된 배치 수,
+            "elapsed_seconds": 경과 시간,
+            "eta_seconds": 예상 남은 시간 (계산 불가 시 None)
+        }
+        """
+        progress = {
+            "status": "진행중",
+            "current_step": "",
+            "steps": {},
+            "file_info": {
+                "name": uploaded_file.name,
+                "size": uploaded_file.size,
+                "pages": 0,
+                "total_pages": 0,
+                "chunks": 0,
+                "chunks_embedded": 0,
+                "duplicates_removed": 0
+            },
+            "batches": 0,
+            "elapsed_seconds": 0.0,
+            "eta_seconds": None
+        }
+        
+        def report():
+            if on_progress is not None:
+                on_progress(progress)
+        
+        start_time = time.perf_counter()
+        
+        try:
+            # 페이지를 하나씩 읽으면서 배치 단위로 청킹 + 중복 제거 + 임베딩
+            batch: List[Document] = []
+            dedup_filter = self.create_dedup_filter()
+            
+            def flush(batch: List[Document]):
+                progress["current_step"] = "텍스트 청킹"
+                report()
+                chunks = self.text_splitter.split_documents(batch)
+                progress["file_info"]["chunks"] += len(chunks)
+                
+                # 이전 배치까지 포함하여 중복 제거
+                unique_chunks = dedup_filter.filter(chunks)
+                progress["file_info"]["duplicates_removed"] += len(chunks) - len(unique_chunks)
+                
+                if unique_chunks:
+                    progress["current_step"] = "임베딩 및 벡터 스토어 저장"
+                    report()
+                    vectorstore.add_documents(unique_chunks)
+                    progress["file_info"]["chunks_embedded"] += len(unique_chunks)
+                
+                # 이미 저장된 대표 청크에 병합된 출처 정보 반영
+                updated = dedup_filter.pop_updated_metadata()
+                if updated:
+                    vectorstore._collection.update(
+                        ids=list(updated.keys()),
+                        metadatas=list(updated.values())
+                    )
+                
+                progress["batches"] += 1
+                
+                # 경과 시간 기준으로 남은 페이지의 처리 시간 추정
+                elapsed = time.perf_counter() - start_time
+                pages_done = progress["file_info"]["pages"]
+                total_pages = progress["file_info"]["total_pages"]
+                progress["elapsed_seconds"] = elapsed
+                if pages_done and total_pages:
+                    progress["eta_seconds"] = elapsed / pages_done * (total_pages - pages_done)
+                report()
+            
+            progress["current_step"] = "PDF 로딩"
+            report()
+            with closing(self.lazy_load_uploaded_pdf(uploaded_file)) as pages:
+                for page in pages:
+                    if not progress["file_info"]["total_pages"]:
+                        progress["file_info"]["total_pages"] = page.metadata.get("total_pages", 0)
+                    
+                    batch.append(page)
+                    progress["file_info"]["pages"] += 1
+                    
+                    if len(batch) >= pages_per_batch:
+                        flush(batch)
+                        batch = []
+            
+            if batch:
+                flush(batch)
+            
+            pages = progress["file_info"]["pages"]
+            chunks = progress["file_info"]["chunks"]
+            progress["steps"]["load"] = {
+                "message": f"✅ {pages}개의 페이지를 로드했습니다." if pages else "PDF 파일이 비어있습니다.",
+                "success": pages > 0
+            }
+            progress["steps"]["chunk"] = {
+                "message": f"✅ {chunks}개의 청크로 분할했습니다." if chunks else "문서 분할 결과가 없습니다.",
+                "success": chunks > 0
+            }
+            progress["steps"]["dedup"] = {
+                "message": dedup_filter.summary(),
+                "success": True
+            }
+            
+            if not chunks:
+                progress["status"] = "실패"
+                report()
+                return progress
+            
+            count = vectorstore._collection.count()
+            progress["steps"]["embed"] = {
+                "message": f"✅ {count}개의 벡터를 생성하고 저장했습니다.",
+                "success": True
+            }
+            
+            # 완료
+            progress["status"] = "완료"
+            progress["current_step"] = "완료"
+            progress["eta_seconds"] = 0.0
+            report()
+            
+            return progress
+            
+        except Exception as e:
+            progress["status"] = "실패"
+            progress["steps"]["error"] = {
+                "message": f"❌ 처리 중 오류 발생: {str(e)}",
+                "success": False
+            }
+            report()
+            return progress
+    
     def get_retriever(self, vectorstore: Chroma, k: int = 5):
         """
         벡터 스토어로부터 검색기를 생성합니다.
@@ -0,0 +1,482 @@
+"""
+resilient_llm.py - 재시도 / 헤징 / 서킷 브레이커를 갖춘 LLM 호출
+================================================================
+
+목적:
+    부하가 몰릴 때 발생하는 일시적인 429/5xx 오류와 느린 응답(꼬리 지연)이
+    답변 오류나 긴 대기로 이어지지 않도록 LLM 호출을 감쌉니다.
+
+주요 기능:
+    1. 지터(jitter)를 넣은 지수 백오프 재시도 (429/5xx/연결 오류만)
+    2. 헤징: 응답이 지연 시간 백분위수(예: p95)를 넘기면 같은 요청을 한 번 더 보내고
+       먼저 도착한 응답 사용
+    3. 모델별 서킷 브레이커: 연속 실패 시 잠시 호출을 막고 더 저렴한 모델로 대체
+    4. 호출/재시도/헤징/대체 통계
+    5. 모든 요청(재시도/헤징 포함)은 프로세스 전역 스케줄러를 거침 (llm_scheduler.py)
+    6. 같은 요청이 이미 진행 중이면 새로 보내지 않고 합류 (single_flight.py)
+    7. 같은 설정의 ChatOpenAI 클라이언트(HTTP 연결 풀)는 프로세스 전역에서 공유하고,
+       warm_up()으로 요청 없이 미리 만들 수 있음 (warmup.py)
+
+사용:
+    llm = ResilientChatModel(model="gpt-4.1-mini-2025-04-14", api_key=...)
+    response = llm.invoke([HumanMessage(content="안녕하세요")])
+
+    # 로컬 가짜 서버로 테스트 (fake_openai_server.py)
+    llm = ResilientChatModel(model=..., api_key="sk-fake", base_url="http://127.0.0.1:8099/v1")
+"""
+
+import contextvars
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from langchain_openai import ChatOpenAI
+
+from llm_scheduler import ScheduledChatModel
+from single_flight import get_single_flight, request_fingerprint
+
+
+# 앱에서 선택할 수 있는 모델 (app1~app4의 MODELS와 동일)
+MODELS = {
+    "gpt-4.1-nano": "gpt-4.1-nano-2025-04-14",
+    "gpt-4.1-mini": "gpt-4.1-mini-2025-04-14",
+    "gpt-5-mini": "gpt-5-mini-2025-08-07",
+    "gpt-5-nano": "gpt-5-nano-2025-08-07"
+}
+
+# 서킷이 열렸을 때 대신 사용할 더 저렴한 모델
+CHEAPER_MODEL = {
+    MODELS["gpt-4.1-mini"]: MODELS["gpt-4.1-nano"],
+    MODELS["gpt-5-mini"]: MODELS["gpt-5-nano"],
+}
+
+# 재시도할 HTTP 상태 코드 (요청 시간 초과, 충돌, 속도 제한, 서버 오류)
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError", "Timeout", "TimeoutError"}
+
+
+# 설정별 프로세스 전역 ChatOpenAI 클라이언트 (워밍업에서 만든 클라이언트를 Agent가 재사용)
+_shared_clients: Dict[tuple, ScheduledChatModel] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def shared_chat_client(
+    model: str,
+    api_key: Optional[str],
+    temperature: float,
+    base_url: Optional[str],
+    timeout: float
+) -> ScheduledChatModel:
+    """
+    같은 설정의 ChatOpenAI를 프로세스 전역에서 한 번만 만듭니다.
+
+    ChatOpenAI는 생성할 때 HTTP 클라이언트(연결 풀, TLS 설정)를 만들므로
+    재사용하면 인스턴스마다 새 연결을 여는 비용이 사라집니다.
+    (내장 재시도는 끄고 ResilientChatModel에서 재시도)
+    """
+    key = (model, api_key, temperature, base_url, timeout)
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            _shared_clients[key] = ScheduledChatModel(ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                api_key=api_key,
+                base_url=base_url,
+                timeout=timeout,
+                max_retries=0,
+                stream_usage=True  # 스트리밍도 마지막 청크로 토큰 사용량(캐시 적중 포함) 수신
+            ))
+        return _shared_clients[key]
+
+
+class CircuitOpenError(RuntimeError):
+    """모든 모델의 서킷이 열려 있어 호출할 수 없을 때 발생"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """일시적인 오류(429/5xx/연결 오류)인지 확인합니다."""
+    if getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES:
+        return True
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """429 응답의 Retry-After 헤더 (초, 없으면 None)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    모델 하나에 대한 서킷 브레이커
+
+    - closed: 정상 호출
+    - open: 연속 failure_threshold회 실패 → reset_timeout초 동안 호출 차단
+    - half_open: 차단 시간이 지나면 시험 호출 하나만 허용, 성공하면 closed
+      (시험 호출은 어떻게 끝나든 success / failure / release_trial 중 하나로 정리해야 함)
+    - 실패로 세는 것은 일시적인 오류(is_retryable)뿐, 400 등 요청 자체의 오류는 세지 않음
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """지금 호출해도 되는지 확인합니다."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """
+        성공/실패를 기록하지 못하고 끝난 half_open 시험 호출을 정리합니다.
+        (호출 취소 등) 다시 open으로 돌리되, 다음 호출이 바로 시험 호출을 할 수 있게 합니다.
+        """
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self.opened_at = time.monotonic() - self.reset_timeout
+
+
+class ResilientChatModel:
+    """
+    ChatOpenAI를 감싸 재시도, 헤징, 서킷 브레이커, 저렴한 모델 대체를 적용합니다.
+
+    invoke / stream 인터페이스는 ChatOpenAI와 같으므로 Agent의 self.llm을
+    그대로 바꿔 끼울 수 있습니다. 브레이커와 지연 시간 기록은 인스턴스 안에서
+    모든 스레드가 공유합니다.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        api_key: Optional[str],
+        temperature: float = 0.3,
+        base_url: Optional[str] = None,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        request_timeout: float = 60.0,
+        hedge_percentile: Optional[float] = 95.0,
+        hedge_min_samples: int = 20,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        fallback: bool = True
+    ):
+        """
+        Args:
+            model: 기본 모델
+            api_key: OpenAI API 키
+            temperature: 샘플링 온도
+            base_url: API 주소 (가짜 서버 테스트용, None이면 기본값)
+            max_retries: 모델당 최대 재시도 횟수
+            base_delay / max_delay: 백오프 시작/최대 대기 시간 (초)
+            request_timeout: 요청 하나의 HTTP 시간 제한 (초)
+            hedge_percentile: 이 백분위수 지연 시간을 넘기면 헤징 요청 전송 (None이면 헤징 안 함)
+            hedge_min_samples: 헤징 기준을 계산하기 위한 최소 지연 시간 표본 수
+            failure_threshold: 서킷을 열 연속 실패 횟수
+            reset_timeout: 서킷을 닫기 전 대기 시간 (초)
+            fallback: 서킷이 열리거나 재시도가 모두 실패하면 더 저렴한 모델 사용
+        """
+        self.model = model
+        self.api_key = api_key
+        self.temperature = temperature
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.request_timeout = request_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.fallback = fallback
+
+        self._clients: Dict[str, ScheduledChatModel] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=200))
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+        self._single_flight = get_single_flight()
+
+        self.stats = {
+            "calls": 0,
+            "retries": 0,
+            "hedges_sent": 0,
+            "hedges_won": 0,
+            "fallbacks": 0,
+            "failures": 0
+        }
+
+    @property
+    def model_name(self) -> str:
+        return self.model
+
+    # ------------------------------------------------------------------
+    # 내부 도구
+    # ------------------------------------------------------------------
+
+    def _client(self, model: str) -> ScheduledChatModel:
+        """
+        모델별 ChatOpenAI (같은 설정이면 프로세스 전역 클라이언트 공유, shared_chat_client)
+
+        모든 세션이 공유하므로 세션 ID/우선순위는 호출할 때의 scheduler_context 값을 사용합니다.
+        """
+        with self._lock:
+            if model not in self._clients:
+                self._clients[model] = shared_chat_client(
+                    model, self.api_key, self.temperature, self.base_url, self.request_timeout
+                )
+                self._breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._clients[model]
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        self._client(model)
+        return self._breakers[model]
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _model_chain(self) -> List[str]:
+        """기본 모델 → 더 저렴한 모델 순서의 후보 목록"""
+        chain = [self.model]
+        while self.fallback and chain[-1] in CHEAPER_MODEL:
+            chain.append(CHEAPER_MODEL[chain[-1]])
+        return chain
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full jitter 백오프: 0 ~ min(max_delay, base_delay * 2^attempt) 사이 임의 대기"""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def hedge_threshold(self, model: str) -> Optional[float]:
+        """헤징 요청을 보낼 지연 시간 기준 (초, 표본이 부족하면 None)"""
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies[model])
+        if len(samples) < self.hedge_min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))
+        return samples[index]
+
+    def _timed_invoke(self, model: str, messages, kwargs):
+        start = time.perf_counter()
+        response = self._client(model).invoke(messages, **kwargs)
+        with self._lock:
+            self._latencies[model].append(time.perf_counter() - start)
+        return response
+
+    def _hedged_invoke(self, model: str, messages, kwargs):
+        """
+        요청을 보내고, 헤징 기준 시간 안에 응답이 없으면 한 번 더 보내
+        먼저 성공한 응답을 반환합니다.
+        """
+        threshold = self.hedge_threshold(model)
+        if threshold is None:
+            return self._timed_invoke(model, messages, kwargs)
+
+        def submit():
+            context = contextvars.copy_context()
+            return self._executor.submit(context.run, self._timed_invoke, model, messages, kwargs)
+
+        primary = submit()
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+
+        self._count("hedges_sent")
+        hedge = submit()
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedges_won")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def warm_up(self) -> List[str]:
+        """
+        대체 모델까지 모델 체인의 클라이언트를 미리 만듭니다. (API 요청은 보내지 않음)
+
+        Returns:
+            클라이언트를 만든 모델 목록
+        """
+        chain = self._model_chain()
+        for model in chain:
+            self._client(model)
+        return chain
+
+    def _fingerprint(self, mode: str, messages, kwargs: dict) -> str:
+        """중복 요청 판별용 지문 (대체 모델 체인까지 같아야 같은 요청)"""
+        params = {
+            "model": self.model,
+            "temperature": self.temperature,
+            "base_url": self.base_url,
+            "fallback": self.fallback
+        }
+        return request_fingerprint(mode, params, messages, kwargs)
+
+    # ------------------------------------------------------------------
+    # 공개 인터페이스
+    # ------------------------------------------------------------------
+
+    def invoke(self, messages, **kwargs):
+        """
+        재시도/헤징/대체를 적용하여 LLM을 호출합니다.
+
+        같은 요청(모델, 메시지, 인자)이 다른 세션에서 진행 중이면 그 응답을 함께 받습니다.
+        (헤징 요청은 합류 대상이 아니므로 중복 제거는 재시도/헤징 바깥에서 적용)
+
+        Raises:
+            CircuitOpenError: 모든 후보 모델의 서킷이 열려 있는 경우
+            Exception: 재시도할 수 없는 오류이거나 모든 후보가 실패한 경우의 마지막 오류
+        """
+        return self._single_flight.invoke(
+            self._fingerprint("invoke", messages, kwargs),
+            lambda: self._invoke(messages, **kwargs)
+        )
+
+    def stream(self, messages, **kwargs):
+        """
+        스트리밍 호출. 첫 청크를 받기 전의 오류만 재시도/대체합니다.
+        (이미 사용자에게 보여 준 토큰을 되돌릴 수 없으므로 중간 오류는 그대로 전달)
+
+        같은 요청이 진행 중이면 공유 버퍼에 합류하여 이미 나온 청크부터 이어서 받습니다.
+        """
+        return self._single_flight.stream(
+            self._fingerprint("stream", messages, kwargs),
+            lambda: self._stream(messages, **kwargs)
+        )
+
+    def _invoke(self, messages, **kwargs):
+        """invoke 본체 (중복 제거 그룹의 leader만 실행)"""
+        self._count("calls")
+        last_error: Optional[Exception] = None
+
+        for position, model in enumerate(self._model_chain()):
+            breaker = self._breaker(model)
+            if not breaker.allow():
+                continue
+            if position > 0:
+                self._count("fallbacks")
+                print(f"🔁 {self.model} 대신 {model} 사용")
+
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        response = self._hedged_invoke(model, messages, kwargs)
+                        breaker.record_success()
+                        return response
+                    except Exception as e:
+                        last_error = e
+                        if not is_retryable(e):
+                            # 400/컨텍스트 길이 초과 등 호출한 쪽 오류는 모델 장애가 아니므로
+                            # 브레이커에 기록하지 않음 (시험 호출은 finally에서 반납)
+                            self._count("failures")
+                            raise
+                        breaker.record_failure()
+                        if attempt == self.max_retries or not breaker.allow():
+                            break
+                        self._count("retries")
+                        time.sleep(self._backoff(attempt, e))
+            finally:
+                # 어떤 경로로 끝나든 half_open 시험 호출이 남지 않도록 정리
+                breaker.release_trial()
+
+        self._count("failures")
+        if last_error is None:
+            raise CircuitOpenError(f"{self.model}: 모든 모델의 서킷이 열려 있습니다.")
+        raise last_error
+
+    def _stream(self, messages, **kwargs):
+        """stream 본체 (중복 제거 그룹의 전용 스레드가 읽음)"""
+        self._count("calls")
+        last_error: Optional[Exception] = None
+
+        for position, model in enumerate(self._model_chain()):
+            breaker = self._breaker(model)
+            if not breaker.allow():
+                continue
+            if position > 0:
+                self._count("fallbacks")
+
+            try:
+                for attempt in range(self.max_retries + 1):
+                    started = False
+                    stream = self._client(model).stream(messages, **kwargs)
+                    try:
+                        for chunk in stream:
+                            started = True
+                            yield chunk
+                        breaker.record_success()
+                        return
+                    except Exception as e:
+                        last_error = e
+                        if not is_retryable(e):
+                            # 호출한 쪽 오류는 브레이커에 기록하지 않음 (시험 호출은 finally에서 반납)
+                            self._count("failures")
+                            raise
+                        breaker.record_failure()
+                        if started:
+                            self._count("failures")
+                            raise
+                        if attempt == self.max_retries or not breaker.allow():
+                            break
+                        self._count("retries")
+                        time.sleep(self._backoff(attempt, e))
+                    finally:
+                        # 호출한 쪽이 스트림을 일찍 닫으면 HTTP 응답도 바로 닫음
+                        stream.close()
+            finally:
+                # 중간 오류나 취소(GeneratorExit)로 끝나도 half_open 시험 호출이 남지 않도록 정리
+                breaker.release_trial()
+
+        self._count("failures")
+        if last_error is None:
+            raise CircuitOpenError(f"{self.model}: 모든 모델의 서킷이 열려 있습니다.")
+        raise last_error
+
+    def summary(self) -> dict:
+        """통계와 모델별 서킷 상태 / 헤징 기준"""
+        with self._lock:
+            models = list(self._breakers)
+        return {
+            **self.stats,
+            "circuits": {model: self._breakers[model].state for model in models},
+            "hedge_threshold_s": {model: self.hedge_threshold(model) for model in models}
+        }
@@ -0,0 +1,429 @@
+"""
+two_stage_search.py - 축소 차원 임베딩 + 2단계(거친 검색 → 정밀 재채점) 검색
+==========================================================================
+
+목적:
+    text-embedding-3-small은 1536차원 벡터를 만들지만, 앞쪽 차원만 잘라
+    다시 정규화해도(Matryoshka 방식) 대부분의 순위 정보가 남습니다.
+    Chroma에는 잘라낸 저차원 벡터(기본 256차원)만 넣어 인덱스를 작게 유지하고,
+    원래 차원 벡터는 디스크 파일(float16)에 따로 저장해 두었다가
+    후보 몇십 개를 다시 채점할 때만 읽습니다. (numpy memmap)
+
+검색 순서:
+    1. 질의를 원래 차원으로 임베딩 (임베딩 호출 1회)
+    2. 저차원 벡터로 Chroma에서 후보 k × 8개(최소 40개) 검색
+    3. 후보의 원래 차원 벡터를 디스크에서 읽어 정확한 코사인 유사도로 재채점 → 상위 k개
+
+주요 기능:
+    1. TruncatedEmbeddings: Chroma에 넣을 벡터를 자르고, 원래 벡터는 FullVectorStore에 기록
+       (Chroma.from_documents / add_documents / as_retriever를 그대로 사용)
+    2. two_stage_search: 위 검색 순서 (retrieve_with_scores / Reranker.retrieve가 자동 사용)
+    3. python two_stage_search.py: 기존 전체 차원 인덱스로 차원별 recall@k / 지연 시간 / 크기 평가
+
+설정:
+    EMBEDDING_DIMENSIONS=256 python setup_d2l.py  → 축소 차원 인덱스 구축
+    (사용한 차원은 embedding_manifest.json에 기록되어, 로드할 때 자동으로 2단계 검색 사용)
+"""
+
+import argparse
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+# Chroma에 저장할 벡터 차원
+COARSE_DIMENSIONS = 256
+
+# 재채점할 후보 수 = max(k × SHORTLIST_MULTIPLIER, MIN_SHORTLIST)
+SHORTLIST_MULTIPLIER = 8
+MIN_SHORTLIST = 40
+
+# 벡터 스토어 폴더 안의 원래 차원 벡터 저장 위치
+FULL_VECTORS_DIR = "full_vectors"
+VECTORS_FILE = "vectors.f16"
+KEYS_FILE = "keys.txt"
+DIMENSIONS_FILE = "dimensions.txt"
+
+
+def truncate_normalize(vectors, dimensions: int) -> np.ndarray:
+    """앞쪽 dimensions개 차원만 남기고 길이 1로 다시 정규화합니다. (Matryoshka 방식)"""
+    array = np.asarray(vectors, dtype=np.float32)[..., :dimensions]
+    norms = np.linalg.norm(array, axis=-1, keepdims=True)
+    return array / np.where(norms == 0, 1.0, norms)
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class FullVectorStore:
+    """
+    청크 텍스트 → 원래 차원 벡터 저장소 (추가 전용)
+
+    벡터는 float16으로 한 파일에 행 단위로 이어 쓰고, 키 파일에 "텍스트 해시 행 번호"를
+    한 줄씩 기록합니다. 읽을 때는 memmap으로 필요한 행만 디스크에서 가져옵니다.
+    같은 텍스트는 같은 벡터이므로 한 번만 저장합니다.
+    path가 None이면 메모리에만 보관합니다. (persist_directory 없이 만든 업로드 컬렉션)
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._memory: List[np.ndarray] = []
+        self._dimensions: Optional[int] = None
+        self._mmap: Optional[np.memmap] = None
+        self._stacked: Optional[np.ndarray] = None  # 메모리 저장소의 행렬 (추가 전까지 재사용)
+
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            dimensions_path = self.path / DIMENSIONS_FILE
+            if dimensions_path.exists():
+                self._dimensions = int(dimensions_path.read_text().strip())
+            keys_path = self.path / KEYS_FILE
+            if keys_path.exists():
+                with open(keys_path, encoding="utf-8") as f:
+                    for line in f:
+                        parts = line.split()
+                        if len(parts) == 2:  # 중단되며 잘린 마지막 줄은 무시
+                            self._rows.setdefault(parts[0], int(parts[1]))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """새 텍스트의 벡터만 추가합니다."""
+        with self._lock:
+            new_keys, new_vectors = [], []
+            seen = set()  # 이번 묶음 안의 중복 (대량 인덱싱에서 리스트 검색은 O(n²))
+            for text, vector in zip(texts, vectors):
+                key = _text_key(text)
+                if key in self._rows or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_vectors.append(vector)
+            if not new_keys:
+                return
+
+            array = np.asarray(new_vectors, dtype=np.float16)
+            if self.path is None:
+                start = len(self._memory)
+                self._memory.extend(array)
+                self._stacked = None  # 행이 늘었으므로 다음 읽기에서 다시 쌓음
+            else:
+                if self._dimensions is None:
+                    (self.path / DIMENSIONS_FILE).write_text(str(array.shape[1]))
+                # 벡터를 먼저 쓰고 키를 나중에 써서, 중단돼도 키가 없는 행만 남게 함
+                with open(self.path / VECTORS_FILE, "ab") as f:
+                    start = f.tell() // array[0].nbytes
+                    f.write(array.tobytes())
+                with open(self.path / KEYS_FILE, "a", encoding="utf-8") as f:
+                    f.write("".join(f"{key} {start + offset}\n" for offset, key in enumerate(new_keys)))
+                self._mmap = None  # 파일이 늘었으므로 다음 읽기에서 다시 매핑
+            self._dimensions = array.shape[1]
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = start + offset
+
+    def _matrix(self) -> Optional[np.ndarray]:
+        if self.path is None:
+            if self._stacked is None and self._memory:
+                self._stacked = np.stack(self._memory)
+            return self._stacked
+        if self._mmap is None:
+            vectors_path = self.path / VECTORS_FILE
+            if not vectors_path.exists() or not self._dimensions:
+                return None
+            rows = vectors_path.stat().st_size // (2 * self._dimensions)  # float16 = 2바이트
+            self._mmap = np.memmap(vectors_path, dtype=np.float16, mode="r", shape=(rows, self._dimensions))
+        return self._mmap
+
+    def get(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """텍스트별 원래 차원 벡터 (float32, 없으면 None)"""
+        with self._lock:
+            matrix = self._matrix()
+            rows = [self._rows.get(_text_key(text)) for text in texts]
+            if matrix is None:
+                return [None] * len(texts)
+            return [
+                np.asarray(matrix[row], dtype=np.float32) if row is not None and row < len(matrix) else None
+                for row in rows
+            ]
+
+    def nbytes(self) -> int:
+        """디스크(또는 메모리)에 저장된 벡터 크기 (바이트)"""
+        if self.path is None:
+            return sum(vector.nbytes for vector in self._memory)
+        vectors_path = self.path / VECTORS_FILE
+        return vectors_path.stat().st_size if vectors_path.exists() else 0
+
+
+class TruncatedEmbeddings(Embeddings):
+    """
+    Chroma의 embedding_function으로 쓰는 축소 차원 임베딩
+
+    문서 임베딩은 원래 차원으로 한 번만 계산해 FullVectorStore에 기록하고,
+    Chroma에는 잘라낸 벡터를 반환합니다. (임베딩 API 호출 수는 그대로)
+    """
+
+    def __init__(self, base: Embeddings, dimensions: int, full_vectors: FullVectorStore):
+        self.base = base
+        self.dimensions = dimensions
+        self.full_vectors = full_vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.base.embed_documents(texts)
+        self.full_vectors.add(texts, vectors)
+        return truncate_normalize(vectors, self.dimensions).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return truncate_normalize(self.base.embed_query(text), self.dimensions).tolist()
+
+
+def truncated_embeddings(
+    base: Embeddings,
+    dimensions: Optional[int],
+    persist_directory: Optional[str] = None
+) -> Embeddings:
+    """
+    dimensions가 있으면 TruncatedEmbeddings로 감싸고, 없으면 base를 그대로 반환합니다.
+
+    Args:
+        base: 원래 차원 임베딩
+        dimensions: Chroma에 저장할 차원 (None/0이면 축소하지 않음)
+        persist_directory: 벡터 스토어 경로 (원래 벡터를 그 안의 full_vectors/에 저장, None이면 메모리)
+    """
+    if not dimensions:
+        return base
+    path = str(Path(persist_directory) / FULL_VECTORS_DIR) if persist_directory else None
+    return TruncatedEmbeddings(base, int(dimensions), FullVectorStore(path))
+
+
+def is_two_stage(vectorstore) -> bool:
+    """벡터 스토어가 축소 차원 벡터로 만들어졌는지"""
+    return isinstance(getattr(vectorstore, "embeddings", None), TruncatedEmbeddings)
+
+
+def full_query_embeddings(vectorstore) -> Optional[Embeddings]:
+    """질의 임베딩에 사용할 원래 차원 임베딩 (embed_queries용)"""
+    embeddings = getattr(vectorstore, "embeddings", None)
+    return embeddings.base if isinstance(embeddings, TruncatedEmbeddings) else embeddings
+
+
+def _distance_space(vectorstore) -> str:
+    """Chroma 컬렉션의 거리 함수 (기본 l2)"""
+    return (getattr(vectorstore._collection, "metadata", None) or {}).get("hnsw:space", "l2")
+
+
+def _similarity_to_distance(similarity: float, space: str) -> float:
+    """
+    정규화된 벡터의 코사인 유사도 → Chroma 거리
+
+    재채점 점수도 질의 검색과 같은 관련도 점수(_select_relevance_score_fn)로 변환하기 위함
+    (l2는 제곱 거리 2 - 2cos, cosine/ip는 1 - cos)
+    """
+    return 2.0 - 2.0 * similarity if space == "l2" else 1.0 - similarity
+
+
+def two_stage_search(
+    vectorstore,
+    query: str,
+    k: int,
+    embedding: Optional[List[float]] = None,
+    shortlist: Optional[int] = None
+) -> List[Tuple[Document, float]]:
+    """
+    저차원 벡터로 후보를 고른 뒤 원래 차원 벡터로 재채점합니다.
+
+    Args:
+        vectorstore: TruncatedEmbeddings로 만든 Chroma 벡터 스토어
+        query: 검색 질의
+        k: 반환할 문서 수
+        embedding: 미리 계산한 원래 차원 질의 임베딩 (있으면 임베딩 호출 생략)
+        shortlist: 재채점할 후보 수 (None이면 k × 8, 최소 40)
+
+    Returns:
+        (문서, 관련도 점수) 리스트 (점수 내림차순)
+    """
+    embeddings: TruncatedEmbeddings = vectorstore.embeddings
+    query_vector = np.asarray(
+        embedding if embedding is not None else embeddings.base.embed_query(query),
+        dtype=np.float32
+    )
+    shortlist = shortlist or max(k * SHORTLIST_MULTIPLIER, MIN_SHORTLIST)
+
+    coarse = truncate_normalize(query_vector, embeddings.dimensions)
+    results = vectorstore.similarity_search_by_vector_with_relevance_scores(coarse.tolist(), k=shortlist)
+    if not results:
+        return []
+    candidates = [doc for doc, _ in results]
+    space = _distance_space(vectorstore)
+
+    full_vectors = embeddings.full_vectors.get([doc.page_content for doc in candidates])
+    full_query = query_vector / (np.linalg.norm(query_vector) or 1.0)
+    similarities = np.empty(len(candidates), dtype=np.float32)
+    for i, (vector, (_, distance)) in enumerate(zip(full_vectors, results)):
+        if vector is None:
+            # 원래 벡터가 없으면(예: 저장 중 중단) 저차원 유사도를 그대로 사용
+            similarities[i] = 1.0 - distance / 2 if space == "l2" else 1.0 - distance
+        else:
+            similarities[i] = vector @ full_query / (np.linalg.norm(vector) or 1.0)
+
+    order = np.argsort(-similarities)[:k]
+    relevance = vectorstore._select_relevance_score_fn()
+    return [
+        (candidates[i], relevance(float(_similarity_to_distance(similarities[i], space))))
+        for i in order
+    ]
+
+
+# ============================================================================
+# 평가: 기존 전체 차원 인덱스로 차원별 recall@k / 지연 시간 / 크기 비교
+# ============================================================================
+
+DEFAULT_EVAL_QUESTIONS = [
+    "What is gradient descent?",
+    "How does stochastic gradient descent differ from minibatch SGD?",
+    "What is the purpose of the learning rate?",
+    "Explain overfitting and how weight decay helps.",
+    "What is dropout?",
+    "How does backpropagation compute gradients?",
+    "What is the softmax function used for?",
+    "Explain cross-entropy loss.",
+    "What is a multilayer perceptron?",
+    "Why do we need activation functions like ReLU?",
+    "How is linear regression trained?",
+    "What is automatic differentiation?",
+    "What is the difference between training error and generalization error?",
+    "How do you initialize the parameters of a neural network?",
+    "What are tensors and how is broadcasting applied?",
+    "What is numerical stability and why do gradients vanish or explode?",
+    "How is data preprocessed with pandas?",
+    "What is a loss function?",
+    "Explain the chain rule in calculus.",
+    "What is the role of a validation set?",
+    "선형 회귀 모델은 어떻게 학습하나요?",
+    "드롭아웃은 왜 과적합을 줄이나요?",
+    "소프트맥스 회귀의 손실 함수는 무엇인가요?",
+    "역전파에서 계산 그래프는 어떤 역할을 하나요?",
+]
+
+
+def _exact_top_k(matrix: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = matrix @ query
+    top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def evaluate(
+    full_matrix: np.ndarray,
+    queries: np.ndarray,
+    dimensions: int,
+    k: int,
+    shortlist: int
+) -> dict:
+    """
+    전체 차원 정확 검색 결과를 정답으로 보고, 저차원만 / 2단계 검색의 recall@k를 계산합니다.
+
+    (전수 검색으로 비교하므로 Chroma HNSW의 근사 오차는 포함되지 않음)
+    """
+    full = full_matrix / np.linalg.norm(full_matrix, axis=1, keepdims=True)
+    coarse = truncate_normalize(full, dimensions)
+    disk_full = full.astype(np.float16).astype(np.float32)  # 디스크 저장 정밀도
+
+    coarse_hits = two_stage_hits = 0
+    full_time = coarse_time = rescore_time = 0.0
+    for query in queries:
+        query = query / np.linalg.norm(query)
+        start = time.perf_counter()
+        truth = set(_exact_top_k(full, query, k).tolist())
+        full_time += time.perf_counter() - start
+        query_coarse = truncate_normalize(query, dimensions)
+
+        start = time.perf_counter()
+        candidates = _exact_top_k(coarse, query_coarse, shortlist)
+        coarse_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        rescored = candidates[np.argsort(-(disk_full[candidates] @ query))][:k]
+        rescore_time += time.perf_counter() - start
+
+        coarse_hits += len(truth & set(candidates[:k].tolist()))
+        two_stage_hits += len(truth & set(rescored.tolist()))
+
+    total = len(queries) * k
+    return {
+        "dimensions": dimensions,
+        "coarse_recall": coarse_hits / total,
+        "two_stage_recall": two_stage_hits / total,
+        "full_ms": full_time / len(queries) * 1000,
+        "coarse_ms": coarse_time / len(queries) * 1000,
+        "rescore_ms": rescore_time / len(queries) * 1000,
+        "index_bytes_per_vector": dimensions * 4
+    }
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="축소 차원 2단계 검색 recall / 지연 시간 평가")
+    parser.add_argument("--chroma", default="./chroma_db_d2l", help="전체 차원으로 만든 Chroma 경로")
+    parser.add_argument("--questions", help="평가 질문 파일 (한 줄에 하나, 없으면 기본 질문)")
+    parser.add_argument("--dims", type=int, nargs="+", default=[64, 128, 256, 512])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--shortlist", type=int, default=None)
+    args = parser.parse_args()
+
+    from langchain_community.vectorstores import Chroma
+    from embedding_backends import make_embeddings, read_manifest, resolve_backend
+
+    manifest = read_manifest(args.chroma) or {}
+    if manifest.get("dimensions"):
+        print(f"❌ {args.chroma}는 이미 {manifest['dimensions']}차원으로 축소된 인덱스입니다. "
+              "전체 차원 인덱스로 평가하세요.")
+        return
+    spec = resolve_backend(manifest.get("backend"), manifest.get("model"))
+    embeddings = make_embeddings(**spec, api_key=os.getenv("OPENAI_API_KEY"))
+
+    vectorstore = Chroma(persist_directory=args.chroma, embedding_function=embeddings)
+    data = vectorstore._collection.get(include=["embeddings"])
+    full_matrix = np.asarray(data["embeddings"], dtype=np.float32)
+    if not len(full_matrix):
+        print(f"❌ {args.chroma}에 벡터가 없습니다.")
+        return
+
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = DEFAULT_EVAL_QUESTIONS
+    queries = np.asarray(embeddings.embed_documents(questions), dtype=np.float32)
+
+    full_dims = full_matrix.shape[1]
+    shortlist = args.shortlist or max(args.k * SHORTLIST_MULTIPLIER, MIN_SHORTLIST)
+    print(f"벡터 {len(full_matrix)}개 ({full_dims}차원), 질문 {len(questions)}개, "
+          f"k={args.k}, 재채점 후보 {shortlist}개")
+    print(f"전체 차원 인덱스: 벡터당 {full_dims * 4} bytes")
+
+    for dimensions in args.dims:
+        if dimensions >= full_dims:
+            continue
+        result = evaluate(full_matrix, queries, dimensions, args.k, shortlist)
+        print(f"{dimensions:>5}차원: 인덱스 벡터당 {result['index_bytes_per_vector']} bytes "
+              f"(+ 디스크 원본 {full_dims * 2} bytes) | "
+              f"recall@{args.k} 저차원만 {result['coarse_recall']:.3f} / "
+              f"2단계 {result['two_stage_recall']:.3f} | "
+              f"검색 {result['coarse_ms']:.2f}ms + 재채점 {result['rescore_ms']:.2f}ms "
+              f"(전체 차원 {result['full_ms']:.2f}ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,28 +12,40 @@ app_router.py - Router 기반 다중 경로 채팅 애플리케이션
     2. 웹 검색을 통한 최신 정보 제공
     3. 일반 대화 및 추론
     4. 라우팅 과정 시각화
+    5. 모든 세션의 OpenAI 호출을 공정하게 나눠 보내는 전역 스케줄러 (llm_scheduler.py)
+    6. 여러 세션의 동일한 LLM 요청은 한 번만 전송 (single_flight.py)
+    7. 웹검색 결과를 로컬 캐시에 저장하여 비슷한 질문은 검색 없이 답변 (web_cache.py)
 """
 
 import streamlit as st
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
 import os
 from datetime import datetime
 import uuid
 from pathlib import Path
 
-from rag_router_agent import RouterAgent
+# 무거운 모듈(langgraph, langchain_community 등)은 워밍업 스레드와
+# 실제로 필요한 시점에 import하여 첫 화면 표시를 늦추지 않음
+from warmup import start_background_warmup, get_d2l_vectorstore, get_web_cache
+from llm_scheduler import INTERACTIVE, get_scheduler, scheduler_context
+from single_flight import get_single_flight
 
 load_dotenv()
 
+CHROMA_PATH = "./chroma_db_d2l"
+WEB_CACHE_PATH = "./chroma_web_cache"  # 웹검색 결과 캐시 (web_cache.py)
+
 st.set_page_config(
     page_title="Router Agent Chat",
     page_icon="🧭",
     layout="wide"
 )
 
+# 프로세스당 한 번: 벡터 스토어/LLM 클라이언트/무거운 모듈을 백그라운드에서 미리 준비
+# (이후 세션은 이미 준비된 리소스를 바로 사용)
+start_background_warmup(CHROMA_PATH, os.getenv("OPENAI_API_KEY"))
+
 # ============================================================================
 # D2L 벡터 스토어 로드
 # ============================================================================
@@ -41,7 +53,7 @@ st.set_page_config(
 @st.cache_resource
 def load_d2l_vectorstore():
     """D2L 벡터 스토어를 로드합니다. (캐시됨)"""
-    chroma_path = "./chroma_db_d2l"
+    chroma_path = CHROMA_PATH
     
     if not Path(chroma_path).exists():
         st.error("""
@@ -55,20 +67,44 @@ def load_d2l_vectorstore():
         st.stop()
     
     try:
-        embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-        vectorstore = Chroma(
-            persist_directory=chroma_path,
-            embedding_function=embeddings
-        )
-        count = vectorstore._collection.count()
-        return vectorstore, count
+        # 워밍업 스레드가 이미 열었으면 같은 인스턴스를 바로 반환
+        return get_d2l_vectorstore(chroma_path, os.getenv("OPENAI_API_KEY"))
     except Exception as e:
         st.error(f"벡터 스토어 로드 실패: {str(e)}")
         st.stop()
 
+@st.cache_resource
+def get_reranker():
+    """
+    재정렬 단계를 반환합니다. (캐시됨, ENABLE_RERANKER=1일 때만 사용)
+    
+    후보 30개를 가져와 로컬 Cross-Encoder(없으면 BM25)로 재정렬한 뒤 상위 3개만 사용합니다.
+    """
+    if os.getenv("ENABLE_RERANKER", "0") != "1":
+        return None
+    # 재정렬을 켰을 때만 import (sentence-transformers 로딩 비용 회피)
+    from reranker import Reranker
+    return Reranker(fetch_k=30, top_k=3)
+
+@st.cache_resource
+def get_router_agent():
+    """
+    모든 세션이 공유하는 Router Agent를 반환합니다. (캐시됨)
+    
+    요청별 데이터는 AgentState로만 전달되므로 LLM 클라이언트, 웹검색 도구,
+    컴파일된 그래프를 프로세스당 한 번만 만들고 세션에는 대화 이력만 남깁니다.
+    """
+    from rag_router_agent import RouterAgent
+    
+    vectorstore, _ = load_d2l_vectorstore()
+    return RouterAgent(
+        d2l_retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
+        api_key=os.getenv("OPENAI_API_KEY"),
+        tavily_api_key=os.getenv("TAVILY_API_KEY"),
+        reranker=get_reranker(),
+        web_cache=get_web_cache(WEB_CACHE_PATH, os.getenv("OPENAI_API_KEY"))
+    )
+
 # ============================================================================
 # Session State 초기화
 # ============================================================================
@@ -81,6 +117,10 @@ if "vectorstore_loaded" not in st.session_state:
         st.session_state.vector_count = vector_count
         st.session_state.vectorstore_loaded = True
 
+# 스케줄러가 세션별 대기열을 구분하기 위한 ID
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
 # 대화 세션 관리
 if "conversations" not in st.session_state:
     first_id = str(uuid.uuid4())
@@ -94,16 +134,8 @@ if "conversations" not in st.session_state:
     }
     st.session_state.active_conversation_id = first_id
 
-# Router Agent 초기화
-if "router_agent" not in st.session_state:
-    retriever = st.session_state.vectorstore.as_retriever(
-        search_kwargs={"k": 3}
-    )
-    st.session_state.router_agent = RouterAgent(
-        d2l_retriever=retriever,
-        api_key=os.getenv("OPENAI_API_KEY"),
-        tavily_api_key=os.getenv("TAVILY_API_KEY")
-    )
+# Router Agent (프로세스 전역 공유, 첫 세션에서만 생성)
+router_agent = get_router_agent()
 
 # ============================================================================
 # 헬퍼 함수들
@@ -235,6 +267,40 @@ with st.sidebar:
     - 일반 대화/추론
     - LLM 직접 응답
     """)
+    
+    # 질의 임베딩 묶음 처리 통계 (모든 세션 합산)
+    embeddings = getattr(st.session_state.vectorstore, "embeddings", None)
+    if hasattr(embeddings, "summary"):
+        batching = embeddings.summary()
+        if batching["queries"]:
+            st.caption(
+                f"🧮 질의 임베딩 {batching['queries']}개 → 요청 {batching['upstream_calls']}회 "
+                f"(절약 {batching['calls_saved']}회, 평균 대기 {batching['avg_wait_ms']:.1f}ms)"
+            )
+    
+    # OpenAI 호출 스케줄러 (모든 세션 합산)
+    scheduler = get_scheduler("chat").summary()
+    if scheduler["granted"]:
+        st.caption(
+            f"🚦 LLM 대기열 {scheduler['queue_depth']['interactive']}개 "
+            f"(백그라운드 {scheduler['queue_depth']['background']}개) | 실행 중 {scheduler['in_flight']}개 | "
+            f"대기 p95 {scheduler['wait_ms']['interactive']['p95']:.0f}ms"
+            + (f" | 429로 {scheduler['paused_s']:.1f}s 일시 정지" if scheduler["paused_s"] else "")
+        )
+    
+    # 동일 요청 합류 (모든 세션 합산)
+    single_flight = get_single_flight().summary()
+    if single_flight["calls_saved"]:
+        st.caption(f"🔗 진행 중인 같은 요청에 합류: {single_flight['calls_saved']}회 (LLM 요청 절약)")
+    
+    # 웹검색 캐시 (모든 세션 합산)
+    if router_agent.web_cache is not None:
+        web_cache = router_agent.web_cache.summary()
+        if web_cache["lookups"]:
+            st.caption(
+                f"🗄️ 웹 캐시 적중 {web_cache['hits']}/{web_cache['lookups']}회 "
+                f"({web_cache['hit_rate']:.0%}) | 저장된 검색 {web_cache['searches']}개"
+            )
 
 # ============================================================================
 # 메인 영역: 채팅 인터페이스
@@ -291,11 +357,12 @@ if prompt := st.chat_input("질문을 입력하세요..."):
                 if isinstance(msg, (HumanMessage, AIMessage))
             ]
             
-            # Router Agent 호출
-            result = st.session_state.router_agent.invoke(
-                question=prompt,
-                chat_history=chat_history
-            )
+            # Router Agent 호출 (이 세션의 LLM/임베딩 호출은 세션 대기열에서 차례를 기다림)
+            with scheduler_context(st.session_state.session_id, INTERACTIVE):
+                result = router_agent.invoke(
+                    question=prompt,
+                    chat_history=chat_history
+                )
             
             # 라우팅 정보 표시
             route_emoji = {
@@ -309,6 +376,20 @@ if prompt := st.chat_input("질문을 입력하세요..."):
             if result['search_results']:
                 st.write(f"🔍 검색 완료")
             
+            if result.get('rerank_ms'):
+                st.write(f"🔀 재정렬: {result['rerank_ms']:.1f}ms")
+            
+            if result.get('models_used'):
+                escalation = f" (승격: {result['escalation_reason']})" if result.get('escalation_reason') else ""
+                st.write(f"🪶 사용 모델: {', '.join(result['models_used'])}{escalation}")
+            
+            if result.get('degradations'):
+                st.write(f"⏱️ 시간/예산 제한 조치: {', '.join(result['degradations'])}")
+            
+            cache = router_agent.prompt_cache.summary()
+            if cache["calls"]:
+                st.write(f"🗂️ 프롬프트 캐시 적중률: {cache['hit_rate']:.0%} (절약 ${cache['saved_usd']:.4f})")
+            
             status.update(label="✅ 답변 생성 완료!", state="complete")
         
         # 답변 표시
@@ -0,0 +1,209 @@
+"""
+chunk_dedup.py - 임베딩 전 유사 중복 청크 제거
+=============================================
+
+목적:
+    교재 PDF에 반복되는 머리글/바닥글, 라이선스 문구, 같은 코드 예제 등이
+    각각 따로 임베딩되지 않도록 거의 같은 청크를 하나로 합칩니다.
+    중복이 검색 결과 상위 k개를 차지하는 문제도 함께 줄어듭니다.
+
+주요 기능:
+    1. SimHash 지문 (64비트, 단어 n-gram 기반)
+    2. 밴드 인덱스로 빠른 후보 탐색 (해밍 거리 ≤ 3)
+    3. 중복 청크의 출처(페이지)를 대표 청크 metadata에 병합
+    4. 절감된 임베딩 수 / 토큰 수 / 인덱스 크기 보고
+
+사용 기술:
+    - hashlib.blake2b: n-gram 해시
+    - SimHash: 유사 문서 지문 (Charikar)
+"""
+
+import hashlib
+import re
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+from langchain_core.documents import Document
+
+
+# text-embedding-3-small 벡터 차원 (float32 기준 인덱스 크기 계산용)
+EMBEDDING_DIMENSIONS = 1536
+
+FINGERPRINT_BITS = 64
+BAND_BITS = 16  # 64비트 = 16비트 x 4밴드 → 해밍 거리 3 이하는 반드시 한 밴드가 일치
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class NearDuplicateFilter:
+    """
+    SimHash 기반 유사 중복 청크 필터
+
+    같은 필터 인스턴스에 여러 배치를 차례로 넣을 수 있으므로
+    배치 단위 인덱싱에서도 이전 배치와의 중복을 제거할 수 있습니다.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 3,
+        shingle_size: int = 3,
+        count_tokens=None
+    ):
+        """
+        Args:
+            max_distance: 같은 청크로 볼 최대 해밍 거리 (0~3)
+            shingle_size: 지문 계산에 사용할 단어 n-gram 크기
+            count_tokens: 토큰 수 계산 함수 (절감 토큰 보고용, 없으면 생략)
+        """
+        if not 0 <= max_distance < FINGERPRINT_BITS // BAND_BITS:
+            raise ValueError("max_distance는 0~3 사이여야 합니다.")
+
+        self.max_distance = max_distance
+        self.shingle_size = shingle_size
+        self.count_tokens = count_tokens
+
+        self._kept: List[Document] = []
+        self._fingerprints: List[int] = []
+        self._bands: Dict[tuple, List[int]] = defaultdict(list)
+        self._dirty: Set[int] = set()
+
+        self.stats = {
+            "input_chunks": 0,
+            "kept_chunks": 0,
+            "removed_chunks": 0,
+            "saved_tokens": 0,
+            "saved_bytes": 0
+        }
+
+    def fingerprint(self, text: str) -> int:
+        """텍스트의 64비트 SimHash 지문을 계산합니다."""
+        words = WORD_PATTERN.findall(text.lower())
+        if len(words) < self.shingle_size:
+            shingles = [" ".join(words)]
+        else:
+            shingles = [
+                " ".join(words[i:i + self.shingle_size])
+                for i in range(len(words) - self.shingle_size + 1)
+            ]
+
+        weights = [0] * FINGERPRINT_BITS
+        for shingle in shingles:
+            digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "big")
+            for bit in range(FINGERPRINT_BITS):
+                weights[bit] += 1 if (value >> bit) & 1 else -1
+
+        fingerprint = 0
+        for bit, weight in enumerate(weights):
+            if weight > 0:
+                fingerprint |= 1 << bit
+        return fingerprint
+
+    @staticmethod
+    def _band_keys(fingerprint: int) -> List[tuple]:
+        mask = (1 << BAND_BITS) - 1
+        return [
+            (band, (fingerprint >> (band * BAND_BITS)) & mask)
+            for band in range(FINGERPRINT_BITS // BAND_BITS)
+        ]
+
+    def _find_duplicate(self, fingerprint: int) -> Optional[int]:
+        """해밍 거리가 max_distance 이하인 대표 청크의 인덱스를 찾습니다."""
+        for key in self._band_keys(fingerprint):
+            for idx in self._bands.get(key, []):
+                if bin(fingerprint ^ self._fingerprints[idx]).count("1") <= self.max_distance:
+                    return idx
+        return None
+
+    @staticmethod
+    def _merge_metadata(target: Document, duplicate: Document):
+        """중복 청크의 출처 정보를 대표 청크 metadata에 병합 (Chroma는 스칼라만 허용)"""
+        metadata = target.metadata
+        metadata["duplicate_count"] = metadata.get("duplicate_count", 0) + 1
+
+        page = duplicate.metadata.get("page")
+        if page is not None:
+            pages = [p for p in str(metadata.get("duplicate_pages", "")).split(",") if p]
+            if str(page) not in pages and page != metadata.get("page"):
+                pages.append(str(page))
+            metadata["duplicate_pages"] = ",".join(pages)
+
+        source = duplicate.metadata.get("source")
+        if source and source != metadata.get("source"):
+            sources = [s for s in str(metadata.get("duplicate_sources", "")).split("|") if s]
+            if source not in sources:
+                sources.append(source)
+            metadata["duplicate_sources"] = "|".join(sources)
+
+    def filter(self, chunks: List[Document]) -> List[Document]:
+        """
+        새 청크 중 이전에 보지 못한 청크만 반환합니다.
+
+        중복 청크는 버려지고 출처 정보만 대표 청크에 병합됩니다.
+        반환되는 청크에는 Document.id가 지정되므로, 벡터 스토어에 추가한 뒤에도
+        pop_updated_metadata()로 병합된 metadata를 갱신할 수 있습니다.
+
+        Args:
+            chunks: 청크 문서 리스트
+
+        Returns:
+            중복이 제거된 청크 문서 리스트
+        """
+        unique = []
+        for chunk in chunks:
+            self.stats["input_chunks"] += 1
+            fingerprint = self.fingerprint(chunk.page_content)
+            idx = self._find_duplicate(fingerprint)
+
+            if idx is not None:
+                self._merge_metadata(self._kept[idx], chunk)
+                self._dirty.add(idx)
+                self.stats["removed_chunks"] += 1
+                self.stats["saved_bytes"] += (
+                    EMBEDDING_DIMENSIONS * 4 + len(chunk.page_content.encode("utf-8"))
+                )
+                if self.count_tokens is not None:
+                    self.stats["saved_tokens"] += self.count_tokens(chunk.page_content)
+                continue
+
+            if chunk.id is None:
+                chunk.id = str(uuid.uuid4())
+
+            new_idx = len(self._kept)
+            self._kept.append(chunk)
+            self._fingerprints.append(fingerprint)
+            for key in self._band_keys(fingerprint):
+                self._bands[key].append(new_idx)
+
+            self.stats["kept_chunks"] += 1
+            unique.append(chunk)
+
+        return unique
+
+    def pop_updated_metadata(self) -> Dict[str, dict]:
+        """
+        마지막 호출 이후 metadata가 병합된 대표 청크를 반환합니다.
+
+        Returns:
+            {문서 ID: 갱신된 metadata}
+        """
+        updated = {
+            self._kept[idx].id: dict(self._kept[idx].metadata)
+            for idx in sorted(self._dirty)
+        }
+        self._dirty.clear()
+        return updated
+
+    def summary(self) -> str:
+        """절감 효과를 한 줄 메시지로 반환합니다."""
+        stats = self.stats
+        message = (
+            f"✅ 중복 청크 {stats['removed_chunks']}개 제거 "
+            f"({stats['input_chunks']}개 → {stats['kept_chunks']}개), "
+            f"임베딩 {stats['removed_chunks']}회 절약, "
+            f"인덱스 약 {stats['saved_bytes'] / 1024:.1f}KB 절약"
+        )
+        if self.count_tokens is not None:
+            message += f", {stats['saved_tokens']}토큰 절약"
+        return message
@@ -0,0 +1,303 @@
+"""
+context_packer.py - 토큰 예산에 맞춘 검색 결과 패킹
+==================================================
+
+목적:
+    검색된 청크를 그대로 이어 붙여 프롬프트에 넣는 대신,
+    모델별 토큰 예산 안에서 가장 관련성 높은 근거부터 채워 넣어
+    답변당 프롬프트 토큰을 줄입니다.
+
+주요 기능:
+    1. 관련도 점수 순 정렬
+    2. 같은 페이지에서 나온 청크 병합
+    3. 이웃 청크 사이의 겹치는 텍스트(청크 오버랩) 제거
+    4. 모델별 토큰 예산 내에서 채우기 (토큰 경계에서 자름)
+
+사용 기술:
+    - tiktoken: 토큰 수 계산 및 토큰 경계 자르기
+      (인코딩은 처음 쓸 때 로드, 내려받을 수 없으면 글자 수 기준 추정으로 대체)
+"""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import tiktoken
+from langchain_core.documents import Document
+
+from two_stage_search import full_query_embeddings, is_two_stage, two_stage_search
+
+
+# 모델별 참고 자료에 사용할 토큰 예산 (질문/이력/지시문/답변 공간은 별도)
+CONTEXT_TOKEN_BUDGETS: Dict[str, int] = {
+    "gpt-4.1-nano-2025-04-14": 2000,
+    "gpt-4.1-mini-2025-04-14": 3000,
+    "gpt-5-nano-2025-08-07": 2000,
+    "gpt-5-mini-2025-08-07": 4000,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 3000
+
+# 예산이 이보다 적게 남으면 잘린 조각을 넣지 않음
+MIN_PARTIAL_TOKENS = 50
+
+# tiktoken 인코딩을 쓸 수 없을 때 토큰 수 추정에 쓰는 토큰당 글자 수
+CHARS_PER_TOKEN = 3
+
+# 겹침으로 인정할 최소 글자 수 / 검사할 최대 글자 수
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 2000
+
+
+def _overlap_length(left: str, right: str) -> int:
+    """left의 끝과 right의 시작이 겹치는 글자 수를 반환합니다. (없으면 0)"""
+    if len(left) < MIN_OVERLAP_CHARS or len(right) < MIN_OVERLAP_CHARS:
+        return 0
+
+    probe = right[:MIN_OVERLAP_CHARS]
+    start = left.find(probe, max(0, len(left) - MAX_OVERLAP_CHARS))
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def _join_trimmed(left: str, right: str) -> str:
+    """겹치는 부분을 한 번만 남기고 두 텍스트를 이어 붙입니다."""
+    if right in left:
+        return left
+    if left in right:
+        return right
+
+    overlap = _overlap_length(left, right)
+    if overlap:
+        return left + right[overlap:]
+
+    overlap = _overlap_length(right, left)
+    if overlap:
+        return right + left[overlap:]
+
+    return left + "\n...\n" + right
+
+
+class ContextPacker:
+    """
+    검색된 (문서, 점수) 목록을 토큰 예산에 맞는 하나의 참고 자료 문자열로 만듭니다.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_tokens: Optional[int] = None,
+        encoding_name: str = "cl100k_base"
+    ):
+        """
+        Args:
+            model: 답변에 사용할 모델 (예산 조회용)
+            max_tokens: 참고 자료 토큰 예산 (None이면 모델별 기본값)
+            encoding_name: tiktoken 인코딩 이름
+        """
+        self.max_tokens = max_tokens or CONTEXT_TOKEN_BUDGETS.get(
+            model, DEFAULT_CONTEXT_TOKEN_BUDGET
+        )
+        self.encoding_name = encoding_name
+        # 인코딩 파일이 캐시에 없으면 내려받아야 하므로 생성 시점이 아닌 처음 쓸 때 로드
+        self._encoding = None
+        self._encoding_loaded = False
+        self._encoding_lock = threading.Lock()
+        # 여러 세션이 같은 패커를 공유하므로 통계는 스레드별로 보관
+        self._local = threading.local()
+
+    @property
+    def encoding(self):
+        """tiktoken 인코딩 (로드할 수 없으면 None → 글자 수 기준 추정 사용)"""
+        if not self._encoding_loaded:
+            with self._encoding_lock:
+                if not self._encoding_loaded:
+                    try:
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        print(f"⚠️ tiktoken 인코딩 로드 실패, 글자 수로 토큰 수 추정: {str(e)}")
+                    self._encoding_loaded = True
+        return self._encoding
+
+    @property
+    def last_stats(self) -> dict:
+        """현재 스레드에서 마지막으로 수행한 pack()의 통계 (사용 문서 수, 토큰 수 등)"""
+        return getattr(self._local, "stats", {})
+
+    def count_tokens(self, text: str) -> int:
+        """텍스트의 토큰 수를 계산합니다."""
+        if self.encoding is None:
+            return len(text) // CHARS_PER_TOKEN
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """텍스트를 max_tokens 토큰 경계에서 자릅니다."""
+        if self.encoding is None:
+            return text[:max_tokens * CHARS_PER_TOKEN]
+        ids = self.encoding.encode(text, disallowed_special=())[:max_tokens]
+        return self.encoding.decode(ids)
+
+    @staticmethod
+    def _page_key(doc: Document) -> Tuple:
+        return (doc.metadata.get("source"), doc.metadata.get("page"))
+
+    @staticmethod
+    def _label(index: int, doc: Document) -> str:
+        page = doc.metadata.get("page")
+        if page is None:
+            return f"[문서 {index}]"
+        return f"[문서 {index}] (p.{int(page) + 1})"
+
+    def pack(
+        self,
+        scored_docs: List[Tuple[Document, float]],
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """
+        검색 결과를 토큰 예산 안에서 하나의 문자열로 묶습니다.
+
+        1. 점수 내림차순 정렬
+        2. 같은 (출처, 페이지)의 청크는 겹침을 제거하고 하나로 병합
+        3. 앞서 넣은 내용에 이미 포함된 텍스트는 건너뜀
+        4. 예산을 넘는 마지막 항목은 토큰 경계에서 자름
+
+        Args:
+            scored_docs: (문서, 관련도 점수) 리스트 (점수가 클수록 관련성 높음)
+            max_tokens: 이번 호출에만 사용할 토큰 예산
+
+        Returns:
+            "[문서 1] (p.3)\\n..." 형식의 참고 자료 문자열 (결과가 없으면 빈 문자열)
+        """
+        budget = max_tokens or self.max_tokens
+        ranked = sorted(scored_docs, key=lambda pair: pair[1], reverse=True)
+
+        # 같은 페이지 청크 병합 (가장 높은 점수 위치에 배치)
+        entries: List[List] = []
+        by_page: Dict[Tuple, List] = {}
+        for doc, score in ranked:
+            key = self._page_key(doc)
+            if key != (None, None) and key in by_page:
+                entry = by_page[key]
+                entry[1] = _join_trimmed(entry[1], doc.page_content)
+                continue
+            entry = [doc, doc.page_content, score]
+            entries.append(entry)
+            if key != (None, None):
+                by_page[key] = entry
+
+        sections: List[str] = []
+        used_tokens = 0
+        previous_text = ""
+        truncated = False
+
+        for doc, text, _ in entries:
+            # 앞 항목과 겹치는 부분 제거
+            overlap = _overlap_length(previous_text, text)
+            if overlap:
+                text = text[overlap:]
+            if not text.strip() or any(text in section for section in sections):
+                continue
+
+            label = self._label(len(sections) + 1, doc)
+            section = f"{label}\n{text}"
+            section_tokens = self.count_tokens(section) + 2  # 구분자 "\n\n"
+
+            if used_tokens + section_tokens > budget:
+                remaining = budget - used_tokens - self.count_tokens(label) - 2
+                if remaining >= MIN_PARTIAL_TOKENS:
+                    sections.append(f"{label}\n{self.truncate(text, remaining)}...")
+                    used_tokens = budget
+                truncated = True
+                break
+
+            sections.append(section)
+            used_tokens += section_tokens
+            previous_text = text
+
+        self._local.stats = {
+            "input_docs": len(scored_docs),
+            "merged_docs": len(scored_docs) - len(entries),
+            "used_docs": len(sections),
+            "tokens": used_tokens,
+            "budget": budget,
+            "truncated": truncated
+        }
+        return "\n\n".join(sections)
+
+
+def retrieve_with_scores(
+    retriever,
+    query: str,
+    k: Optional[int] = None,
+    embedding: Optional[List[float]] = None
+) -> List[Tuple[Document, float]]:
+    """
+    검색기에서 (문서, 관련도 점수) 목록을 가져옵니다.
+
+    VectorStoreRetriever이면 벡터 스토어의 관련도 점수를 사용하고,
+    (축소 차원 인덱스이면 저차원 검색 후 원래 차원 벡터로 재채점)
+    점수를 제공하지 않는 검색기는 순위로부터 점수를 만듭니다.
+
+    Args:
+        retriever: LangChain 검색기
+        query: 검색 질의
+        k: 가져올 문서 수 (None이면 검색기 설정값)
+        embedding: 미리 계산한 질의 임베딩 (있으면 임베딩 호출 생략, embed_queries 참고)
+
+    Returns:
+        (문서, 점수) 리스트
+    """
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is not None:
+        k = k or getattr(retriever, "search_kwargs", {}).get("k", 4)
+        if is_two_stage(vectorstore):
+            return two_stage_search(vectorstore, query, k, embedding)
+        if embedding is not None:
+            # 벡터로 검색하면 거리가 반환되므로 질의 검색과 같은 관련도 점수로 변환
+            relevance = vectorstore._select_relevance_score_fn()
+            return [
+                (doc, relevance(distance))
+                for doc, distance in vectorstore.similarity_search_by_vector_with_relevance_scores(
+                    embedding, k=k
+                )
+            ]
+        return vectorstore.similarity_search_with_relevance_scores(query, k=k)
+
+    docs = retriever.invoke(query)[:k]
+    return [(doc, 1.0 - i / len(docs)) for i, doc in enumerate(docs)]
+
+
+def embed_queries(retriever, queries: List[str]) -> List[Optional[List[float]]]:
+    """
+    여러 질의의 임베딩을 한 번의 임베딩 호출로 계산합니다. (배치 처리용)
+
+    질의마다 임베딩 API를 따로 부르는 대신 embed_documents로 묶어 보냅니다.
+    (OpenAI 임베딩은 질의/문서 임베딩이 같음)
+    질의/문서 임베딩이 다른 백엔드(BatchingEmbeddings.batch_queries=False)는
+    질의마다 embed_query를 호출합니다.
+    벡터 스토어 검색기가 아니거나 임베딩에 실패하면 None을 채워
+    retrieve_with_scores가 평소처럼 질의 문자열로 검색하게 합니다.
+
+    Returns:
+        queries와 같은 순서의 임베딩 리스트
+    """
+    vectorstore = getattr(retriever, "vectorstore", None)
+    # 축소 차원 인덱스도 질의는 원래 차원으로 임베딩 (재채점에 사용)
+    embeddings = full_query_embeddings(vectorstore)
+    if embeddings is None or not queries:
+        return [None] * len(queries)
+
+    if not getattr(embeddings, "batch_queries", True):
+        vectors: List[Optional[List[float]]] = []
+        for query in queries:
+            try:
+                vectors.append(embeddings.embed_query(query))
+            except Exception:
+                vectors.append(None)
+        return vectors
+
+    try:
+        return embeddings.embed_documents(list(queries))
+    except Exception:
+        return [None] * len(queries)
@@ -0,0 +1,319 @@
+"""
+embedding_batcher.py - 동시 사용자의 질의 임베딩 묶음 처리 (Micro-batching)
+==========================================================================
+
+목적:
+    검색할 때마다 질의 하나짜리 임베딩 HTTP 요청을 따로 보내는 대신,
+    여러 사용자의 질의를 몇 ms 동안 모았다가 한 번의 임베딩 요청으로 보내고
+    결과를 기다리던 호출자들에게 나눠 줍니다.
+    (OpenAI 임베딩 API는 요청 하나에 여러 텍스트를 받으므로 요청 수와 연결 사용이 줄어듦)
+
+주요 기능:
+    1. BatchingEmbeddings: Embeddings 인터페이스를 그대로 지키는 래퍼
+       - embed_query: 최대 max_wait_ms 동안 모으거나 max_batch_size가 차면 한 번에 요청
+         (batch_queries=False이면 묶지 않고 백엔드의 질의 전용 임베딩을 그대로 호출)
+       - embed_documents: 이미 묶여 있는 문서 임베딩(인덱싱)은 그대로 전달
+    2. 같은 묶음 안의 중복 질의는 한 번만 임베딩
+    3. 통계: 질의 수, 실제 요청 수(절약한 요청 수), 평균 묶음 크기, 대기/전체 지연 시간, 처리량
+    4. 프로세스 전역 공유 (shared_batching_embeddings)
+    5. python embedding_batcher.py: 가짜 임베딩 백엔드로 개별 요청과 묶음 요청 비교
+
+주의:
+    묶음 요청 슬롯(max_inflight)에 여유가 있으면 호출자 지연 시간은 최대 max_wait_ms + 요청 한 번
+    시간입니다. 슬롯이 모두 차 있으면 다음 묶음은 슬롯이 빌 때 만들므로, 그동안 들어온 질의는
+    작은 묶음으로 쪼개져 쌓이지 않고 한 묶음으로 합쳐집니다. (추가 대기 = 앞선 요청이 끝날 때까지)
+    사용자가 한 명뿐이면 max_wait_ms만큼 느려지므로 대기 시간은 몇 ms로 작게 둡니다.
+    질의와 문서를 다르게 임베딩하는 백엔드(예: FastEmbed의 query_embed)는
+    embed_documents로 묶으면 결과가 달라지므로 batch_queries=False로 만듭니다.
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Queue
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+# 기본 묶음 설정
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 5.0
+
+# 묶음 요청을 동시에 보낼 최대 수 (요청이 느려도 다음 묶음을 계속 모을 수 있도록)
+DEFAULT_MAX_INFLIGHT = 4
+
+_shared: Dict[str, "BatchingEmbeddings"] = {}
+_shared_lock = threading.Lock()
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    질의 임베딩을 모아서 한 번에 요청하는 Embeddings 래퍼 (모든 스레드 공유)
+
+    벡터 스토어의 embedding_function 자리에 그대로 넣어 사용합니다.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        max_inflight: int = DEFAULT_MAX_INFLIGHT,
+        batch_queries: bool = True
+    ):
+        """
+        Args:
+            embeddings: 실제 임베딩 백엔드 (예: OpenAIEmbeddings)
+            max_batch_size: 한 번에 보낼 최대 질의 수
+            max_wait_ms: 첫 질의가 들어온 뒤 다른 질의를 기다릴 최대 시간 (ms)
+            max_inflight: 동시에 보낼 수 있는 묶음 요청 수
+            batch_queries: 질의를 embed_documents로 묶어 보낼지 여부
+                (False이면 백엔드의 embed_query를 그대로 호출)
+        """
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_queries = batch_queries
+
+        self._queue: Queue = Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="embed")
+        # 진행 중인 묶음 요청 수 제한 (슬롯이 빌 때까지 질의를 대기열에 모음)
+        self._slots = threading.Semaphore(max_inflight)
+        self._dispatcher: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._started_at = time.perf_counter()
+        self.stats = {
+            "queries": 0,
+            "upstream_calls": 0,
+            "embedded_texts": 0,
+            "errors": 0,
+            "wait_s": 0.0,
+            "latency_s": 0.0,
+            "max_batch": 0
+        }
+
+    # ------------------------------------------------------------------
+    # Embeddings 인터페이스
+    # ------------------------------------------------------------------
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """문서 임베딩은 이미 묶여 있으므로 그대로 전달"""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """질의를 대기열에 넣고 묶음 요청 결과를 기다림"""
+        if not self.batch_queries:
+            return self.embeddings.embed_query(text)
+        self._ensure_dispatcher()
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future.result()
+
+    # ------------------------------------------------------------------
+    # 묶음 처리
+    # ------------------------------------------------------------------
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is not None:
+            return
+        with self._start_lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_loop, name="embed-batcher", daemon=True
+                )
+                self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        """
+        요청 슬롯이 비면 첫 질의부터 max_wait 동안(또는 max_batch_size까지) 더 모아서 요청
+
+        슬롯을 먼저 잡으므로 요청이 모두 진행 중일 때는 질의가 대기열에 쌓였다가
+        슬롯이 비는 즉시 한 묶음으로 나갑니다. (실행기 대기열에 작은 묶음이 쌓이지 않음)
+        """
+        while True:
+            self._slots.acquire()
+            text, future, queued_at = self._queue.get()
+            batch = [(text, future, queued_at)]
+            # 슬롯을 기다리는 동안 이미 max_wait가 지났으면 쌓여 있는 질의만 바로 묶음
+            deadline = queued_at + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            self._executor.submit(self._embed_batch, batch)
+
+    def _embed_batch(self, batch: list):
+        """묶음 하나를 요청하고 결과를 각 호출자에게 전달 (실패하면 모두에게 예외 전달)"""
+        try:
+            self._send_batch(batch)
+        finally:
+            self._slots.release()
+
+    def _send_batch(self, batch: list):
+        sent_at = time.perf_counter()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))  # 중복 질의는 한 번만
+        try:
+            vectors = dict(zip(texts, self.embeddings.embed_documents(texts)))
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            with self._stats_lock:
+                self.stats["errors"] += 1
+                self.stats["upstream_calls"] += 1
+            return
+
+        done_at = time.perf_counter()
+        for text, future, _ in batch:
+            future.set_result(vectors[text])
+
+        with self._stats_lock:
+            stats = self.stats
+            stats["queries"] += len(batch)
+            stats["upstream_calls"] += 1
+            stats["embedded_texts"] += len(texts)
+            stats["max_batch"] = max(stats["max_batch"], len(batch))
+            stats["wait_s"] += sum(sent_at - queued_at for _, _, queued_at in batch)
+            stats["latency_s"] += sum(done_at - queued_at for _, _, queued_at in batch)
+
+    def summary(self) -> dict:
+        """질의 수, 실제 요청 수, 절약한 요청 수, 평균 묶음 크기, 평균 대기/지연 시간, 처리량"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        queries = stats["queries"]
+        elapsed = time.perf_counter() - self._started_at
+        return {
+            "queries": queries,
+            "upstream_calls": stats["upstream_calls"],
+            "calls_saved": queries - (stats["upstream_calls"] - stats["errors"]),
+            "avg_batch_size": queries / max(stats["upstream_calls"] - stats["errors"], 1),
+            "max_batch_size": stats["max_batch"],
+            "avg_wait_ms": stats["wait_s"] / queries * 1000 if queries else 0.0,
+            "avg_latency_ms": stats["latency_s"] / queries * 1000 if queries else 0.0,
+            "queries_per_sec": queries / elapsed if elapsed else 0.0,
+            "errors": stats["errors"]
+        }
+
+
+def shared_batching_embeddings(key: str, factory: Callable[[], Embeddings], **kwargs) -> BatchingEmbeddings:
+    """
+    key(예: 모델 이름 + API 키)별로 프로세스 전역 BatchingEmbeddings를 하나만 만들어 공유합니다.
+
+    세션마다 따로 만들면 다른 사용자의 질의와 묶이지 않으므로, 같은 임베딩 모델을 쓰는
+    모든 세션이 같은 인스턴스를 사용해야 합니다.
+
+    Args:
+        key: 공유 키
+        factory: 실제 임베딩 백엔드를 만드는 함수 (처음 한 번만 호출)
+        **kwargs: BatchingEmbeddings 설정
+    """
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = BatchingEmbeddings(factory(), **kwargs)
+        return _shared[key]
+
+
+# ============================================================================
+# 벤치마크
+# ============================================================================
+
+class _FakeEmbeddings(Embeddings):
+    """
+    요청당 지연 + 텍스트당 지연을 흉내 내는 가짜 임베딩 백엔드
+
+    동시 요청 수는 max_concurrent로 제한합니다. (HTTP 연결 풀 / 요청 수 한도)
+    """
+
+    def __init__(self, request_latency: float, per_text_latency: float, max_concurrent: int, dim: int = 8):
+        self.request_latency = request_latency
+        self.per_text_latency = per_text_latency
+        self.dim = dim
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_concurrent)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+        with self._slots:
+            time.sleep(self.request_latency + self.per_text_latency * len(texts))
+        return [[float(len(text))] * self.dim for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def _run_callers(embeddings: Embeddings, callers: int, queries: int) -> dict:
+    """callers명이 각자 queries번 질의 임베딩을 요청하고 지연 시간 분포 측정"""
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def caller(i: int):
+        for j in range(queries):
+            start = time.perf_counter()
+            embeddings.embed_query(f"사용자 {i}의 질문 {j}")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="질의 임베딩 묶음 처리 벤치마크 (가짜 백엔드)")
+    parser.add_argument("--callers", type=int, default=32, help="동시 사용자 수")
+    parser.add_argument("--queries", type=int, default=20, help="사용자당 질의 수")
+    parser.add_argument("--request-latency", type=float, default=0.08, help="요청당 지연 (초)")
+    parser.add_argument("--per-text-latency", type=float, default=0.0005, help="텍스트당 추가 지연 (초)")
+    parser.add_argument("--max-concurrent", type=int, default=8,
+                        help="백엔드가 동시에 처리하는 최대 요청 수 (연결 풀 / 요청 수 한도)")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    args = parser.parse_args()
+
+    direct = _FakeEmbeddings(args.request_latency, args.per_text_latency, args.max_concurrent)
+    direct_result = _run_callers(direct, args.callers, args.queries)
+
+    backend = _FakeEmbeddings(args.request_latency, args.per_text_latency, args.max_concurrent)
+    batcher = BatchingEmbeddings(backend, args.max_batch_size, args.max_wait_ms)
+    batched_result = _run_callers(batcher, args.callers, args.queries)
+    summary = batcher.summary()
+
+    print(f"동시 사용자 {args.callers}명 x 질의 {args.queries}개 "
+          f"(요청 지연 {args.request_latency * 1000:.0f}ms, 대기 {args.max_wait_ms}ms)")
+    for name, result, calls in (
+        ("개별 요청", direct_result, direct.calls),
+        ("묶음 요청", batched_result, backend.calls),
+    ):
+        print(f"{name}: 처리량 {result['throughput']:.1f} queries/s | "
+              f"p50 {result['p50_ms']:.1f}ms | p99 {result['p99_ms']:.1f}ms | 요청 {calls}회")
+    print(f"절약한 요청: {summary['calls_saved']}회 | 평균 묶음 크기 {summary['avg_batch_size']:.1f} "
+          f"(최대 {summary['max_batch_size']}) | 평균 대기 {summary['avg_wait_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+fake_openai_server.py - 테스트용 가짜 OpenAI Chat Completions 서버
+=================================================================
+
+목적:
+    재시도 / 헤징 / 서킷 브레이커(resilient_llm.py)를 API 비용 없이 확인하기 위해
+    지연 시간, 느린 응답 비율, 429/5xx 오류 비율을 조절할 수 있는
+    로컬 /v1/chat/completions 서버를 띄웁니다.
+
+주요 기능:
+    1. 일반 응답 / 스트리밍(SSE) 응답
+    2. 응답 지연, 느린 응답(꼬리 지연), 429/500 오류 주입
+    3. 특정 모델을 항상 503으로 응답 (서킷 브레이커/대체 확인)
+    4. --demo: 서버를 띄운 뒤 ResilientChatModel로 요청을 보내 통계 출력
+
+사용:
+    python fake_openai_server.py --port 8099 --error-rate 0.2 --slow-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 streamlit run app_router.py
+
+    python fake_openai_server.py --demo --down-models gpt-4.1-mini-2025-04-14
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """POST /v1/chat/completions만 처리하는 핸들러 (설정은 server.config)"""
+
+    def log_message(self, format, *args):
+        if self.server.config.get("verbose"):
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str, headers: dict = None):
+        self._send_json(status, {"error": {"message": message, "type": "fake_error"}}, headers)
+
+    @staticmethod
+    def _reply(messages: list) -> str:
+        """프롬프트 종류에 맞는 가짜 답변 (고정 지시문은 system 메시지에 있으므로 전체 메시지 확인)"""
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        if "decisions" in prompt:
+            lines = str(messages[-1].get("content", "")).splitlines()
+            count = sum(1 for line in lines if line.split(".")[0].isdigit())
+            return json.dumps({"decisions": [
+                {
+                    "index": i,
+                    "route": random.choice(["vectordb", "websearch", "direct"]),
+                    "confidence": round(random.random(), 2),
+                    "reasoning": "가짜 서버 묶음 라우팅"
+                }
+                for i in range(count)
+            ]}, ensure_ascii=False)
+        if "route" in prompt and "JSON" in prompt:
+            route = random.choice(["vectordb", "websearch", "direct"])
+            return json.dumps(
+                {"route": route, "confidence": round(random.random(), 2), "reasoning": "가짜 서버 라우팅"},
+                ensure_ascii=False
+            )
+        if "is_relevant" in prompt:
+            return json.dumps({"is_relevant": True, "reason": "가짜 서버 평가"}, ensure_ascii=False)
+        question = str(messages[-1].get("content", "")) if messages else ""
+        return f"가짜 답변입니다. (질문 길이 {len(question)}자)"
+
+    def do_POST(self):
+        config = self.server.config
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_error(404, f"unknown path {self.path}")
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        model = request.get("model", "fake")
+
+        with self.server.lock:
+            self.server.requests += 1
+
+        # 오류 주입
+        if model in config["down_models"]:
+            self._send_error(503, f"{model} is unavailable")
+            return
+        if random.random() < config["error_rate"]:
+            if random.random() < 0.5:
+                self._send_error(429, "Rate limit reached", {"Retry-After": "0.2"})
+            else:
+                self._send_error(500, "Internal server error")
+            return
+
+        # 지연 주입 (일부 요청은 꼬리 지연)
+        latency = config["latency"] * random.uniform(0.5, 1.5)
+        if random.random() < config["slow_rate"]:
+            latency = config["slow_latency"]
+        time.sleep(latency)
+
+        content = self._reply(request.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        usage = {
+            "prompt_tokens": sum(len(str(m.get("content", ""))) // 2 for m in request.get("messages", [])),
+            "completion_tokens": len(content) // 2,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i in range(0, len(content), 4):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[i:i + 4]}, "finish_reason": None}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(config["token_interval"])
+            if (request.get("stream_options") or {}).get("include_usage"):
+                # stream_usage=True: 빈 choices와 토큰 사용량을 담은 마지막 청크
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [],
+                    "usage": usage
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        })
+
+
+def start_server(
+    port: int = 8099,
+    latency: float = 0.2,
+    slow_rate: float = 0.0,
+    slow_latency: float = 3.0,
+    error_rate: float = 0.0,
+    down_models=(),
+    token_interval: float = 0.01,
+    verbose: bool = False
+) -> ThreadingHTTPServer:
+    """
+    백그라운드 스레드에서 가짜 서버를 시작합니다.
+
+    Returns:
+        서버 객체 (server.shutdown()으로 종료, server.requests로 받은 요청 수 확인)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.config = {
+        "latency": latency,
+        "slow_rate": slow_rate,
+        "slow_latency": slow_latency,
+        "error_rate": error_rate,
+        "down_models": set(down_models),
+        "token_interval": token_interval,
+        "verbose": verbose
+    }
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+def run_demo(server: ThreadingHTTPServer, port: int, calls: int, model: str):
+    """ResilientChatModel로 가짜 서버를 호출하고 지연 시간/통계를 출력"""
+    from langchain_core.messages import HumanMessage
+    from resilient_llm import ResilientChatModel
+
+    llm = ResilientChatModel(
+        model=model,
+        api_key="sk-fake",
+        base_url=f"http://127.0.0.1:{port}/v1",
+        base_delay=0.1,
+        hedge_min_samples=10
+    )
+
+    latencies = []
+    errors = 0
+    for i in range(calls):
+        start = time.perf_counter()
+        try:
+            llm.invoke([HumanMessage(content=f"테스트 질문 {i}")])
+        except Exception as e:
+            errors += 1
+            print(f"❌ 실패: {type(e).__name__}: {e}")
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print("=" * 60)
+    print(f"호출 {calls}회 | 실패 {errors}회 | 서버가 받은 요청 {server.requests}개")
+    print(f"지연 시간: p50 {p50:.3f}s | p99 {p99:.3f}s")
+    print(json.dumps(llm.summary(), ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="테스트용 가짜 OpenAI 서버")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.2, help="평균 응답 지연 (초)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="느린 응답 비율 (0~1)")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="느린 응답 지연 (초)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="429/500 오류 비율 (0~1)")
+    parser.add_argument("--down-models", nargs="*", default=[], help="항상 503을 반환할 모델")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="스트리밍 청크 간격 (초)")
+    parser.add_argument("--verbose", action="store_true", help="요청 로그 출력")
+    parser.add_argument("--demo", action="store_true", help="ResilientChatModel로 요청을 보내 통계 출력")
+    parser.add_argument("--calls", type=int, default=50, help="--demo 호출 횟수")
+    parser.add_argument("--model", default="gpt-4.1-mini-2025-04-14", help="--demo 모델")
+    args = parser.parse_args()
+
+    server = start_server(
+        port=args.port,
+        latency=args.latency,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate,
+        down_models=args.down_models,
+        token_interval=args.token_interval,
+        verbose=args.verbose
+    )
+    print(f"🧪 가짜 OpenAI 서버: http://127.0.0.1:{args.port}/v1")
+
+    if args.demo:
+        run_demo(server, args.port, args.calls, args.model)
+        server.shutdown()
+        return
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
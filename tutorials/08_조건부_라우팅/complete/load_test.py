@@ -0,0 +1,398 @@
+"""
+load_test.py - 동시 채팅 세션 부하 테스트
+==========================================
+
+목적:
+    하나의 프로세스가 동시에 몇 명의 사용자를 감당할 수 있는지 확인하기 위해
+    여러 개의 가상 대화를 동시에 실행하고 지연 시간 분포를 측정합니다.
+    LLM / 웹검색 / 벡터 검색은 지연 시간과 스트리밍 속도를 설정할 수 있는
+    가짜(stub) 백엔드로 대체하므로 API 비용 없이 실행할 수 있습니다.
+
+측정 항목:
+    1. 처리량 (turns/s)
+    2. 턴 지연 시간 p50 / p95 / p99
+    3. 첫 토큰까지의 시간 (TTFT)
+    4. 세션당 메모리 (tracemalloc)
+    5. 마감 시간/예산 제한으로 적용된 성능 저하 조치 횟수 (agent 모드)
+    6. 단계별 모델 사용량 (캐스케이드, agent 모드)
+    7. 프롬프트 접두사 캐시 적중률 (agent 모드)
+
+모드:
+    - agent: RouterAgent.invoke를 직접 호출 (app_router.py의 한 턴)
+    - chat:  llm.stream으로 답변을 받는 app4.py 스타일의 한 턴
+
+사용:
+    python load_test.py --mode agent --sessions 20 --turns 5
+    python load_test.py --mode chat --sessions 50 --tokens-per-sec 80
+"""
+
+import argparse
+import contextlib
+import contextvars
+import io
+import json
+import random
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+
+SAMPLE_QUESTIONS = [
+    "딥러닝에서 backpropagation이란?",
+    "CNN의 구조를 설명해주세요",
+    "gradient descent와 SGD의 차이는?",
+    "2024년 AI 관련 최신 뉴스는?",
+    "오늘 날씨 어때?",
+    "안녕하세요!",
+    "Python으로 피보나치 수열 코드 작성해줘",
+]
+
+# 현재 턴의 측정값 (Agent가 작업 스레드에서 LLM을 호출해도 전달되도록 contextvars 사용)
+_turn: contextvars.ContextVar = contextvars.ContextVar("turn", default=None)
+
+
+def _record_first_token():
+    """가짜 LLM이 첫 토큰을 낼 때 호출: 현재 턴의 마지막 LLM 호출 시점을 기록"""
+    turn = _turn.get()
+    if turn is not None:
+        turn["first_token"] = time.perf_counter()
+
+
+# ============================================================================
+# 가짜 백엔드
+# ============================================================================
+
+class FakeChatModel:
+    """
+    ChatOpenAI 대신 사용하는 가짜 LLM
+
+    첫 토큰까지 first_token_latency초, 이후 초당 tokens_per_sec개의 토큰을 생성합니다.
+    Router 프롬프트에는 JSON 라우팅 결과를, 그 외에는 answer_tokens 길이의 답변을 반환합니다.
+
+    OpenAI 프롬프트 캐싱도 흉내 냅니다: 이미 본 system 메시지가 CACHE_MIN_TOKENS 이상이면
+    그 부분을 캐시 적중 토큰(128 토큰 단위)으로 보고하고 첫 토큰 지연을 줄입니다.
+    """
+
+    CACHE_MIN_TOKENS = 1024
+    CACHE_HIT_SPEEDUP = 0.5
+
+    def __init__(
+        self,
+        first_token_latency: float = 0.3,
+        tokens_per_sec: float = 60.0,
+        answer_tokens: int = 200,
+        routes: Optional[List[str]] = None,
+        model: str = "fake"
+    ):
+        self.model = model
+        self.first_token_latency = first_token_latency
+        self.tokens_per_sec = tokens_per_sec
+        self.answer_tokens = answer_tokens
+        self.routes = routes or ["vectordb", "websearch", "direct"]
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+
+    def _usage(self, messages, output_tokens: int) -> dict:
+        """토큰 수는 글자 수 / 2로 추정, 이미 본 system 메시지는 캐시 적중으로 보고"""
+        input_tokens = sum(len(str(m.content)) // 2 for m in messages)
+        prefix = str(messages[0].content) if messages else ""
+        cached = 0
+        if len(prefix) // 2 >= self.CACHE_MIN_TOKENS:
+            with self._lock:
+                if prefix in self._seen_prefixes:
+                    cached = len(prefix) // 2 // 128 * 128
+                self._seen_prefixes.add(prefix)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cached}
+        }
+
+    def _reply_tokens(self, messages) -> List[str]:
+        # 고정 지시문은 system 메시지(맨 앞)에 있으므로 전체 메시지에서 프롬프트 종류 판단
+        prompt = "\n".join(str(m.content) for m in messages)
+        if "decisions" in prompt:
+            # 묶음 라우팅: 마지막 메시지의 "번호. 질문" 줄마다 결정 하나
+            count = sum(1 for line in messages[-1].content.splitlines() if line.split(".")[0].isdigit())
+            reply = json.dumps({"decisions": [
+                {
+                    "index": i,
+                    "route": random.choice(self.routes),
+                    "confidence": round(random.uniform(0.5, 1.0), 2),
+                    "reasoning": "부하 테스트용 묶음 라우팅"
+                }
+                for i in range(count)
+            ]}, ensure_ascii=False)
+            return [reply[i:i + 4] for i in range(0, len(reply), 4)]
+        if "route" in prompt and "JSON" in prompt:
+            reply = json.dumps({
+                "route": random.choice(self.routes),
+                "confidence": round(random.uniform(0.5, 1.0), 2),
+                "reasoning": "부하 테스트용 라우팅"
+            }, ensure_ascii=False)
+            return [reply[i:i + 4] for i in range(0, len(reply), 4)]
+        if "is_relevant" in prompt:
+            return ['{"is_relevant": true, "reason": "ok"}']
+        return ["토큰 "] * self.answer_tokens
+
+    def stream(self, messages, **kwargs):
+        tokens = self._reply_tokens(messages)
+        usage = self._usage(messages, len(tokens))
+        cached = usage["input_token_details"]["cache_read"]
+        time.sleep(self.first_token_latency * (self.CACHE_HIT_SPEEDUP if cached else 1.0))
+        _record_first_token()
+        for token in tokens:
+            yield AIMessageChunk(content=token)
+            time.sleep(1.0 / self.tokens_per_sec)
+        # stream_usage=True처럼 마지막 청크에 토큰 사용량
+        yield AIMessageChunk(content="", usage_metadata=usage)
+
+    def invoke(self, messages, **kwargs):
+        chunks = list(self.stream(messages))
+        return AIMessage(
+            content="".join(chunk.content for chunk in chunks),
+            usage_metadata=chunks[-1].usage_metadata
+        )
+
+
+class FakeRetriever:
+    """D2L 검색기 대신 사용하는 가짜 검색기 (지연 시간만 흉내)"""
+
+    def __init__(self, latency: float = 0.05, k: int = 3):
+        self.latency = latency
+        self.k = k
+
+    def invoke(self, query: str) -> List[Document]:
+        time.sleep(self.latency)
+        return [
+            Document(page_content=f"{query}에 대한 교재 내용 {i} " * 40, metadata={"page": i})
+            for i in range(self.k)
+        ]
+
+
+class FakeSearchTool:
+    """Tavily 대신 사용하는 가짜 웹검색 도구"""
+
+    def __init__(self, latency: float = 0.8):
+        self.latency = latency
+
+    def invoke(self, query: str) -> List[dict]:
+        time.sleep(self.latency)
+        return [
+            {"title": f"검색 결과 {i}", "content": f"{query} 관련 기사 내용 " * 30}
+            for i in range(3)
+        ]
+
+
+# ============================================================================
+# 시뮬레이션
+# ============================================================================
+
+def build_agent(args):
+    """가짜 백엔드를 연결한 RouterAgent 생성"""
+    from rag_router_agent import RouterAgent
+
+    agent = RouterAgent(
+        d2l_retriever=FakeRetriever(args.retrieval_latency),
+        api_key="sk-load-test"
+    )
+    agent.llm = FakeChatModel(
+        args.first_token_latency, args.tokens_per_sec, args.answer_tokens, model=agent.model
+    )
+    if agent.cascade_model:
+        # 소형 모델은 첫 토큰이 빠르고 생성 속도가 2배라고 가정
+        agent.fast_llm = FakeChatModel(
+            args.first_token_latency / 2, args.tokens_per_sec * 2, args.answer_tokens,
+            model=agent.cascade_model
+        )
+    else:
+        agent.fast_llm = agent.llm
+    agent.tavily_tool = FakeSearchTool(args.search_latency)
+    return agent
+
+
+def run_session(session_id: int, args, shared_agent, sessions: list) -> List[dict]:
+    """가상 사용자 한 명의 대화 (turns번 질문)"""
+    agent = shared_agent or build_agent(args)
+    llm = FakeChatModel(args.first_token_latency, args.tokens_per_sec, args.answer_tokens)
+    history = []
+    # 세션 상태는 끝까지 유지 (Streamlit session_state처럼 메모리에 남음)
+    sessions.append({"agent": agent, "history": history})
+
+    results = []
+    for turn in range(args.turns):
+        question = random.choice(SAMPLE_QUESTIONS)
+        turn_stats = {"first_token": None}
+        _turn.set(turn_stats)
+        start = time.perf_counter()
+
+        try:
+            if args.mode == "agent":
+                result = agent.invoke(
+                    question=question,
+                    chat_history=list(history),
+                    deadline_seconds=args.deadline,
+                    budget_usd=args.budget
+                )
+                answer = result["answer"]
+                degradations = result.get("degradations", [])
+                error = result.get("error") or None  # 노드가 오류를 답변 문구로 바꾼 경우
+            else:
+                parts = []
+                for chunk in llm.stream(history + [HumanMessage(content=question)]):
+                    parts.append(chunk.content)
+                answer = "".join(parts)
+                degradations = []
+                error = None
+        except Exception as e:
+            answer, error, degradations = "", str(e), []
+
+        end = time.perf_counter()
+        _turn.set(None)
+
+        history.extend([HumanMessage(content=question), AIMessage(content=answer)])
+        results.append({
+            "session": session_id,
+            "turn": turn,
+            "latency": end - start,
+            "ttft": (turn_stats["first_token"] - start) if turn_stats["first_token"] else None,
+            "degradations": degradations,
+            "error": error
+        })
+
+        if args.think_time:
+            time.sleep(random.uniform(0, args.think_time))
+
+    return results
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """nearest-rank 방식 백분위수"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def run_load_test(args) -> dict:
+    """
+    sessions개의 대화를 동시에 실행하고 결과를 집계합니다.
+
+    Returns:
+        {"turns", "errors", "throughput", "latency", "ttft", "degradations", "memory_per_session_kb", ...}
+    """
+    shared_agent = build_agent(args) if (args.mode == "agent" and args.shared_agent) else None
+    sessions: list = []
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+
+    # Agent 노드의 진행 로그는 부하 테스트 출력에서 숨김
+    log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with log, ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        futures = [
+            executor.submit(run_session, i, args, shared_agent, sessions)
+            for i in range(args.sessions)
+        ]
+        turns = [turn for future in futures for turn in future.result()]
+
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # 단계별 모델 사용량 (세션마다 Agent가 다를 수 있으므로 합산)
+    model_usage: Counter = Counter()
+    cache = Counter()
+    agents = {id(session["agent"]): session["agent"] for session in sessions}
+    for agent in agents.values():
+        for step, stats in agent.cascade_summary().items():
+            for model, count in stats["models"].items():
+                model_usage[f"{step}={model}"] += count
+        for key, value in agent.prompt_cache.stats.items():
+            cache[key] += value
+
+    latencies = [t["latency"] for t in turns if not t["error"]]
+    ttfts = [t["ttft"] for t in turns if t["ttft"] is not None]
+
+    return {
+        "mode": args.mode,
+        "sessions": args.sessions,
+        "turns": len(turns),
+        "errors": sum(1 for t in turns if t["error"]),
+        "elapsed_s": elapsed,
+        "throughput": len(turns) / elapsed if elapsed else 0.0,
+        "latency": {p: percentile(latencies, p) for p in (50, 95, 99)},
+        "ttft": {p: percentile(ttfts, p) for p in (50, 95, 99)},
+        "degradations": Counter(d for t in turns for d in t["degradations"]),
+        "model_usage": model_usage,
+        "prompt_cache": cache,
+        "memory_per_session_kb": (current - baseline) / max(len(sessions), 1) / 1024,
+        "peak_memory_mb": (peak - baseline) / 1024 / 1024
+    }
+
+
+def print_report(report: dict):
+    """결과 출력"""
+    print("=" * 60)
+    print(f"부하 테스트 결과 ({report['mode']} 모드, 동시 세션 {report['sessions']}개)")
+    print("=" * 60)
+    print(f"턴 수: {report['turns']} (오류 {report['errors']})")
+    print(f"소요 시간: {report['elapsed_s']:.2f}s")
+    print(f"처리량: {report['throughput']:.2f} turns/s")
+    latency, ttft = report["latency"], report["ttft"]
+    print(f"턴 지연 시간: p50 {latency[50]:.3f}s | p95 {latency[95]:.3f}s | p99 {latency[99]:.3f}s")
+    print(f"첫 토큰 시간: p50 {ttft[50]:.3f}s | p95 {ttft[95]:.3f}s | p99 {ttft[99]:.3f}s")
+    if report["degradations"]:
+        print("성능 저하 조치: " + ", ".join(
+            f"{name} {count}회" for name, count in report["degradations"].most_common()
+        ))
+    if report["model_usage"]:
+        print("모델 사용량: " + ", ".join(
+            f"{name} {count}회" for name, count in sorted(report["model_usage"].items())
+        ))
+    cache = report["prompt_cache"]
+    if cache["calls"]:
+        print(f"프롬프트 캐시: 적중률 {cache['cache_hits'] / cache['calls']:.0%} | "
+              f"캐시된 입력 {cache['cached_tokens'] / max(cache['input_tokens'], 1):.0%} | "
+              f"절약 ${cache['saved_usd']:.4f}")
+    print(f"세션당 메모리: {report['memory_per_session_kb']:.1f} KB "
+          f"(최대 사용량 {report['peak_memory_mb']:.1f} MB)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="동시 채팅 세션 부하 테스트")
+    parser.add_argument("--mode", choices=["agent", "chat"], default="agent")
+    parser.add_argument("--sessions", type=int, default=10, help="동시 세션 수")
+    parser.add_argument("--turns", type=int, default=3, help="세션당 질문 수")
+    parser.add_argument("--shared-agent", action="store_true",
+                        help="모든 세션이 RouterAgent 하나를 공유 (기본: 세션마다 생성)")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="LLM 첫 토큰 지연 (초)")
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0, help="LLM 스트리밍 속도")
+    parser.add_argument("--answer-tokens", type=int, default=200, help="답변 토큰 수")
+    parser.add_argument("--search-latency", type=float, default=0.8, help="웹검색 지연 (초)")
+    parser.add_argument("--retrieval-latency", type=float, default=0.05, help="벡터 검색 지연 (초)")
+    parser.add_argument("--deadline", type=float, default=None, help="요청당 마감 시간 (초, agent 모드)")
+    parser.add_argument("--budget", type=float, default=None, help="요청당 비용 예산 (USD, agent 모드)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="턴 사이 최대 대기 (초)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Agent 진행 로그 출력")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    print_report(run_load_test(args))
+
+
+if __name__ == "__main__":
+    main()
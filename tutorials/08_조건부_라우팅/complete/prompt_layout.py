@@ -0,0 +1,127 @@
+"""
+prompt_layout.py - 프롬프트 접두사 캐싱을 위한 메시지 배치
+=========================================================
+
+목적:
+    OpenAI는 요청의 앞부분(접두사)이 이전 요청과 같으면 자동으로 캐시하여
+    입력 토큰 비용과 첫 토큰 지연을 줄입니다. (1024 토큰 이상, 128 토큰 단위)
+    질문/대화 이력처럼 매번 바뀌는 내용이 프롬프트 앞에 오면 캐시가 적중할 수 없으므로
+    고정 지시문과 예시는 system 메시지에, 바뀌는 내용은 마지막 user 메시지에 둡니다.
+
+주요 기능:
+    1. 고정 system 메시지 + 가변 user 메시지 구성
+    2. 응답의 캐시 적중 토큰 수(usage_metadata.input_token_details.cache_read) 기록
+    3. 캐시로 절약한 입력 비용 / 적중 여부별 평균 지연 시간 보고
+"""
+
+import threading
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+
+# 모델별 입력 단가 (USD / 1M 토큰, 일반 / 캐시 적중)
+INPUT_PRICES_PER_MILLION = {
+    "gpt-4.1-nano-2025-04-14": (0.10, 0.025),
+    "gpt-4.1-mini-2025-04-14": (0.40, 0.10),
+    "gpt-5-nano-2025-08-07": (0.05, 0.005),
+    "gpt-5-mini-2025-08-07": (0.25, 0.025),
+}
+DEFAULT_INPUT_PRICE = (0.40, 0.10)
+
+
+def build_messages(
+    static_prompt: str,
+    sections: List[Tuple[str, str]],
+    history: Optional[List[BaseMessage]] = None
+) -> List[BaseMessage]:
+    """
+    캐시 친화적인 순서로 메시지를 구성합니다.
+
+    [고정 system 메시지] → [대화 이력 (이전 턴과 같은 순서로 누적)] → [이번 요청의 가변 내용]
+
+    Args:
+        static_prompt: 요청마다 바뀌지 않는 지시문/예시 (글자 하나라도 바뀌면 캐시 불가)
+        sections: (제목, 내용) 리스트 → 마지막 user 메시지에 순서대로 배치 (빈 내용은 생략)
+        history: 대화 이력 메시지
+
+    Returns:
+        메시지 리스트
+    """
+    body = "\n\n".join(
+        f"{title}:\n{content}" if title else content
+        for title, content in sections
+        if content
+    )
+    return [SystemMessage(content=static_prompt), *(history or []), HumanMessage(content=body)]
+
+
+def cached_input_tokens(response) -> Tuple[int, int]:
+    """
+    응답의 (입력 토큰 수, 캐시 적중 입력 토큰 수)를 반환합니다. (usage가 없으면 (0, 0))
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    return usage.get("input_tokens", 0), details.get("cache_read", 0) or 0
+
+
+class PromptCacheStats:
+    """
+    프롬프트 캐시 적중 통계 (모든 스레드 공유)
+
+    캐시 적중 입력 토큰은 일반 입력 토큰보다 싸므로 (예: gpt-4.1 계열 1/4 가격)
+    절약한 입력 비용과 적중/미적중 요청의 평균 지연 시간을 함께 기록합니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "cache_hits": 0,
+            "input_tokens": 0,
+            "cached_tokens": 0,
+            "saved_usd": 0.0,
+            "hit_latency_s": 0.0,
+            "miss_latency_s": 0.0
+        }
+
+    def record(self, response, latency: float, model: str):
+        """
+        응답 하나의 캐시 사용량을 기록합니다.
+
+        Args:
+            response: LLM 응답 (usage_metadata 사용)
+            latency: 호출 지연 시간 (초)
+            model: 호출한 모델 (단가 조회용)
+        """
+        input_tokens, cached = cached_input_tokens(response)
+        if not input_tokens:
+            return
+        input_price, cached_price = INPUT_PRICES_PER_MILLION.get(model, DEFAULT_INPUT_PRICE)
+        with self._lock:
+            stats = self.stats
+            stats["calls"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["cached_tokens"] += cached
+            stats["saved_usd"] += cached * (input_price - cached_price) / 1_000_000
+            if cached:
+                stats["cache_hits"] += 1
+                stats["hit_latency_s"] += latency
+            else:
+                stats["miss_latency_s"] += latency
+
+    def summary(self) -> dict:
+        """적중률, 캐시된 입력 비율, 절약 비용, 적중/미적중 평균 지연 시간"""
+        with self._lock:
+            stats = dict(self.stats)
+        hits, misses = stats["cache_hits"], stats["calls"] - stats["cache_hits"]
+        return {
+            "calls": stats["calls"],
+            "hit_rate": hits / stats["calls"] if stats["calls"] else 0.0,
+            "cached_token_ratio": (
+                stats["cached_tokens"] / stats["input_tokens"] if stats["input_tokens"] else 0.0
+            ),
+            "saved_usd": stats["saved_usd"],
+            "avg_hit_latency_s": stats["hit_latency_s"] / hits if hits else None,
+            "avg_miss_latency_s": stats["miss_latency_s"] / misses if misses else None
+        }
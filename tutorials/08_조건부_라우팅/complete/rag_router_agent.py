@@ -8,30 +8,199 @@ rag_router_agent.py - Router 기반 다중 경로 Agent
 
 주요 기능:
     1. Router Node: LLM이 경로 결정
-    2. VectorDB Node: D2L 교재 검색
+    2. VectorDB Node: D2L 교재 검색 (토큰 예산에 맞춘 컨텍스트 패킹)
     3. WebSearch Node: Tavily 웹검색
     4. Direct LLM Node: LLM 직접 응답
     5. Answer Node: 최종 답변 생성
+    6. 요청 단위 마감 시간/비용 예산: 부족하면 단계를 건너뛰거나 줄임
+    7. 모델 캐스케이드: 라우팅/간단한 직접 답변은 nano 모델, 필요할 때만 큰 모델로 승격
+    8. 구조화 출력: 라우팅 결과를 JSON Schema로 제한하고 스트리밍으로 읽어 경로가 나오는 즉시 결정
+       (라우팅 이유는 백그라운드에서 계속 받아 routing_reason에 채움)
+    9. 프롬프트 접두사 캐싱: 고정 지시문/예시는 system 메시지, 질문/참고 자료는 마지막 user 메시지
+    10. 배치 처리: 여러 질문을 동시에 실행 (라우팅은 묶음 호출, 질의 임베딩은 한 번에 계산)
+    11. 웹 캐시: 가져온 웹 문서를 로컬 벡터 캐시에 저장하고, 비슷한 질문은 웹검색 없이 답변 (web_cache.py)
 """
 
-import json
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
 from typing import TypedDict, Annotated, List, Optional
 import operator
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
-from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from langgraph.graph import StateGraph, END
 
+from batch_runner import DEFAULT_MAX_CONCURRENCY, pending_items, run_batch
+from context_packer import ContextPacker, embed_queries, retrieve_with_scores
+from llm_scheduler import scheduler_context
+from message_window import MessageWindow, window_reducer
+from prompt_layout import PromptCacheStats, build_messages
+from reranker import Reranker
+from resilient_llm import ResilientChatModel
+from structured_output import (
+    ROUTE_BATCH_SCHEMA,
+    ROUTE_SCHEMA,
+    StreamingJsonParser,
+    json_schema_format,
+    parse_json_object,
+)
+from request_budget import (
+    ANSWER_RESERVE_SECONDS,
+    DEFAULT_BUDGET_USD,
+    ESTIMATED_ANSWER_TOKENS,
+    LOW_BUDGET_K,
+    LOW_BUDGET_USD,
+    WEB_SEARCH_COST_USD,
+    WEB_SEARCH_TIMEOUT_SECONDS,
+    call_with_timeout,
+    estimate_llm_cost,
+    new_deadline,
+    remaining_seconds,
+    response_cost,
+    submit,
+)
+from web_cache import WebCache
+
+
+# 캐스케이드 기본 소형 모델 (라우팅, 간단한 직접 답변)
+DEFAULT_CASCADE_MODEL = "gpt-4.1-nano-2025-04-14"
+
+# 소형 모델 라우팅 결과의 신뢰도가 이보다 낮으면 큰 모델로 다시 라우팅
+ROUTER_CONFIDENCE_THRESHOLD = 0.7
+
+# 이보다 긴 질문은 복잡한 질문으로 보고 큰 모델 사용
+COMPLEX_QUESTION_TOKENS = 80
+
+# 답변 생성 후 백그라운드 라우팅 이유를 기다릴 최대 시간 (초)
+REASONING_WAIT_SECONDS = 1.0
+
+
+# ============================================================================
+# 고정 프롬프트 (요청마다 글자 하나 바뀌지 않아야 접두사 캐시가 적중)
+# 질문, 대화 이력, 참고 자료는 build_messages로 뒤쪽 메시지에 배치
+# ============================================================================
+
+ROUTER_SYSTEM_PROMPT = """사용자 질문을 분석하여 가장 적절한 처리 방법을 선택하는 라우터입니다.
+마지막 user 메시지의 질문 하나만 보고 아래 세 경로 중 하나를 고르세요.
+
+선택지:
+1. **vectordb**: AI, 딥러닝, 머신러닝, 신경망, 최적화 알고리즘 등 AI/ML 기술적 질문
+   - 출처: D2L (Dive into Deep Learning) 교재
+   - 개념 설명, 수식 유도, 모델 구조, 학습 기법, 교재 예제 코드에 대한 질문
+   - 시간이 지나도 답이 바뀌지 않는 기술 지식
+
+2. **websearch**: 최신 뉴스, 실시간 정보, 2023년 이후 이벤트, 현재 날씨/주가 등
+   - 출처: 웹 검색
+   - "오늘", "최근", "최신", "지금", 특정 연도 등 시점이 중요한 질문
+   - 특정 회사/제품/인물의 최근 소식, 발표, 순위, 가격
+
+3. **direct**: 일반 대화, 번역, 계산, 추론, 창작 등
+   - 출처: LLM 직접 응답
+   - 인사, 잡담, 글쓰기, 요약, 번역, 간단한 계산, 일반 프로그래밍 질문
+   - 검색 없이도 정확하게 답할 수 있는 질문
+
+판단 규칙:
+- AI/ML 기술 개념이라도 "최신", "2024년 발표" 등 시점이 중요하면 websearch
+- 일반 프로그래밍 질문(문법, 알고리즘 구현)은 direct, 딥러닝 모델 구현은 vectordb
+- 여러 경로에 걸치면 답변에 가장 필요한 정보의 출처를 기준으로 선택
+- 이전 대화를 이어 묻는 짧은 질문("더 자세히", "예시 들어줘")은 질문에 드러난 주제로 판단
+- 교재 내용과 최신 동향을 함께 묻는 질문은 최신 정보가 핵심이면 websearch, 원리가 핵심이면 vectordb
+- 수학 계산이나 논리 퍼즐은 AI 용어가 섞여 있어도 검색이 필요 없으면 direct
+- 확신이 낮으면 confidence를 낮게 적으세요. (0.7 미만이면 더 큰 모델이 다시 판단합니다)
+
+예시:
+- "backpropagation이란?" → vectordb
+- "CNN의 구조는?" → vectordb
+- "gradient descent 설명" → vectordb
+- "Transformer의 self-attention 계산 과정을 알려줘" → vectordb
+- "배치 정규화가 학습을 안정시키는 이유는?" → vectordb
+- "dropout과 weight decay의 차이는?" → vectordb
+- "LSTM이 기울기 소실을 줄이는 원리" → vectordb
+- "Adam 옵티마이저의 하이퍼파라미터 의미" → vectordb
+- "softmax와 cross-entropy 손실을 같이 쓰는 이유" → vectordb
+- "ResNet의 residual connection은 왜 필요해?" → vectordb
+- "word2vec의 skip-gram 학습 방식" → vectordb
+- "학습률 스케줄링 기법 정리해줘" → vectordb
+- "GAN의 생성자와 판별자 학습 과정" → vectordb
+- "2024년 노벨상" → websearch
+- "오늘 날씨" → websearch
+- "최신 AI 뉴스" → websearch
+- "이번 주 엔비디아 주가는?" → websearch
+- "최근 공개된 오픈소스 LLM 순위" → websearch
+- "올해 열리는 AI 학회 일정" → websearch
+- "어제 발표된 GPU 신제품 사양" → websearch
+- "현재 원달러 환율" → websearch
+- "요즘 가장 많이 쓰는 벡터 데이터베이스는?" → websearch
+- "최근 공개된 멀티모달 모델 벤치마크 결과" → websearch
+- "안녕하세요" → direct
+- "1+1은?" → direct
+- "시 써줘" → direct
+- "Python 코드 작성" → direct
+- "이 문장을 영어로 번역해줘" → direct
+- "리스트를 정렬하는 파이썬 함수 만들어줘" → direct
+- "회의록을 세 줄로 요약해줘" → direct
+- "37 곱하기 12는?" → direct
+- "자기소개서 첫 문장 추천해줘" → direct
+- "정규표현식으로 이메일 검사하는 법" → direct
+- "주말에 할 만한 취미 추천" → direct
+
+다음 형식으로 JSON 응답:
+{
+    "route": "vectordb" 또는 "websearch" 또는 "direct",
+    "confidence": 선택에 대한 확신 (0.0 ~ 1.0),
+    "reasoning": "선택한 이유를 한 문장으로"
+}
+
+JSON만 출력하세요."""
+
+ANSWER_SYSTEM_PROMPT = """참고 자료를 바탕으로 사용자 질문에 답하는 AI 어시스턴트입니다.
+
+- 마지막 user 메시지의 참고 자료를 바탕으로 질문에 대해 정확하고 상세한 답변을 작성하세요.
+- 참고 자료에서 답을 찾을 수 없다면 솔직하게 말씀해주세요.
+- 이전 대화가 있으면 맥락을 이어서 답변하세요."""
+
+NO_CONTEXT_SYSTEM_PROMPT = """사용자 질문에 답하는 AI 어시스턴트입니다.
+
+- 시간 또는 비용 제한으로 참고 자료를 검색하지 못했습니다.
+- 알고 있는 내용으로 간결하게 답변하고, 최신 정보가 아닐 수 있다고 알려주세요.
+- 이전 대화가 있으면 맥락을 이어서 답변하세요."""
+
+# 답변 프롬프트에 넣을 최근 대화 메시지 수
+ANSWER_HISTORY_MESSAGES = 4
+
+# 상태에 유지할 최근 대화 메시지 수 (더 오래된 메시지는 필요할 때 older()로 원본에서 읽음)
+HISTORY_WINDOW_MESSAGES = 8
+
+# 직접 응답 노드에 넣을 대화 메시지 수 (None이면 대화 전체, 창보다 크면 older()로 보충)
+DIRECT_HISTORY_MESSAGES: Optional[int] = None
+
+# 배치 처리 시 라우팅 호출 하나에 묶을 질문 수
+ROUTE_GROUP_SIZE = 20
+
+# 묶음 라우팅 요청 (system 메시지는 단일 라우팅과 같은 ROUTER_SYSTEM_PROMPT를 써서 캐시 공유)
+ROUTER_BATCH_INSTRUCTION = """위 질문들을 각각 따로 판단하세요.
+질문마다 번호(index)와 함께 route, confidence, reasoning을 decisions 배열에 담아 JSON으로 출력하세요."""
+
 
 class AgentState(TypedDict):
     """Agent의 상태 정의"""
-    messages: Annotated[List[BaseMessage], operator.add]  # 대화 이력
+    messages: Annotated[MessageWindow, window_reducer(HISTORY_WINDOW_MESSAGES)]  # 최근 대화
     question: str                    # 현재 질문
     route: str                       # 선택된 경로
     routing_reason: str              # 라우팅 이유
     search_results: str              # 검색 결과
+    rerank_ms: float                 # 재정렬 지연 시간 (재정렬 미사용 시 0)
     final_answer: str                # 최종 답변
+    deadline: float                  # 마감 시각 (time.monotonic 기준)
+    budget: float                    # 남은 비용 예산 (USD)
+    degradations: Annotated[List[str], operator.add]  # 적용된 성능 저하 조치
+    escalation_reason: str           # 큰 모델로 승격한 이유 (승격하지 않았으면 빈 문자열)
+    models_used: Annotated[List[str], operator.add]  # 단계별 사용 모델 ("단계=모델")
+    request_id: str                  # 요청 ID (백그라운드 라우팅 이유 조회용)
+    route_hint: Optional[dict]       # 배치 처리에서 미리 정한 라우팅 결과 (없으면 None)
+    query_embedding: Optional[List[float]]  # 배치 처리에서 미리 계산한 질의 임베딩
+    error: str                       # 실패한 단계와 오류 (비어 있으면 정상 답변, 배치 재실행 기준)
 
 
 class RouterAgent:
@@ -42,6 +211,10 @@ class RouterAgent:
     - vectordb: AI/딥러닝 관련 질문 → D2L 교재 검색
     - websearch: 최신 정보 → 웹검색
     - direct: 일반 질문 → LLM 직접 응답
+    
+    요청별 데이터는 모두 AgentState로 전달되고 인스턴스에는 공유 자원(LLM 클라이언트,
+    검색기, 컴파일된 그래프)과 잠금으로 보호되는 통계만 있으므로,
+    하나의 인스턴스를 모든 세션/스레드가 동시에 사용할 수 있습니다.
     """
     
     def __init__(
@@ -49,26 +222,75 @@ class RouterAgent:
         d2l_retriever,
         api_key: str,
         model: str = "gpt-4.1-mini-2025-04-14",
-        tavily_api_key: Optional[str] = None
+        tavily_api_key: Optional[str] = None,
+        reranker: Optional[Reranker] = None,
+        cascade_model: Optional[str] = DEFAULT_CASCADE_MODEL,
+        router_confidence_threshold: float = ROUTER_CONFIDENCE_THRESHOLD,
+        early_dispatch: bool = True,
+        web_cache: Optional[WebCache] = None,
+        direct_history_messages: Optional[int] = DIRECT_HISTORY_MESSAGES
     ):
         """
         Args:
             d2l_retriever: D2L 교재 검색기
             api_key: OpenAI API 키
-            model: 사용할 LLM 모델
+            model: 사용할 LLM 모델 (검색 기반 답변, 승격 시 사용)
             tavily_api_key: Tavily API 키
+            reranker: 재정렬 단계 (None이면 검색 결과를 그대로 사용)
+            cascade_model: 라우팅/간단한 직접 답변에 먼저 사용할 소형 모델 (None이면 캐스케이드 끔)
+            router_confidence_threshold: 이보다 낮은 라우팅 신뢰도는 큰 모델로 다시 판단
+            early_dispatch: 경로가 나오는 즉시 다음 노드로 진행 (False면 라우팅 이유까지 기다림)
+            web_cache: 웹검색 결과 캐시 (None이면 매번 웹검색)
+            direct_history_messages: 직접 응답에 넣을 최근 대화 메시지 수 (None이면 대화 전체)
         """
         self.d2l_retriever = d2l_retriever
+        self.reranker = reranker
+        self.web_cache = web_cache
+        self.model = model
+        self.direct_history_messages = direct_history_messages
         
-        # LLM 초기화
-        self.llm = ChatOpenAI(
+        # LLM 초기화 (일시적 오류 재시도, 느린 응답 헤징, 서킷 브레이커 + 저렴한 모델 대체)
+        self.llm = ResilientChatModel(
             model=model,
             temperature=0.3,
             api_key=api_key
         )
         
-        # Tavily 웹검색 도구
+        # 캐스케이드 소형 모델 (없으면 모든 단계에서 self.llm 사용)
+        self.cascade_model = cascade_model if cascade_model != model else None
+        if self.cascade_model:
+            self.fast_llm = ResilientChatModel(
+                model=self.cascade_model,
+                temperature=0.3,
+                api_key=api_key
+            )
+        else:
+            self.fast_llm = self.llm
+        self.router_confidence_threshold = router_confidence_threshold
+        self.early_dispatch = early_dispatch
+        
+        # 요청 ID → 라우팅 스트림 (경로 결정 후에도 이유를 계속 받는 중)
+        self._pending_reasons = {}
+        
+        # 경로별 모델 사용량/지연 시간/비용 통계 (모든 스레드 공유)
+        self._stats_lock = threading.Lock()
+        self._cascade_stats = defaultdict(lambda: {
+            "calls": 0,
+            "models": Counter(),
+            "latency_s": 0.0,
+            "cost_usd": 0.0,
+            "baseline_cost_usd": 0.0
+        })
+        
+        # 프롬프트 접두사 캐시 적중 통계
+        self.prompt_cache = PromptCacheStats()
+        
+        # 검색 결과를 토큰 예산에 맞게 묶는 패커
+        self.context_packer = ContextPacker(model)
+        
+        # Tavily 웹검색 도구 (키가 있을 때만 import)
         if tavily_api_key:
+            from langchain_community.tools.tavily_search import TavilySearchResults
             self.tavily_tool = TavilySearchResults(
                 max_results=3,
                 api_key=tavily_api_key
@@ -116,6 +338,213 @@ class RouterAgent:
         
         return workflow.compile()
     
+    def _time_left(self, state: AgentState, reserve: float = 0.0) -> float:
+        """마감까지 남은 시간에서 reserve초를 뺀 값 (다음 단계에 쓸 시간 확보)"""
+        return remaining_seconds(state["deadline"]) - reserve
+    
+    def _invoke_llm(
+        self,
+        state: AgentState,
+        messages: List[BaseMessage],
+        timeout: float,
+        step: str,
+        llm=None
+    ):
+        """
+        시간 제한 안에서 LLM을 호출하고 (응답, 남은 예산)을 반환합니다.
+        
+        Args:
+            state: 현재 Agent 상태
+            messages: LLM에 보낼 메시지
+            timeout: 최대 대기 시간 (초)
+            step: 통계에 기록할 단계 이름 (router, direct, vectordb, websearch)
+            llm: 사용할 LLM (None이면 self.llm)
+        
+        Raises:
+            TimeoutError: timeout초 안에 응답이 없는 경우
+        """
+        llm = llm or self.llm
+        model = getattr(llm, "model", self.model)
+        
+        start = time.perf_counter()
+        # 스케줄러 대기도 이 단계의 남은 시간 안에서만 (시간이 지나면 대기열에서 빠짐)
+        with scheduler_context(deadline=time.monotonic() + timeout):
+            response = call_with_timeout(llm.invoke, timeout, messages)
+        latency = time.perf_counter() - start
+        self.prompt_cache.record(response, latency, model)
+        
+        prompt_tokens = sum(self.context_packer.count_tokens(str(m.content)) for m in messages)
+        cost = response_cost(model, response, prompt_tokens)
+        self._record_usage(step, model, latency, cost, response_cost(self.model, response, prompt_tokens))
+        return response, state["budget"] - cost
+    
+    def _stream_fields(
+        self,
+        state: AgentState,
+        messages: List[BaseMessage],
+        timeout: float,
+        step: str,
+        llm,
+        response_format: dict,
+        until: tuple
+    ):
+        """
+        구조화 출력을 스트리밍으로 읽다가 until 필드가 모두 완성되면 바로 반환합니다.
+        
+        early_dispatch이면 나머지 출력(예: reasoning 문장)은 작업 스레드가 계속 읽어
+        parser에 채우므로, 결정에 필요한 필드만큼의 시간으로 다음 단계로 넘어갈 수 있습니다.
+        
+        Returns:
+            (StreamingJsonParser, 남은 예산, 스트림 전체를 읽으면 끝나는 Future)
+        
+        Raises:
+            TimeoutError: timeout초 안에 until 필드가 완성되지 않은 경우
+        """
+        if timeout <= 0:
+            raise TimeoutError("마감 시간 초과")
+        
+        model = getattr(llm, "model", self.model)
+        prompt_tokens = sum(self.context_packer.count_tokens(str(m.content)) for m in messages)
+        parser = StreamingJsonParser()
+        received = []
+        usage = {}
+        decided = threading.Event()
+        start = time.perf_counter()
+        
+        def read():
+            stream = llm.stream(messages, response_format=response_format)
+            try:
+                # 객체가 끝나도 스트림 끝까지 읽음 (usage는 마지막 청크에 옴)
+                for chunk in stream:
+                    if getattr(chunk, "usage_metadata", None):
+                        usage.update(chunk.usage_metadata)
+                    received.append(chunk.content)
+                    parser.feed(chunk.content)
+                    if not decided.is_set() and (
+                        parser.done or all(field in parser.fields for field in until)
+                    ):
+                        decided.set()
+            finally:
+                stream.close()
+                decided.set()
+                # 전체 출력 기준으로 통계 기록 (usage가 없으면 텍스트로 추정)
+                response = AIMessage(content="".join(received), usage_metadata=usage or None)
+                self.prompt_cache.record(response, time.perf_counter() - start, model)
+                self._record_usage(
+                    step, model, time.perf_counter() - start,
+                    response_cost(model, response, prompt_tokens),
+                    response_cost(self.model, response, prompt_tokens)
+                )
+            return parser
+        
+        with scheduler_context(deadline=time.monotonic() + timeout):
+            future = submit(read)
+        if not decided.wait(timeout):
+            raise TimeoutError(f"{timeout:.1f}초 안에 라우팅 결과 없음")
+        if not self.early_dispatch:
+            future.result()
+        elif future.done() and future.exception() is not None:
+            raise future.exception()
+        
+        # 예산은 결정 시점까지 받은 출력으로 차감 (남은 reasoning 토큰은 소액이라 무시)
+        cost = response_cost(model, AIMessage(content="".join(received)), prompt_tokens)
+        return parser, state["budget"] - cost, future
+    
+    def _record_usage(self, step: str, model: str, latency: float, cost: float, baseline_cost: float):
+        """단계별 모델 사용 통계 기록 (baseline_cost: 같은 호출을 큰 모델로 했을 때의 비용)"""
+        with self._stats_lock:
+            stats = self._cascade_stats[step]
+            stats["calls"] += 1
+            stats["models"][model] += 1
+            stats["latency_s"] += latency
+            stats["cost_usd"] += cost
+            stats["baseline_cost_usd"] += baseline_cost
+    
+    def cascade_summary(self) -> dict:
+        """
+        단계별 모델 사용량, 평균 지연 시간, 비용 절감액을 반환합니다.
+        
+        Returns:
+            {단계: {"calls", "models", "avg_latency_s", "cost_usd", "saved_usd"}}
+        """
+        with self._stats_lock:
+            return {
+                step: {
+                    "calls": stats["calls"],
+                    "models": dict(stats["models"]),
+                    "avg_latency_s": stats["latency_s"] / stats["calls"],
+                    "cost_usd": stats["cost_usd"],
+                    "saved_usd": stats["baseline_cost_usd"] - stats["cost_usd"]
+                }
+                for step, stats in self._cascade_stats.items()
+            }
+    
+    def _is_complex(self, question: str) -> bool:
+        """길거나 코드/여러 줄을 포함한 질문은 복잡한 질문으로 판단"""
+        return (
+            self.context_packer.count_tokens(question) > COMPLEX_QUESTION_TOKENS
+            or "```" in question
+            or question.count("\n") >= 3
+        )
+    
+    def _route_decision(self, state: AgentState, messages: List[BaseMessage], timeout: float, llm):
+        """
+        라우팅 결과를 구조화 출력 스트림에서 읽습니다. (route, confidence가 나오면 바로 반환)
+        
+        Returns:
+            ({"route", "confidence", "reasoning"}, 남은 예산)
+            early_dispatch이면 reasoning은 생성 중인 부분까지만 들어 있고,
+            나머지는 invoke()가 끝날 때 routing_reason에 채워집니다.
+        
+        Raises:
+            ValueError: JSON 객체가 없거나 알 수 없는 경로인 경우
+        """
+        parser, budget, future = self._stream_fields(
+            state, messages, timeout,
+            step="router",
+            llm=llm,
+            response_format=json_schema_format("route_decision", ROUTE_SCHEMA),
+            until=("route", "confidence")
+        )
+        if not parser.started:
+            raise ValueError("JSON 객체를 찾을 수 없습니다.")
+        
+        route = parser.fields.get("route")
+        if route not in ["vectordb", "websearch", "direct"]:
+            raise ValueError(f"알 수 없는 경로: {route}")
+        
+        # 이 요청의 최종 라우팅 스트림 (큰 모델로 승격하면 덮어씀)
+        self._pending_reasons[state["request_id"]] = (parser, future)
+        
+        decision = {
+            "route": route,
+            "confidence": float(parser.fields.get("confidence", 1.0)),
+            "reasoning": self._reasoning_text(parser)
+        }
+        return decision, budget
+    
+    @staticmethod
+    def _reasoning_text(parser: StreamingJsonParser) -> str:
+        """지금까지 받은 라우팅 이유 (생성 중이면 부분 문자열)"""
+        return parser.fields.get("reasoning") or parser.partial.get("reasoning", "")
+    
+    def _collect_reasoning(self, request_id: str, fallback: str) -> str:
+        """
+        백그라운드에서 받고 있던 라우팅 이유를 가져옵니다.
+        
+        답변 생성이 끝날 즈음에는 대부분 이미 완성되어 있으며,
+        아직이면 REASONING_WAIT_SECONDS까지만 기다리고 받은 부분까지 반환합니다.
+        """
+        pending = self._pending_reasons.pop(request_id, None)
+        if pending is None:
+            return fallback
+        parser, future = pending
+        try:
+            future.result(timeout=REASONING_WAIT_SECONDS)
+        except Exception:
+            pass
+        return self._reasoning_text(parser) or fallback
+    
     def _router_node(self, state: AgentState) -> dict:
         """
         Router 노드: LLM이 질문을 분석하여 적절한 경로 결정
@@ -128,56 +557,91 @@ class RouterAgent:
         """
         question = state["question"]
         
-        router_prompt = f"""다음 질문을 분석하여 가장 적절한 처리 방법을 선택하세요.
-
-질문: {question}
-
-선택지:
-1. **vectordb**: AI, 딥러닝, 머신러닝, 신경망, 최적화 알고리즘 등 AI/ML 기술적 질문
-   - 예: "backpropagation이란?", "CNN의 구조는?", "gradient descent 설명"
-   - 출처: D2L (Dive into Deep Learning) 교재
-
-2. **websearch**: 최신 뉴스, 실시간 정보, 2023년 이후 이벤트, 현재 날씨/주가 등
-   - 예: "2024년 노벨상", "오늘 날씨", "최신 AI 뉴스"
-   - 출처: 웹 검색
-
-3. **direct**: 일반 대화, 번역, 계산, 추론, 창작 등
-   - 예: "안녕하세요", "1+1은?", "시 써줘", "Python 코드 작성"
-   - 출처: LLM 직접 응답
-
-다음 형식으로 JSON 응답:
-{{
-    "route": "vectordb" 또는 "websearch" 또는 "direct",
-    "reasoning": "선택한 이유를 한 문장으로"
-}}
-
-JSON만 출력하세요."""
-
+        # 라우팅에 쓸 시간이 없으면 바로 직접 답변
+        timeout = self._time_left(state, reserve=ANSWER_RESERVE_SECONDS)
+        if timeout <= 0:
+            print("⏱️ 마감 임박: 라우팅 생략, 직접 응답")
+            return {
+                "route": "direct",
+                "routing_reason": "마감 시간이 부족하여 라우팅을 생략했습니다.",
+                "degradations": ["router_skipped_deadline"]
+            }
+        
+        # 배치 처리에서 묶음 라우팅으로 이미 정한 경로 (신뢰도가 충분한 것만 전달됨)
+        hint = state.get("route_hint")
+        if hint:
+            route = hint["route"]
+            escalation_reason = ""
+            if route == "direct" and self._is_complex(question):
+                escalation_reason = "복잡한 질문"
+            print(f"🧭 Router 결정 (묶음 라우팅): {route}")
+            return {
+                "route": route,
+                "routing_reason": hint.get("reasoning", ""),
+                "escalation_reason": escalation_reason,
+                "models_used": [f"router={hint['model']}"]
+            }
+        
+        # 고정 지시문/예시 뒤에 질문만 붙여 모든 요청이 같은 접두사를 공유
+        messages = build_messages(ROUTER_SYSTEM_PROMPT, [("질문", question)])
+        escalation_reason = ""
+        models_used = []
+        
         try:
-            response = self.llm.invoke([SystemMessage(content=router_prompt)])
-            result = json.loads(response.content)
+            # 1단계: 소형 모델로 라우팅
+            models_used.append(f"router={getattr(self.fast_llm, 'model', self.model)}")
+            try:
+                result, budget = self._route_decision(state, messages, timeout, self.fast_llm)
+                state = {**state, "budget": budget}
+                if self.fast_llm is not self.llm and result["confidence"] < self.router_confidence_threshold:
+                    escalation_reason = f"라우팅 신뢰도 낮음 ({result['confidence']:.2f})"
+            except (ValueError, TypeError) as e:
+                if self.fast_llm is self.llm:
+                    raise
+                escalation_reason = f"라우팅 응답 해석 실패 ({type(e).__name__})"
             
-            route = result.get("route", "direct")
-            reasoning = result.get("reasoning", "기본 경로 선택")
+            # 2단계: 신뢰도가 낮거나 해석에 실패하면 큰 모델로 다시 라우팅
+            if escalation_reason:
+                print(f"⬆️ 큰 모델로 승격: {escalation_reason}")
+                timeout = self._time_left(state, reserve=ANSWER_RESERVE_SECONDS)
+                models_used.append(f"router={self.model}")
+                result, budget = self._route_decision(state, messages, timeout, self.llm)
             
-            # 유효성 검사
-            if route not in ["vectordb", "websearch", "direct"]:
-                route = "direct"
-                reasoning = "알 수 없는 경로, 기본 경로 사용"
+            route = result["route"]
+            reasoning = result["reasoning"] or "(라우팅 이유 생성 중)"
+            
+            # 긴/복잡한 직접 질문은 큰 모델로 답변
+            if route == "direct" and not escalation_reason and self._is_complex(question):
+                escalation_reason = "복잡한 질문"
             
             print(f"🧭 Router 결정: {route}")
             print(f"   이유: {reasoning}")
             
             return {
                 "route": route,
-                "routing_reason": reasoning
+                "routing_reason": reasoning,
+                "budget": budget,
+                "escalation_reason": escalation_reason,
+                "models_used": models_used
             }
             
+        except TimeoutError:
+            print("⏱️ Router 시간 초과, 직접 응답")
+            return {
+                "route": "direct",
+                "routing_reason": "라우팅 시간 초과, 기본 경로 사용",
+                "budget": state["budget"],
+                "degradations": ["router_timeout"],
+                "models_used": models_used
+            }
         except Exception as e:
             print(f"⚠️ Router 오류: {str(e)}, 기본 경로 사용")
             return {
                 "route": "direct",
-                "routing_reason": f"라우팅 오류 발생: {str(e)}"
+                "routing_reason": f"라우팅 오류 발생: {str(e)}",
+                "budget": state["budget"],
+                "escalation_reason": "라우팅 오류",
+                "models_used": models_used
             }
     
     def _vectordb_node(self, state: AgentState) -> dict:
@@ -191,30 +655,101 @@ JSON만 출력하세요."""
             업데이트할 상태 (search_results)
         """
         question = state["question"]
+        degradations = []
+        
+        # 예산이나 시간이 부족하면 검색 문서 수를 줄여 답변 프롬프트를 작게 유지
+        k = None
+        if (state["budget"] < LOW_BUDGET_USD
+                or self._time_left(state, reserve=2 * ANSWER_RESERVE_SECONDS) <= 0):
+            k = LOW_BUDGET_K
+            degradations.append("retrieval_k_capped")
         
         try:
             print(f"📚 D2L 교재 검색: '{question}'")
-            docs = self.d2l_retriever.invoke(question)
+            timeout = self._time_left(state, reserve=ANSWER_RESERVE_SECONDS)
+            rerank_ms = 0.0
+            if self.reranker is not None:
+                # 후보를 넉넉히 가져와 재정렬한 뒤 상위 문서만 사용
+                # (재정렬 통계는 스레드별이므로 검색을 실행한 스레드에서 함께 반환)
+                def rerank():
+                    docs = self.reranker.retrieve(
+                        self.d2l_retriever, question,
+                        fetch_k=k and k * 5, embedding=state.get("query_embedding")
+                    )
+                    return docs, self.reranker.last_stats.get("latency_ms", 0.0)
+                
+                scored_docs, rerank_ms = call_with_timeout(rerank, timeout, subsystem="retrieval")
+                scored_docs = scored_docs[:k]
+                print(f"🔀 재정렬: {self.reranker.fetch_k}개 → {len(scored_docs)}개 "
+                      f"({rerank_ms:.1f}ms)")
+            else:
+                scored_docs = call_with_timeout(
+                    retrieve_with_scores, timeout, self.d2l_retriever, question, k=k,
+                    embedding=state.get("query_embedding"), subsystem="retrieval"
+                )
             
-            if docs:
-                results = "\n\n".join([
-                    f"[문서 {i+1}]\n{doc.page_content}" 
-                    for i, doc in enumerate(docs)
-                ])
-                print(f"✅ {len(docs)}개 문서 검색 완료")
+            if scored_docs:
+                results = self.context_packer.pack(scored_docs)
+                stats = self.context_packer.last_stats
+                print(f"✅ {len(scored_docs)}개 문서 검색 완료 "
+                      f"({stats['used_docs']}개 사용, {stats['tokens']}/{stats['budget']} 토큰)")
             else:
                 results = "관련 문서를 찾을 수 없습니다."
                 print("⚠️ 검색 결과 없음")
             
-            return {"search_results": results}
+            return {
+                "search_results": results,
+                "rerank_ms": rerank_ms,
+                "degradations": degradations
+            }
             
+        except TimeoutError:
+            print("⏱️ VectorDB 검색 시간 초과, 참고 자료 없이 답변")
+            return {
+                "search_results": "",
+                "degradations": degradations + ["retrieval_timeout"],
+                "error": "vectordb: 검색 시간 초과"
+            }
         except Exception as e:
             print(f"❌ VectorDB 검색 실패: {str(e)}")
-            return {"search_results": f"검색 중 오류 발생: {str(e)}"}
+            return {
+                "search_results": f"검색 중 오류 발생: {str(e)}",
+                "degradations": degradations,
+                "error": f"vectordb: {type(e).__name__}: {e}"
+            }
+    
+    @staticmethod
+    def _format_web_results(search_results: List[dict]) -> str:
+        """웹 검색 결과(Tavily 형식)를 참고 자료 문자열로 변환"""
+        return "\n\n".join([
+            f"[{r.get('title', '제목 없음')}]\n{r.get('content', '')}" 
+            for r in search_results
+        ])
+    
+    def _lookup_web_cache(self, state: AgentState) -> Optional[List[dict]]:
+        """웹 캐시에서 최근에 비슷한 질문으로 가져온 문서를 찾음 (없거나 실패하면 None)"""
+        timeout = self._time_left(state, reserve=ANSWER_RESERVE_SECONDS)
+        if self.web_cache is None or timeout <= 0:
+            return None
+        try:
+            return call_with_timeout(
+                self.web_cache.lookup, timeout, state["question"], state.get("query_embedding"),
+                subsystem="cache"
+            )
+        except Exception as e:
+            print(f"⚠️ 웹 캐시 조회 실패: {str(e)}")
+            return None
+    
+    def _store_web_results(self, question: str, search_results: List[dict]):
+        """웹 검색 결과를 캐시에 저장 (작업 스레드에서 실행, 답변을 기다리게 하지 않음)"""
+        try:
+            self.web_cache.add(question, search_results)
+        except Exception as e:
+            print(f"⚠️ 웹 캐시 저장 실패: {str(e)}")
     
     def _websearch_node(self, state: AgentState) -> dict:
         """
-        WebSearch 노드: Tavily로 웹 검색
+        WebSearch 노드: 웹 캐시 확인 후 Tavily로 웹 검색
         
         Args:
             state: 현재 Agent 상태
@@ -229,25 +764,62 @@ JSON만 출력하세요."""
                 "search_results": "웹 검색 도구가 설정되지 않았습니다. Tavily API 키를 확인하세요."
             }
         
+        # 최근에 비슷한 질문으로 가져온 웹 문서가 있으면 검색 비용 없이 사용
+        cached = self._lookup_web_cache(state)
+        if cached:
+            print(f"🗄️ 웹 캐시 적중: {len(cached)}개 문서")
+            return {"search_results": self._format_web_results(cached)}
+        
+        # 검색 후 답변까지 할 예산/시간이 없으면 웹검색 생략
+        answer_cost = estimate_llm_cost(
+            self.model, self.context_packer.max_tokens, ESTIMATED_ANSWER_TOKENS
+        )
+        if state["budget"] < WEB_SEARCH_COST_USD + answer_cost:
+            print("💸 예산 부족: 웹 검색 생략")
+            return {"search_results": "", "degradations": ["websearch_skipped_budget"]}
+        
+        timeout = min(
+            WEB_SEARCH_TIMEOUT_SECONDS,
+            self._time_left(state, reserve=ANSWER_RESERVE_SECONDS)
+        )
+        if timeout <= 0:
+            print("⏱️ 마감 임박: 웹 검색 생략")
+            return {"search_results": "", "degradations": ["websearch_skipped_deadline"]}
+        
         try:
             print(f"🌐 웹 검색: '{question}'")
-            search_results = self.tavily_tool.invoke(question)
+            search_results = call_with_timeout(
+                self.tavily_tool.invoke, timeout, question, subsystem="websearch"
+            )
             
             if search_results:
-                results = "\n\n".join([
-                    f"[{r.get('title', '제목 없음')}]\n{r.get('content', '')}" 
-                    for r in search_results
-                ])
+                results = self._format_web_results(search_results)
                 print(f"✅ {len(search_results)}개 결과 검색 완료")
+                if self.web_cache is not None and isinstance(search_results, list):
+                    submit(self._store_web_results, question, search_results, subsystem="cache")
             else:
                 results = "검색 결과를 찾을 수 없습니다."
                 print("⚠️ 검색 결과 없음")
             
-            return {"search_results": results}
+            return {
+                "search_results": results,
+                "budget": state["budget"] - WEB_SEARCH_COST_USD
+            }
             
+        except TimeoutError:
+            print("⏱️ 웹 검색 시간 초과, 참고 자료 없이 답변")
+            return {
+                "search_results": "",
+                "budget": state["budget"] - WEB_SEARCH_COST_USD,
+                "degradations": ["websearch_timeout"],
+                "error": "websearch: 검색 시간 초과"
+            }
         except Exception as e:
             print(f"❌ 웹 검색 실패: {str(e)}")
-            return {"search_results": f"검색 중 오류 발생: {str(e)}"}
+            return {
+                "search_results": f"검색 중 오류 발생: {str(e)}",
+                "error": f"websearch: {type(e).__name__}: {e}"
+            }
     
     def _direct_llm_node(self, state: AgentState) -> dict:
         """
@@ -260,30 +832,52 @@ JSON만 출력하세요."""
             업데이트할 상태 (final_answer)
         """
         question = state["question"]
-        messages = state.get("messages", [])
+        messages = state["messages"]
         
         try:
             print(f"💬 LLM 직접 응답: '{question}'")
             
-            # 대화 이력 포함
-            conversation = messages + [HumanMessage(content=question)]
-            response = self.llm.invoke(conversation)
+            # 대화 이력 포함 (상태에는 최근 창만 있으므로 오래된 메시지는 이 노드에서만 원본에서 읽음)
+            limit = self.direct_history_messages
+            if limit is None:
+                history = messages.older() + messages.recent
+            else:
+                history = messages.older(max(0, limit - len(messages))) + messages.last(limit)
+            conversation = history + [HumanMessage(content=question)]
+            
+            # 간단한 질문은 소형 모델, 승격된 질문은 큰 모델
+            llm = self.llm if state.get("escalation_reason") else self.fast_llm
+            response, budget = self._invoke_llm(
+                state, conversation, self._time_left(state), step="direct", llm=llm
+            )
+            model = getattr(llm, "model", self.model)
             
             print("✅ 답변 생성 완료")
             
             return {
                 "final_answer": response.content,
+                "budget": budget,
+                "models_used": [f"direct={model}"],
                 "messages": [
                     HumanMessage(content=question),
                     AIMessage(content=response.content)
                 ]
             }
             
+        except TimeoutError:
+            print("⏱️ 답변 시간 초과")
+            return {
+                "final_answer": "응답 시간이 초과되었습니다. 잠시 후 다시 질문해주세요.",
+                "degradations": ["direct_timeout"],
+                "messages": [],
+                "error": "direct: 답변 시간 초과"
+            }
         except Exception as e:
             print(f"❌ LLM 응답 실패: {str(e)}")
             return {
                 "final_answer": f"답변 생성 중 오류가 발생했습니다: {str(e)}",
-                "messages": []
+                "messages": [],
+                "error": f"direct: {type(e).__name__}: {e}"
             }
     
     def _answer_node(self, state: AgentState) -> dict:
@@ -299,7 +893,7 @@ JSON만 출력하세요."""
         question = state["question"]
         search_results = state["search_results"]
         route = state["route"]
-        messages = state.get("messages", [])
+        messages = state["messages"]
         
         # direct 경로는 이미 답변이 생성되어 있음
         if route == "direct":
@@ -308,41 +902,53 @@ JSON만 출력하세요."""
         try:
             print(f"✍️  최종 답변 생성 중...")
             
-            # 대화 이력 포맷팅
-            history = ""
-            if messages:
-                history = "\n이전 대화:\n"
-                for msg in messages[-4:]:  # 최근 4개만
-                    role = "사용자" if isinstance(msg, HumanMessage) else "AI"
-                    history += f"{role}: {msg.content[:100]}...\n"
-            
-            answer_prompt = f"""{history}
-
-질문: {question}
-
-참고 자료 (출처: {'D2L 교재' if route == 'vectordb' else '웹 검색'}):
-{search_results}
-
-위 참고 자료를 바탕으로 질문에 대해 정확하고 상세한 답변을 작성해주세요.
-참고 자료에서 답을 찾을 수 없다면 솔직하게 말씀해주세요."""
+            # [고정 지시문] → [최근 대화] → [참고 자료 + 질문] 순서 (앞부분일수록 요청 간 공통)
+            history = messages.last(ANSWER_HISTORY_MESSAGES)
+            if search_results:
+                source = "D2L 교재" if route == "vectordb" else "웹 검색"
+                answer_messages = build_messages(
+                    ANSWER_SYSTEM_PROMPT,
+                    [(f"참고 자료 (출처: {source})", search_results), ("질문", question)],
+                    history
+                )
+            else:
+                # 시간/예산 제한으로 검색을 못 한 경우: 알고 있는 내용으로 직접 답변
+                answer_messages = build_messages(NO_CONTEXT_SYSTEM_PROMPT, [("질문", question)], history)
 
-            response = self.llm.invoke([SystemMessage(content=answer_prompt)])
+            response, budget = self._invoke_llm(
+                state, answer_messages, self._time_left(state), step=route
+            )
             
             print("✅ 답변 생성 완료")
             
             return {
                 "final_answer": response.content,
+                "budget": budget,
+                "models_used": [f"{route}={self.model}"],
                 "messages": [
                     HumanMessage(content=question),
                     AIMessage(content=response.content)
                 ]
             }
             
+        except TimeoutError:
+            # 마감 안에 답변을 못 만들면 찾아 둔 참고 자료라도 전달
+            print("⏱️ 답변 시간 초과, 검색 결과 반환")
+            answer = "응답 시간이 초과되어 답변을 완성하지 못했습니다."
+            if search_results:
+                answer += f"\n\n검색된 참고 자료:\n{search_results[:1000]}"
+            return {
+                "final_answer": answer,
+                "degradations": ["answer_timeout"],
+                "messages": [],
+                "error": "answer: 답변 시간 초과"
+            }
         except Exception as e:
             print(f"❌ 답변 생성 실패: {str(e)}")
             return {
                 "final_answer": f"답변 생성 중 오류가 발생했습니다: {str(e)}",
-                "messages": []
+                "messages": [],
+                "error": f"answer: {type(e).__name__}: {e}"
             }
     
     def _route_question(self, state: AgentState) -> str:
@@ -357,13 +963,25 @@ JSON만 출력하세요."""
         """
         return state["route"]
     
-    def invoke(self, question: str, chat_history: Optional[List[BaseMessage]] = None) -> dict:
+    def invoke(
+        self,
+        question: str,
+        chat_history: Optional[List[BaseMessage]] = None,
+        deadline_seconds: Optional[float] = None,
+        budget_usd: Optional[float] = None,
+        route_hint: Optional[dict] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> dict:
         """
         질문에 대한 답변을 생성합니다.
         
         Args:
             question: 사용자 질문
-            chat_history: 이전 대화 이력
+            chat_history: 이전 대화 이력 (최근 HISTORY_WINDOW_MESSAGES개만 상태에 넣고 나머지는 older()로 조회)
+            deadline_seconds: 이 요청의 마감 시간 (초, None이면 기본값)
+            budget_usd: 이 요청의 비용 예산 (USD, None이면 기본값)
+            route_hint: 미리 정한 라우팅 결과 {"route", "reasoning", "model"} (batch()에서 사용)
+            query_embedding: 미리 계산한 질의 임베딩 (batch()에서 사용)
             
         Returns:
             결과 딕셔너리
@@ -372,33 +990,176 @@ JSON만 출력하세요."""
                 "route": 선택된 경로,
                 "routing_reason": 라우팅 이유,
                 "search_results": 검색 결과 (있는 경우),
-                "answer": 최종 답변
+                "rerank_ms": 재정렬 지연 시간 (ms),
+                "degradations": 적용된 성능 저하 조치 목록,
+                "models_used": 단계별 사용 모델 목록,
+                "escalation_reason": 큰 모델로 승격한 이유,
+                "cost_usd": 사용한 비용 (추정, USD),
+                "answer": 최종 답변,
+                "error": 검색/답변 단계의 오류 또는 시간 초과 (정상 답변이면 빈 문자열)
             }
         """
         print("\n" + "=" * 60)
         print(f"질문: {question}")
         print("=" * 60)
         
+        budget = DEFAULT_BUDGET_USD if budget_usd is None else budget_usd
+        request_id = uuid.uuid4().hex
+        
         # 초기 상태 설정
         initial_state = {
-            "messages": chat_history or [],
+            "messages": MessageWindow.from_history(chat_history, HISTORY_WINDOW_MESSAGES),
             "question": question,
             "route": "",
             "routing_reason": "",
             "search_results": "",
-            "final_answer": ""
+            "rerank_ms": 0.0,
+            "final_answer": "",
+            "deadline": new_deadline(deadline_seconds),
+            "budget": budget,
+            "degradations": [],
+            "escalation_reason": "",
+            "models_used": [],
+            "request_id": request_id,
+            "route_hint": route_hint,
+            "query_embedding": query_embedding,
+            "error": ""
         }
         
         # Agent 실행
-        result = self.agent.invoke(initial_state)
+        try:
+            # 노드의 모든 LLM/임베딩 호출은 요청 마감 시각까지만 스케줄러 허가를 기다림
+            with scheduler_context(deadline=initial_state["deadline"]):
+                result = self.agent.invoke(initial_state)
+            routing_reason = self._collect_reasoning(request_id, result.get("routing_reason", ""))
+        finally:
+            self._pending_reasons.pop(request_id, None)
         
         return {
             "question": question,
             "route": result.get("route", "unknown"),
-            "routing_reason": result.get("routing_reason", ""),
+            "routing_reason": routing_reason,
             "search_results": result.get("search_results", ""),
-            "answer": result.get("final_answer", "답변을 생성할 수 없습니다.")
+            "rerank_ms": result.get("rerank_ms", 0.0),
+            "degradations": result.get("degradations", []),
+            "models_used": result.get("models_used", []),
+            "escalation_reason": result.get("escalation_reason", ""),
+            "cost_usd": budget - result.get("budget", budget),
+            "answer": result.get("final_answer", "답변을 생성할 수 없습니다."),
+            "error": result.get("error", "")
         }
-
-
-
+    
+    def _route_group(self, questions: List[str]) -> List[Optional[dict]]:
+        """
+        여러 질문을 한 번의 LLM 호출로 라우팅합니다. (batch()용)
+        
+        신뢰도가 기준보다 낮거나 결과가 빠진 질문은 None으로 남겨
+        그래프 안에서 평소처럼 다시 라우팅하게 합니다.
+        
+        Returns:
+            questions와 같은 순서의 {"route", "reasoning", "model"} 또는 None
+        """
+        listing = "\n".join(f"{i}. {question}" for i, question in enumerate(questions))
+        messages = build_messages(
+            ROUTER_SYSTEM_PROMPT, [("질문 목록", listing), ("", ROUTER_BATCH_INSTRUCTION)]
+        )
+        model = getattr(self.fast_llm, "model", self.model)
+        
+        start = time.perf_counter()
+        try:
+            response = self.fast_llm.invoke(
+                messages, response_format=json_schema_format("route_decisions", ROUTE_BATCH_SCHEMA)
+            )
+            decisions = parse_json_object(response.content).get("decisions", [])
+        except Exception as e:
+            print(f"⚠️ 묶음 라우팅 실패: {str(e)}, 질문별 라우팅 사용")
+            return [None] * len(questions)
+        latency = time.perf_counter() - start
+        self.prompt_cache.record(response, latency, model)
+        prompt_tokens = sum(self.context_packer.count_tokens(str(m.content)) for m in messages)
+        self._record_usage(
+            "router_batch", model, latency,
+            response_cost(model, response, prompt_tokens),
+            response_cost(self.model, response, prompt_tokens)
+        )
+        
+        hints: List[Optional[dict]] = [None] * len(questions)
+        for decision in decisions if isinstance(decisions, list) else []:
+            # 형식이 잘못된 항목은 그 질문만 힌트 없이 남김 (나머지 결정은 그대로 사용)
+            if not isinstance(decision, dict):
+                continue
+            try:
+                confidence = float(decision.get("confidence", 0.0))
+            except (TypeError, ValueError):
+                continue
+            index = decision.get("index")
+            if (isinstance(index, int) and 0 <= index < len(questions)
+                    and decision.get("route") in ["vectordb", "websearch", "direct"]
+                    and confidence >= self.router_confidence_threshold):
+                hints[index] = {
+                    "route": decision["route"],
+                    "reasoning": decision.get("reasoning", ""),
+                    "model": model
+                }
+        return hints
+    
+    def batch(
+        self,
+        questions: List[str],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        deadline_seconds: Optional[float] = None,
+        budget_usd: Optional[float] = None,
+        checkpoint_path: Optional[str] = None
+    ):
+        """
+        여러 질문을 동시에 처리하고 끝난 순서대로 결과를 내보냅니다.
+        
+        1. 체크포인트에서 이미 성공한 질문은 건너뜀
+        2. 라우팅: ROUTE_GROUP_SIZE개씩 묶어 소형 모델 호출 한 번으로 결정
+        3. vectordb로 정해진 질문의 임베딩을 한 번의 임베딩 호출로 계산
+        4. 질문별 그래프를 최대 max_concurrency개씩 동시에 실행
+        
+        각 질문은 대화 이력 없이 독립적으로 처리되며, 마감 시간/예산도 질문별로 적용됩니다.
+        (묶음 라우팅 비용은 질문별 예산에서 차감하지 않음)
+        검색/답변 단계가 실패하거나 시간 초과된 질문은 ok=False로 기록되어 다시 실행하면 재시도됩니다.
+        
+        Args:
+            questions: 질문 리스트
+            max_concurrency: 동시에 실행할 최대 질문 수
+            deadline_seconds: 질문별 마감 시간 (초, None이면 기본값)
+            budget_usd: 질문별 비용 예산 (USD, None이면 기본값)
+            checkpoint_path: 결과를 기록할 JSONL 파일 (다시 실행하면 성공한 질문은 건너뜀)
+        
+        Yields:
+            {"index", "question", "ok", "result" (invoke 결과), "error" (실패 시), "latency_s", "finished_s"}
+        """
+        items = pending_items(questions, checkpoint_path)
+        texts = [question for _, question in items]
+        
+        # 묶음 라우팅 (묶음끼리는 동시에 호출)
+        groups = [texts[i:i + ROUTE_GROUP_SIZE] for i in range(0, len(texts), ROUTE_GROUP_SIZE)]
+        futures = [submit(self._route_group, group) for group in groups]
+        hints = [hint for future in futures for hint in future.result()]
+        
+        # vectordb 질문의 임베딩을 한 번에 계산
+        vectordb_positions = [i for i, hint in enumerate(hints) if hint and hint["route"] == "vectordb"]
+        vectors = embed_queries(self.d2l_retriever, [texts[i] for i in vectordb_positions])
+        embeddings = dict(zip(vectordb_positions, vectors))
+        
+        print(f"📦 배치: {len(texts)}개 질문 (건너뜀 {len(questions) - len(texts)}개), "
+              f"묶음 라우팅 {sum(1 for h in hints if h)}개, "
+              f"임베딩 {sum(1 for v in vectors if v is not None)}개")
+        
+        position = {index: i for i, (index, _) in enumerate(items)}
+        
+        def answer(index: int, question: str) -> dict:
+            i = position[index]
+            return self.invoke(
+                question,
+                deadline_seconds=deadline_seconds,
+                budget_usd=budget_usd,
+                route_hint=hints[i],
+                query_embedding=embeddings.get(i)
+            )
+        
+        yield from run_batch(answer, items, max_concurrency, checkpoint_path)
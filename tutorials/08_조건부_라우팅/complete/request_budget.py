@@ -0,0 +1,141 @@
+"""
+request_budget.py - 요청 단위 마감 시간 / 비용 예산
+==================================================
+
+목적:
+    질문 하나를 처리하는 동안 사용할 수 있는 시간(deadline)과 비용(budget)을
+    Agent 상태에 담아 모든 노드에 전달합니다.
+    각 노드는 남은 시간/예산을 확인하고, 부족하면 단계를 건너뛰거나 줄여서
+    느린 웹검색이나 LLM 호출 하나가 전체 응답을 붙잡지 않도록 합니다.
+
+주요 기능:
+    1. 남은 시간 계산 (time.monotonic 기준 절대 마감 시각)
+    2. 모델별 단가로 LLM 호출 비용 추정
+    3. 시간 제한이 있는 도구/LLM 호출 (future.result(timeout))
+    4. 하위 시스템(LLM, 검색, 웹검색, 캐시)별 스레드 풀
+
+주의:
+    시간 초과된 호출은 결과만 버리고 스레드는 끝까지 실행됩니다.
+    (HTTP 요청을 중간에 취소할 수 없으므로 응답 지연만 막음)
+    그런 호출이 쌓여도 다른 하위 시스템의 호출이 대기열에 묶이지 않도록
+    풀을 하위 시스템별로 나누고, 마감까지 시작하지 못한 호출은 취소합니다.
+"""
+
+import contextvars
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+from langchain_core.messages import BaseMessage
+
+from prompt_layout import DEFAULT_INPUT_PRICE, INPUT_PRICES_PER_MILLION, cached_input_tokens
+
+
+# 기본 요청 한도
+DEFAULT_DEADLINE_SECONDS = 20.0
+DEFAULT_BUDGET_USD = 0.02
+
+# 답변 생성을 위해 앞 단계에서 남겨 둘 시간 (초)
+ANSWER_RESERVE_SECONDS = 5.0
+
+# 남은 예산이 이보다 적으면 검색 k를 줄임
+LOW_BUDGET_USD = 0.003
+LOW_BUDGET_K = 2
+
+# 웹검색 1회 비용 (Tavily 기본 검색 1 credit 기준 추정)과 최대 대기 시간
+WEB_SEARCH_COST_USD = 0.008
+WEB_SEARCH_TIMEOUT_SECONDS = 8.0
+
+# 모델별 단가 (USD / 1M 토큰, 입력 / 출력)
+MODEL_PRICES_PER_MILLION = {
+    "gpt-4.1-nano-2025-04-14": (0.10, 0.40),
+    "gpt-4.1-mini-2025-04-14": (0.40, 1.60),
+    "gpt-5-nano-2025-08-07": (0.05, 0.40),
+    "gpt-5-mini-2025-08-07": (0.25, 2.00),
+}
+DEFAULT_MODEL_PRICE = (0.40, 1.60)
+
+# 답변 출력 토큰 수 추정치 (호출 전 비용 예측용)
+ESTIMATED_ANSWER_TOKENS = 600
+
+# 하위 시스템별 작업 스레드 수
+# (느린 웹검색이 스레드를 붙잡고 있어도 LLM/검색 호출은 자기 풀에서 바로 실행)
+SUBSYSTEM_WORKERS = {
+    "llm": 16,
+    "retrieval": 8,
+    "websearch": 4,
+    "cache": 4,
+}
+DEFAULT_SUBSYSTEM = "llm"
+
+_executors = {
+    name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"budget-{name}")
+    for name, workers in SUBSYSTEM_WORKERS.items()
+}
+
+
+def new_deadline(seconds: Optional[float] = None) -> float:
+    """지금부터 seconds초 뒤의 절대 마감 시각 (time.monotonic 기준, None이면 기본값)"""
+    return time.monotonic() + (DEFAULT_DEADLINE_SECONDS if seconds is None else seconds)
+
+
+def remaining_seconds(deadline: float) -> float:
+    """마감까지 남은 시간 (초, 지났으면 0)"""
+    return max(0.0, deadline - time.monotonic())
+
+
+def estimate_llm_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """모델 단가로 LLM 호출 비용(USD)을 계산합니다."""
+    input_price, output_price = MODEL_PRICES_PER_MILLION.get(model, DEFAULT_MODEL_PRICE)
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def response_cost(model: str, response: BaseMessage, prompt_tokens: int) -> float:
+    """
+    LLM 응답의 실제 비용을 계산합니다.
+
+    usage_metadata가 있으면 실제 토큰 수(캐시 적중 입력은 캐시 단가)를, 없으면
+    프롬프트 토큰 수와 응답 길이(글자 수 / 2)로 추정합니다.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        input_tokens, cached = cached_input_tokens(response)
+        _, cached_price = INPUT_PRICES_PER_MILLION.get(model, DEFAULT_INPUT_PRICE)
+        return (
+            estimate_llm_cost(model, input_tokens - cached, usage.get("output_tokens", 0))
+            + cached * cached_price / 1_000_000
+        )
+    return estimate_llm_cost(model, prompt_tokens, len(str(response.content)) // 2)
+
+
+def submit(fn, *args, subsystem: str = DEFAULT_SUBSYSTEM, **kwargs) -> Future:
+    """
+    fn(*args, **kwargs)를 subsystem 풀의 작업 스레드에서 실행합니다.
+
+    호출 스레드의 contextvars(LangChain 콜백/트레이싱 등)를 작업 스레드로 전달합니다.
+
+    Args:
+        subsystem: 사용할 풀 이름 (SUBSYSTEM_WORKERS의 키)
+    """
+    context = contextvars.copy_context()
+    return _executors[subsystem].submit(context.run, fn, *args, **kwargs)
+
+
+def call_with_timeout(fn, timeout: float, *args, subsystem: str = DEFAULT_SUBSYSTEM, **kwargs):
+    """
+    fn(*args, **kwargs)를 subsystem 풀에서 실행하고 최대 timeout초 동안 기다립니다.
+
+    시간 안에 시작하지 못한(풀 대기열에 남은) 호출은 취소되어 실행되지 않습니다.
+
+    Raises:
+        TimeoutError: 시간 안에 끝나지 않은 경우
+    """
+    if timeout <= 0:
+        raise TimeoutError("마감 시간 초과")
+    future = submit(fn, *args, subsystem=subsystem, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        if future.cancel():
+            raise TimeoutError(f"{subsystem} 작업 스레드 대기 중 {timeout:.1f}초 초과") from None
+        raise TimeoutError(f"{timeout:.1f}초 안에 응답 없음") from None
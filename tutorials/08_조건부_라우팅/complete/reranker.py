@@ -0,0 +1,252 @@
+"""
+reranker.py - 검색 결과 재정렬 (Re-ranking)
+===========================================
+
+목적:
+    벡터 검색으로 후보를 넉넉히 가져온 뒤(예: k=30) 질문과 청크를 함께 보는
+    모델로 다시 점수를 매겨 상위 몇 개만 LLM에 전달합니다.
+    프롬프트가 작아지고, 관련 없는 결과로 인한 재시도가 줄어듭니다.
+
+주요 기능:
+    1. 로컬 CPU Cross-Encoder (sentence-transformers, 선택 설치)
+    2. Cross-Encoder가 없을 때 사용하는 BM25 기반 어휘 점수기
+    3. (질문, 청크) 점수 캐시 (LRU, Cross-Encoder만)
+    4. 배치 단위 점수 계산
+    5. 질의별 재정렬 지연 시간 기록
+
+사용 기술:
+    - sentence_transformers.CrossEncoder: 로컬 재정렬 모델
+    - BM25: 어휘 기반 점수
+"""
+
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from two_stage_search import is_two_stage, two_stage_search
+
+
+# CPU에서도 빠른 소형 Cross-Encoder (약 22M 파라미터)
+DEFAULT_CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class LexicalScorer:
+    """
+    BM25 기반 (질문, 청크) 점수기
+
+    Cross-Encoder를 설치하지 않은 환경에서 사용하는 가벼운 대안입니다.
+    후보 집합 안에서 IDF를 계산하므로 별도의 학습/인덱스가 필요 없습니다.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """
+        (질문, 청크) 쌍의 점수를 계산합니다.
+
+        Args:
+            pairs: (질문, 청크 텍스트) 리스트
+
+        Returns:
+            점수 리스트 (클수록 관련성 높음)
+        """
+        docs = [Counter(TOKEN_PATTERN.findall(text.lower())) for _, text in pairs]
+        if not docs:
+            return []
+
+        avg_len = sum(sum(doc.values()) for doc in docs) / len(docs) or 1.0
+        doc_freq = Counter(term for doc in docs for term in doc)
+        n_docs = len(docs)
+
+        scores = []
+        for (query, _), doc in zip(pairs, docs):
+            doc_len = sum(doc.values())
+            score = 0.0
+            for term in set(TOKEN_PATTERN.findall(query.lower())):
+                tf = doc.get(term, 0)
+                if not tf:
+                    continue
+                idf = math.log(1 + (n_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                score += idf * tf * (self.k1 + 1) / (
+                    tf + self.k1 * (1 - self.b + self.b * doc_len / avg_len)
+                )
+            scores.append(score)
+        return scores
+
+
+def load_scorer(model_name: Optional[str] = DEFAULT_CROSS_ENCODER_MODEL):
+    """
+    사용할 점수기를 로드합니다.
+
+    sentence-transformers가 설치되어 있으면 로컬 Cross-Encoder를,
+    없거나 model_name이 None이면 LexicalScorer를 반환합니다.
+
+    Args:
+        model_name: Cross-Encoder 모델 이름
+
+    Returns:
+        (점수기, 이름)
+    """
+    if model_name:
+        try:
+            from sentence_transformers import CrossEncoder
+            return CrossEncoder(model_name, device="cpu"), model_name
+        except ImportError:
+            print("⚠️ sentence-transformers가 없어 BM25 점수기를 사용합니다.")
+    return LexicalScorer(), "bm25"
+
+
+class Reranker:
+    """
+    과다 검색(over-fetch) 후 재정렬하는 검색 단계
+
+    같은 (질문, 청크) 쌍은 캐시에서 바로 점수를 가져오고,
+    캐시에 없는 쌍만 batch_size 단위로 모델에 전달합니다.
+    (BM25 점수는 후보 집합에 따라 달라지므로 캐시하지 않습니다.)
+    """
+
+    def __init__(
+        self,
+        scorer=None,
+        fetch_k: int = 30,
+        top_k: int = 5,
+        batch_size: int = 16,
+        cache_size: int = 10000
+    ):
+        """
+        Args:
+            scorer: predict(pairs) 메서드를 가진 점수기 (None이면 load_scorer())
+            fetch_k: 벡터 스토어에서 가져올 후보 수
+            top_k: 재정렬 후 남길 문서 수
+            batch_size: 한 번에 모델에 넣을 (질문, 청크) 쌍의 수
+            cache_size: 점수 캐시 최대 항목 수
+        """
+        if scorer is None:
+            scorer, self.scorer_name = load_scorer()
+        else:
+            self.scorer_name = type(scorer).__name__
+        self.scorer = scorer
+        self.fetch_k = fetch_k
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def last_stats(self) -> dict:
+        """현재 스레드에서 마지막으로 수행한 재정렬의 통계 (후보 수, 캐시 적중, 지연 시간)"""
+        return getattr(self._local, "stats", {})
+
+    @staticmethod
+    def _cache_key(query: str, text: str) -> str:
+        return hashlib.sha1(f"{query}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[float]:
+        with self._lock:
+            if key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+    def _cache_put(self, key: str, score: float):
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score(self, query: str, docs: List[Document]) -> List[float]:
+        """
+        (질문, 문서) 쌍의 점수를 계산합니다. (캐시 사용)
+
+        Args:
+            query: 질문
+            docs: 후보 문서 리스트
+
+        Returns:
+            문서 순서대로의 점수 리스트
+        """
+        if isinstance(self.scorer, LexicalScorer):
+            # BM25는 후보 집합 전체로 IDF를 계산하므로, 캐시한 점수와 섞으면 한 순위 안에
+            # 서로 다른 IDF 기준의 점수가 섞임 → 캐시 없이 전체 후보를 한 번에 계산
+            pairs = [(query, doc.page_content) for doc in docs]
+            self.last_stats["cache_hits"] = 0
+            return [float(value) for value in self.scorer.predict(pairs)]
+
+        keys = [self._cache_key(query, doc.page_content) for doc in docs]
+        scores: List[Optional[float]] = [self._cache_get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            pairs = [(query, docs[i].page_content) for i in batch]
+            for i, value in zip(batch, self.scorer.predict(pairs)):
+                scores[i] = float(value)
+                self._cache_put(keys[i], scores[i])
+
+        self.last_stats["cache_hits"] = len(docs) - len(missing)
+        return scores
+
+    def rerank(self, query: str, docs: List[Document]) -> List[Tuple[Document, float]]:
+        """
+        후보 문서를 재정렬하여 상위 top_k개를 반환합니다.
+
+        Args:
+            query: 질문
+            docs: 후보 문서 리스트
+
+        Returns:
+            (문서, 재정렬 점수) 리스트 (점수 내림차순)
+        """
+        start = time.perf_counter()
+        self._local.stats = {"candidates": len(docs)}
+
+        scores = self.score(query, docs) if docs else []
+        ranked = sorted(zip(docs, scores), key=lambda pair: pair[1], reverse=True)
+
+        self.last_stats["latency_ms"] = (time.perf_counter() - start) * 1000
+        self.last_stats["scorer"] = self.scorer_name
+        return ranked[:self.top_k]
+
+    def retrieve(
+        self,
+        retriever,
+        query: str,
+        fetch_k: Optional[int] = None,
+        embedding: Optional[List[float]] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        검색기로 fetch_k개를 가져온 뒤 재정렬합니다.
+
+        Args:
+            retriever: VectorStoreRetriever (vectorstore 속성이 있으면 fetch_k개 검색)
+            query: 질문
+            fetch_k: 이번 호출에만 사용할 후보 수 (None이면 self.fetch_k)
+            embedding: 미리 계산한 질의 임베딩 (있으면 임베딩 호출 생략)
+
+        Returns:
+            (문서, 재정렬 점수) 리스트
+        """
+        vectorstore = getattr(retriever, "vectorstore", None)
+        if is_two_stage(vectorstore):
+            docs = [doc for doc, _ in two_stage_search(vectorstore, query, fetch_k or self.fetch_k, embedding)]
+        elif vectorstore is not None and embedding is not None:
+            docs = vectorstore.similarity_search_by_vector(embedding, k=fetch_k or self.fetch_k)
+        elif vectorstore is not None:
+            docs = vectorstore.similarity_search(query, k=fetch_k or self.fetch_k)
+        else:
+            docs = retriever.invoke(query)
+        return self.rerank(query, docs)
@@ -8,6 +8,8 @@ setup_d2l.py - D2L 교재 다운로드 및 벡터 스토어 구축
 
 사용:
     python setup_d2l.py
+    EMBEDDING_BACKEND=fastembed python setup_d2l.py   # 로컬 CPU 임베딩 (embedding_backends.py)
+    EMBEDDING_DIMENSIONS=256 python setup_d2l.py      # 축소 차원 2단계 검색 (two_stage_search.py)
 """
 
 import os
@@ -16,10 +18,17 @@ from pathlib import Path
 
 from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from dotenv import load_dotenv
 
+from text_chunker import StructuredTokenSplitter, chunk_stats
+from chunk_dedup import NearDuplicateFilter
+from embedding_backends import (
+    backend_key, check_manifest, configured_dimensions, index_dimensions,
+    make_embeddings, resolve_backend, write_manifest
+)
+from two_stage_search import truncated_embeddings
+
 load_dotenv()
 
 # 설정
@@ -27,6 +36,8 @@ PDF_URL = "https://d2l.ai/d2l-en.pdf"
 PDF_PATH = "d2l-en.pdf"
 CHROMA_DB_PATH = "./chroma_db_d2l"
 MAX_PAGES = 100  # 처음 100페이지만 처리 (전체는 너무 오래 걸림)
+CHUNK_TOKENS = 400  # 청크 최대 토큰 수
+CHUNK_OVERLAP_TOKENS = 40  # 청크 오버랩 토큰 수
 
 
 def download_pdf(url: str, path: str) -> bool:
@@ -69,6 +80,49 @@ def download_pdf(url: str, path: str) -> bool:
         return False
 
 
+def compare_chunkers(documents, chunks, splitter: StructuredTokenSplitter):
+    """
+    기존 문자 기반 청커(1000자 / 200자 오버랩)와 토큰 기반 청커의
+    청크 수, 토큰 수, 임베딩 비용을 비교하여 출력합니다.
+    (임베딩 API를 호출하지 않고 토큰 수로만 계산)
+    
+    Args:
+        documents: 페이지 단위 문서 리스트
+        chunks: 토큰 기반 청커로 만든 청크 리스트
+        splitter: 토큰 수 계산에 사용할 청커
+    """
+    baseline_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200
+    )
+    baseline = chunk_stats(
+        baseline_splitter.split_documents(documents),
+        splitter.count_tokens,
+        len(documents)
+    )
+    current = chunk_stats(chunks, splitter.count_tokens, len(documents))
+    
+    print("📊 청커 비교 (기존: 1000자/200자 → 현재: "
+          f"{splitter.chunk_tokens}토큰/{splitter.overlap_tokens}토큰)")
+    for label, key, fmt in [
+        ("청크 수", "chunks", "{:.0f}"),
+        ("페이지당 청크", "chunks_per_page", "{:.2f}"),
+        ("평균 토큰", "avg_tokens", "{:.0f}"),
+        ("최소/최대 토큰", None, None),
+        ("전체 토큰", "total_tokens", "{:.0f}"),
+        ("임베딩 비용 ($)", "embedding_cost_usd", "{:.5f}"),
+    ]:
+        if key is None:
+            print(f"   {label}: {baseline['min_tokens']}~{baseline['max_tokens']}"
+                  f" → {current['min_tokens']}~{current['max_tokens']}")
+            continue
+        print(f"   {label}: {fmt.format(baseline[key])} → {fmt.format(current[key])}")
+    
+    if baseline["total_tokens"]:
+        saved = 1 - current["total_tokens"] / baseline["total_tokens"]
+        print(f"   ✅ 임베딩 토큰 절감: {saved * 100:.1f}%")
+
+
 def setup_vectorstore(
     pdf_path: str,
     chroma_path: str,
@@ -85,12 +139,17 @@ def setup_vectorstore(
     Returns:
         Chroma 벡터 스토어 객체
     """
-    # 이미 벡터 스토어가 있으면 로드
+    # 임베딩 백엔드 (EMBEDDING_BACKEND / EMBEDDING_MODEL)
+    spec = resolve_backend()
+    
+    # 이미 벡터 스토어가 있으면 로드 (다른 임베딩 모델로 만든 인덱스면 오류)
     if Path(chroma_path).exists():
         print(f"✅ 기존 벡터 스토어를 로드합니다: {chroma_path}")
-        embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            api_key=os.getenv("OPENAI_API_KEY")
+        check_manifest(chroma_path, spec)
+        embeddings = truncated_embeddings(
+            make_embeddings(**spec, api_key=os.getenv("OPENAI_API_KEY")),
+            index_dimensions(chroma_path),
+            chroma_path
         )
         vectorstore = Chroma(
             persist_directory=chroma_path,
@@ -113,22 +172,36 @@ def setup_vectorstore(
     else:
         print(f"✅ {len(documents)}개 페이지 로드")
     
-    # 2. 텍스트 청킹
+    # 2. 텍스트 청킹 (토큰 기준, 제목/코드/수식 인식, 반복 머리글/바닥글 제거)
     print("✂️  텍스트 청킹 중...")
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200
+    splitter = StructuredTokenSplitter(
+        chunk_tokens=CHUNK_TOKENS,
+        overlap_tokens=CHUNK_OVERLAP_TOKENS
     )
     chunks = splitter.split_documents(documents)
     print(f"✅ {len(chunks)}개의 청크 생성")
+    compare_chunkers(documents, chunks, splitter)
+    
+    # 3. 유사 중복 청크 제거 (반복 라이선스 문구, 코드 예제 등)
+    print("🧹 중복 청크 제거 중...")
+    dedup_filter = NearDuplicateFilter(
+        max_distance=3,
+        count_tokens=splitter.count_tokens
+    )
+    chunks = dedup_filter.filter(chunks)
+    print(dedup_filter.summary())
     
-    # 3. 임베딩 및 벡터 스토어 생성
-    print("🔢 임베딩 생성 및 벡터 스토어 구축 중...")
+    # 4. 임베딩 및 벡터 스토어 생성
+    # EMBEDDING_DIMENSIONS가 있으면 Chroma에는 축소 차원 벡터만, 원래 벡터는 full_vectors/에 저장
+    dimensions = configured_dimensions()
+    print(f"🔢 임베딩 생성 및 벡터 스토어 구축 중... ({backend_key(spec)}"
+          f"{f', Chroma {dimensions}차원' if dimensions else ''})")
     print("   (이 작업은 몇 분 정도 소요될 수 있습니다)")
     
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",
-        api_key=os.getenv("OPENAI_API_KEY")
+    embeddings = truncated_embeddings(
+        make_embeddings(**spec, api_key=os.getenv("OPENAI_API_KEY")),
+        dimensions,
+        chroma_path
     )
     
     vectorstore = Chroma.from_documents(
@@ -136,6 +209,7 @@ def setup_vectorstore(
         embedding=embeddings,
         persist_directory=chroma_path
     )
+    write_manifest(chroma_path, spec, dimensions)
     
     count = vectorstore._collection.count()
     print(f"✅ 벡터 스토어 생성 완료: {count}개 벡터")
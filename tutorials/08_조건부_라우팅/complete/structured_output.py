@@ -0,0 +1,258 @@
+"""
+structured_output.py - 스키마로 제한한 LLM 출력과 관대한 JSON 파서
+=================================================================
+
+목적:
+    Router와 검색 결과 평가가 자유 형식 텍스트를 json.loads로 읽다가
+    Markdown 코드 블록(```json)이나 앞뒤 설명 문장 때문에 실패하고
+    기본값으로 빠지는 문제를 없앱니다.
+
+주요 기능:
+    1. JSON Schema 응답 형식 (OpenAI response_format, strict 모드)
+    2. 관대한 JSON 파서: 코드 블록/앞뒤 문장을 무시하고 첫 JSON 객체만 해석
+    3. 스트리밍 JSON 파서: 청크를 받는 즉시 완성된 필드부터 꺼냄
+       (예: "route" 값이 나오자마자 경로 결정)
+
+사용:
+    response = llm.invoke(messages, response_format=json_schema_format("route_decision", ROUTE_SCHEMA))
+    decision = parse_json_object(response.content)
+
+    parser = StreamingJsonParser()
+    for chunk in llm.stream(messages, response_format=...):
+        parser.feed(chunk.content)
+        if "route" in parser.fields:
+            break
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+
+# Router 결정 스키마 (필드 순서 = 생성 순서: 경로를 가장 먼저 생성하도록 route를 맨 앞에 둠)
+ROUTE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "route": {"type": "string", "enum": ["vectordb", "websearch", "direct"]},
+        "confidence": {"type": "number"},
+        "reasoning": {"type": "string"}
+    },
+    "required": ["route", "confidence", "reasoning"],
+    "additionalProperties": False
+}
+
+# 여러 질문을 한 번에 라우팅하는 스키마 (배치 처리, index = 질문 번호)
+ROUTE_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "decisions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    **ROUTE_SCHEMA["properties"]
+                },
+                "required": ["index", "route", "confidence", "reasoning"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["decisions"],
+    "additionalProperties": False
+}
+
+# 검색 결과 평가 스키마
+RELEVANCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "is_relevant": {"type": "boolean"},
+        "reason": {"type": "string"}
+    },
+    "required": ["is_relevant", "reason"],
+    "additionalProperties": False
+}
+
+
+def json_schema_format(name: str, schema: dict) -> dict:
+    """OpenAI Chat Completions의 response_format 값 (strict JSON Schema)"""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": schema}
+    }
+
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    """
+    텍스트에서 첫 번째 JSON 객체를 찾아 해석합니다.
+
+    코드 블록 표시(```json)나 앞뒤 설명 문장이 있어도 동작하며,
+    객체가 끝나지 않은 채 잘린 경우에는 완성된 필드만 반환합니다.
+
+    Raises:
+        ValueError: JSON 객체를 찾을 수 없는 경우
+    """
+    parser = StreamingJsonParser()
+    parser.feed(text)
+    if not parser.started:
+        raise ValueError("JSON 객체를 찾을 수 없습니다.")
+    if not parser.done and not parser.fields:
+        raise ValueError("완성된 JSON 필드가 없습니다.")
+    return dict(parser.fields)
+
+
+class StreamingJsonParser:
+    """
+    최상위 JSON 객체를 글자 단위로 읽어 완성된 필드를 바로 꺼내는 증분 파서
+
+    - fields: 값이 완성된 필드 {키: 값}
+    - partial: 아직 생성 중인 문자열 필드의 현재까지 내용 {키: 문자열}
+    - done: 닫는 중괄호까지 읽었는지
+
+    첫 '{' 앞의 텍스트(코드 블록 표시, 설명 문장)와 객체 뒤의 텍스트는 무시합니다.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.partial: Dict[str, str] = {}
+        self.started = False
+        self.done = False
+
+        self._state = "before"   # before → key → colon → value → after_value → ... → done
+        self._key: Optional[str] = None
+        self._buffer = ""        # 현재 읽는 키/값 원문
+        self._escape = False
+        self._depth = 0          # 중첩 객체/배열 깊이
+        self._in_nested_string = False
+
+    def _decode_string(self, raw: str) -> str:
+        """이스케이프가 포함된 문자열 원문을 해석 (끝이 잘린 이스케이프는 제외)"""
+        for cut in range(0, 6):
+            try:
+                return json.loads('"' + raw[:len(raw) - cut] + '"')
+            except ValueError:
+                continue
+        return raw
+
+    def _finish_value(self, raw: str):
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw.strip()
+        self.fields[self._key] = value
+        self.partial.pop(self._key, None)
+
+    def feed(self, text: str) -> Dict[str, Any]:
+        """
+        텍스트 조각을 읽습니다.
+
+        Returns:
+            지금까지 완성된 필드
+        """
+        for char in text:
+            if self.done:
+                break
+            self._step(char)
+        return self.fields
+
+    def _step(self, char: str):
+        state = self._state
+
+        if state == "before":
+            if char == "{":
+                self.started = True
+                self._state = "key"
+            return
+
+        if state == "key":
+            if char == "}":
+                self.done = True
+            elif char == '"':
+                self._state = "key_string"
+                self._buffer = ""
+            return
+
+        if state == "key_string":
+            if self._escape:
+                self._buffer += char
+                self._escape = False
+            elif char == "\\":
+                self._buffer += char
+                self._escape = True
+            elif char == '"':
+                self._key = self._decode_string(self._buffer)
+                self._state = "colon"
+            else:
+                self._buffer += char
+            return
+
+        if state == "colon":
+            if char == ":":
+                self._state = "value"
+            return
+
+        if state == "value":
+            if char.isspace():
+                return
+            self._buffer = ""
+            if char == '"':
+                self._state = "string_value"
+                self.partial[self._key] = ""
+            elif char in "{[":
+                self._state = "nested_value"
+                self._buffer = char
+                self._depth = 1
+            else:
+                self._state = "scalar_value"
+                self._buffer = char
+            return
+
+        if state == "string_value":
+            if self._escape:
+                self._buffer += char
+                self._escape = False
+            elif char == "\\":
+                self._buffer += char
+                self._escape = True
+            elif char == '"':
+                self._finish_value('"' + self._buffer + '"')
+                self._state = "after_value"
+                return
+            else:
+                self._buffer += char
+            self.partial[self._key] = self._decode_string(self._buffer)
+            return
+
+        if state == "scalar_value":
+            if char in ",}" or char.isspace():
+                self._finish_value(self._buffer)
+                self._state = "after_value"
+                self._step(char)
+            else:
+                self._buffer += char
+            return
+
+        if state == "nested_value":
+            self._buffer += char
+            if self._in_nested_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_nested_string = False
+            elif char == '"':
+                self._in_nested_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value(self._buffer)
+                    self._state = "after_value"
+            return
+
+        if state == "after_value":
+            if char == ",":
+                self._state = "key"
+            elif char == "}":
+                self.done = True
@@ -0,0 +1,393 @@
+"""
+text_chunker.py - 토큰 기반 + 구조 인식 청커
+============================================
+
+목적:
+    기술 서적 PDF(D2L 등)를 문자 수가 아닌 토큰 수 기준으로 분할하여
+    청크 크기를 균일하게 만들고, 불필요한 오버랩과 반복 머리글/바닥글을
+    제거하여 임베딩 비용과 인덱스 크기를 줄입니다.
+
+주요 기능:
+    1. 토큰 수 기준 청킹 (tiktoken)
+    2. 제목 / 코드 블록 / 수식을 깨뜨리지 않는 블록 단위 분할
+    3. 작은 오버랩 (문장 단위, 코드/수식은 중복하지 않음)
+    4. 페이지마다 반복되는 머리글/바닥글 제거
+    5. 청크 통계 및 임베딩 비용 추정
+
+사용 기술:
+    - tiktoken: 토큰 수 계산 (text-embedding-3-* 와 같은 cl100k_base)
+    - re: 제목/코드/수식 줄 판별
+"""
+
+import re
+from collections import Counter
+from typing import List, Tuple, Optional
+
+import tiktoken
+from langchain_core.documents import Document
+
+
+# text-embedding-3-small 가격 (USD / 1M 토큰)
+EMBEDDING_PRICE_PER_MILLION_TOKENS = 0.02
+
+# "3.2.1 Linear Regression", "Chapter 4", "Exercises" 같은 제목 줄
+HEADING_PATTERN = re.compile(
+    r"^(\d+(\.\d+){0,3}\.?\s+[A-Z][^.!?]{0,80}|Chapter\s+\d+.*|Exercises|Summary|Discussions)$"
+)
+
+# 코드 줄: 들여쓰기, 프롬프트, 파이썬 키워드, 대입/호출로 끝나는 줄
+CODE_PATTERN = re.compile(
+    r"^(\s{2,}\S|>>>|\.\.\.\s|import\s|from\s+\S+\s+import\s|def\s|class\s|return\b|"
+    r"for\s.+:$|if\s.+:$|elif\s|else:|with\s.+:$|@\w|print\(|%matplotlib|!pip)"
+    r"|^[\w\.\[\]]+\s*=\s*\S|^[\w\.]+\([^)]*\)\s*$"
+)
+
+# 수식 줄: 수식 번호 "(3.1.2)"로 끝나거나 수학 기호 비율이 높은 줄
+EQUATION_NUMBER_PATTERN = re.compile(r"\(\d+(\.\d+)+\)\s*$")
+MATH_SYMBOLS = set("=+−-*/^_∑∏∫√∂∇≈≤≥≠∈∀∃→←αβγδεθλμπσφψωΣΠΔ⊤⊙×·|")
+
+# 페이지 번호를 무시하고 비교하기 위한 숫자 정규화
+DIGITS_PATTERN = re.compile(r"\d+")
+
+# 머리글/바닥글 후보로 볼 최대 줄 길이 (본문 문장은 제외)
+MAX_EDGE_LINE_CHARS = 80
+
+# 문장 경계 (오버랩과 긴 문단 분할에 사용)
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?。])\s+")
+
+
+class StructuredTokenSplitter:
+    """
+    토큰 수 기준 + 구조 인식 텍스트 분할기
+
+    RecursiveCharacterTextSplitter와 같은 split_documents 인터페이스를 제공하므로
+    RAGProcessor / setup_d2l에서 그대로 교체해 사용할 수 있습니다.
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int = 400,
+        overlap_tokens: int = 40,
+        encoding_name: str = "cl100k_base",
+        min_repeat_pages: int = 3,
+        edge_lines: int = 2
+    ):
+        """
+        Args:
+            chunk_tokens: 청크 최대 토큰 수
+            overlap_tokens: 이웃 청크와 겹칠 최대 토큰 수 (0이면 오버랩 없음)
+            encoding_name: tiktoken 인코딩 이름
+            min_repeat_pages: 이 페이지 수 이상 반복되는 머리글/바닥글은 제거
+            edge_lines: 페이지 위/아래에서 머리글/바닥글로 검사할 줄 수
+        """
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens는 chunk_tokens보다 작아야 합니다.")
+
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_repeat_pages = min_repeat_pages
+        self.edge_lines = edge_lines
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    def count_tokens(self, text: str) -> int:
+        """텍스트의 토큰 수를 계산합니다."""
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    # ------------------------------------------------------------------
+    # 머리글/바닥글 제거
+    # ------------------------------------------------------------------
+
+    def _edge_keys(self, text: str) -> List[str]:
+        """페이지 위/아래 가장자리 줄을 숫자를 무시한 비교 키로 변환"""
+        lines = [line.strip() for line in text.split("\n") if line.strip()]
+        edges = lines[:self.edge_lines] + lines[-self.edge_lines:]
+        return list({
+            DIGITS_PATTERN.sub("#", line) for line in edges
+            if len(line) <= MAX_EDGE_LINE_CHARS
+        })
+
+    def remove_repeated_lines(self, documents: List[Document]) -> List[Document]:
+        """
+        여러 페이지의 가장자리에 반복되는 머리글/바닥글(쪽 번호 포함)을 제거합니다.
+
+        Args:
+            documents: 페이지 단위 문서 리스트
+
+        Returns:
+            머리글/바닥글이 제거된 문서 리스트 (원본은 수정하지 않음)
+        """
+        if len(documents) < self.min_repeat_pages:
+            return documents
+
+        counts = Counter()
+        for doc in documents:
+            counts.update(self._edge_keys(doc.page_content))
+
+        repeated = {key for key, count in counts.items() if count >= self.min_repeat_pages}
+        if not repeated:
+            return documents
+
+        cleaned = []
+        for doc in documents:
+            lines = doc.page_content.split("\n")
+            non_empty = [i for i, line in enumerate(lines) if line.strip()]
+            edge_idx = set(non_empty[:self.edge_lines] + non_empty[-self.edge_lines:])
+
+            kept = [
+                line for i, line in enumerate(lines)
+                if i not in edge_idx or DIGITS_PATTERN.sub("#", line.strip()) not in repeated
+            ]
+            cleaned.append(Document(page_content="\n".join(kept), metadata=dict(doc.metadata)))
+
+        return cleaned
+
+    # ------------------------------------------------------------------
+    # 블록 분할
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _line_kind(line: str) -> str:
+        """줄 종류 판별: heading / code / equation / text / blank"""
+        stripped = line.strip()
+        if not stripped:
+            return "blank"
+        if HEADING_PATTERN.match(stripped):
+            return "heading"
+        if EQUATION_NUMBER_PATTERN.search(stripped):
+            return "equation"
+        math_ratio = sum(ch in MATH_SYMBOLS for ch in stripped) / len(stripped)
+        if len(stripped) >= 3 and math_ratio > 0.25:
+            return "equation"
+        if CODE_PATTERN.match(line):
+            return "code"
+        return "text"
+
+    def _split_blocks(self, text: str) -> List[Tuple[str, str]]:
+        """
+        텍스트를 (종류, 내용) 블록 리스트로 나눕니다.
+
+        연속된 같은 종류의 줄은 하나의 블록으로 묶고,
+        일반 문단은 빈 줄을 기준으로 나눕니다.
+        """
+        blocks: List[Tuple[str, List[str]]] = []
+
+        for line in text.split("\n"):
+            kind = self._line_kind(line)
+
+            if kind == "blank":
+                # 빈 줄은 문단 경계 (코드 블록 안의 빈 줄은 유지)
+                if blocks and blocks[-1][0] == "code":
+                    blocks[-1][1].append("")
+                elif blocks and blocks[-1][0] == "text":
+                    blocks.append(("break", []))
+                continue
+
+            if blocks and blocks[-1][0] == kind and kind != "heading":
+                blocks[-1][1].append(line.rstrip())
+            else:
+                blocks.append((kind, [line.rstrip()]))
+
+        return [
+            (kind, "\n".join(lines).strip())
+            for kind, lines in blocks
+            if kind != "break" and "".join(lines).strip()
+        ]
+
+    def _split_long_block(self, kind: str, text: str, limit: int) -> List[str]:
+        """limit 토큰보다 큰 블록을 문장(일반 문단) 또는 줄(코드/수식) 단위로 분할"""
+        if kind == "text":
+            units = SENTENCE_PATTERN.split(text)
+            joiner = " "
+        else:
+            units = text.split("\n")
+            joiner = "\n"
+
+        pieces, current, current_tokens = [], [], 0
+        for unit in units:
+            unit_tokens = self.count_tokens(unit)
+
+            # 한 문장/한 줄도 너무 길면 토큰 단위로 자름
+            if unit_tokens > limit:
+                if current:
+                    pieces.append(joiner.join(current))
+                    current, current_tokens = [], 0
+                ids = self.encoding.encode(unit, disallowed_special=())
+                for start in range(0, len(ids), limit):
+                    pieces.append(self.encoding.decode(ids[start:start + limit]))
+                continue
+
+            if current and current_tokens + unit_tokens > limit:
+                pieces.append(joiner.join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += unit_tokens
+
+        if current:
+            pieces.append(joiner.join(current))
+        return pieces
+
+    def _overlap_tail(self, kind: str, text: str) -> str:
+        """다음 청크 앞에 붙일 오버랩 (일반 문단의 마지막 문장들, 코드/수식은 없음)"""
+        if self.overlap_tokens <= 0 or kind != "text":
+            return ""
+
+        tail, tail_tokens = [], 0
+        for sentence in reversed(SENTENCE_PATTERN.split(text)):
+            sentence_tokens = self.count_tokens(sentence)
+            if tail_tokens + sentence_tokens > self.overlap_tokens:
+                break
+            tail.insert(0, sentence)
+            tail_tokens += sentence_tokens
+        return " ".join(tail)
+
+    # ------------------------------------------------------------------
+    # 청크 구성
+    # ------------------------------------------------------------------
+
+    def _pack_blocks(self, blocks: List[Tuple[str, str, int]]) -> List[Tuple[str, int, int]]:
+        """
+        (종류, 내용, 페이지 번호) 블록들을 토큰 예산에 맞게 청크로 묶습니다.
+
+        - 제목은 항상 다음 내용과 같은 청크에 들어갑니다.
+        - 새 제목이 나오면 (현재 청크가 충분히 찼을 때) 새 청크를 시작합니다.
+        - 코드 블록과 수식은 청크 크기를 넘지 않는 한 쪼개지 않습니다.
+
+        Returns:
+            (청크 텍스트, 시작 페이지 번호, 끝 페이지 번호) 리스트
+        """
+        chunks: List[Tuple[str, int, int]] = []
+        current: List[Tuple[str, int]] = []
+        current_tokens = 0
+        last_kind = "text"
+        min_section_tokens = self.chunk_tokens // 4
+
+        def flush():
+            nonlocal current, current_tokens
+            if current:
+                pages = [page for _, page in current]
+                chunks.append(("\n\n".join(text for text, _ in current), min(pages), max(pages)))
+            current, current_tokens = [], 0
+
+        for kind, block, page in blocks:
+            pieces = [block]
+            if self.count_tokens(block) > self.chunk_tokens:
+                # 앞의 제목이 함께 들어갈 자리를 남겨 두고 분할
+                heading_tokens = 0
+                if current and last_kind == "heading":
+                    heading_tokens = self.count_tokens(current[-1][0])
+                pieces = self._split_long_block(kind, block, self.chunk_tokens - heading_tokens)
+
+            for piece in pieces:
+                piece_tokens = self.count_tokens(piece)
+
+                # 새 섹션 시작: 이전 섹션이 충분히 크면 청크를 나눔 (오버랩 없음)
+                if kind == "heading" and current_tokens >= min_section_tokens:
+                    flush()
+
+                if current and current_tokens + piece_tokens > self.chunk_tokens:
+                    # 마지막 줄이 제목이면 제목이 홀로 남지 않도록 다음 청크로 넘김
+                    carried = []
+                    if last_kind == "heading":
+                        carried = [current.pop()]
+                    tail = ""
+                    if current:
+                        tail = self._overlap_tail(last_kind, current[-1][0])
+                        tail_page = current[-1][1]
+                    flush()
+                    current = carried + ([(tail, tail_page)] if tail else [])
+                    current_tokens = sum(self.count_tokens(text) for text, _ in current)
+                    if tail and current_tokens + piece_tokens > self.chunk_tokens:
+                        current.pop()
+                        current_tokens -= self.count_tokens(tail)
+
+                current.append((piece, page))
+                current_tokens += piece_tokens
+                last_kind = kind
+
+        flush()
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        텍스트를 토큰 예산에 맞는 청크로 분할합니다.
+
+        Args:
+            text: 원본 텍스트
+
+        Returns:
+            청크 문자열 리스트
+        """
+        blocks = [(kind, block, 0) for kind, block in self._split_blocks(text)]
+        return [chunk for chunk, _, _ in self._pack_blocks(blocks)]
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        페이지 단위 문서를 청크 단위 문서로 분할합니다.
+
+        반복되는 머리글/바닥글을 먼저 제거한 뒤, 같은 출처의 연속된 페이지는
+        이어서 묶어 페이지 경계에서 문단이 잘린 작은 청크가 생기지 않도록 합니다.
+        청크의 metadata는 청크가 시작된 페이지의 metadata를 따르며,
+        여러 페이지에 걸친 경우 "end_page"가 추가됩니다.
+
+        Args:
+            documents: 페이지 단위 문서 리스트
+
+        Returns:
+            청크 문서 리스트
+        """
+        documents = self.remove_repeated_lines(documents)
+
+        results: List[Document] = []
+        group: List[Document] = []
+
+        def flush_group():
+            blocks = [
+                (kind, block, idx)
+                for idx, doc in enumerate(group)
+                for kind, block in self._split_blocks(doc.page_content)
+            ]
+            for chunk, first, last in self._pack_blocks(blocks):
+                metadata = dict(group[first].metadata)
+                if last > first and "page" in group[last].metadata:
+                    metadata["end_page"] = group[last].metadata["page"]
+                results.append(Document(page_content=chunk, metadata=metadata))
+            group.clear()
+
+        for doc in documents:
+            if group and group[-1].metadata.get("source") != doc.metadata.get("source"):
+                flush_group()
+            group.append(doc)
+        if group:
+            flush_group()
+
+        return results
+
+
+def chunk_stats(
+    chunks: List[Document],
+    count_tokens,
+    pages: Optional[int] = None
+) -> dict:
+    """
+    청크 통계와 임베딩 비용을 계산합니다.
+
+    Args:
+        chunks: 청크 문서 리스트
+        count_tokens: 토큰 수 계산 함수
+        pages: 원본 페이지 수 (페이지당 청크 수 계산용)
+
+    Returns:
+        {"chunks", "total_tokens", "avg_tokens", "min_tokens", "max_tokens",
+         "chunks_per_page", "embedding_cost_usd"}
+    """
+    tokens = [count_tokens(chunk.page_content) for chunk in chunks] or [0]
+    total = sum(tokens)
+    return {
+        "chunks": len(chunks),
+        "total_tokens": total,
+        "avg_tokens": total / len(tokens),
+        "min_tokens": min(tokens),
+        "max_tokens": max(tokens),
+        "chunks_per_page": len(chunks) / pages if pages else None,
+        "embedding_cost_usd": total / 1_000_000 * EMBEDDING_PRICE_PER_MILLION_TOKENS
+    }
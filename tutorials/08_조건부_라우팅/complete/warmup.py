@@ -0,0 +1,282 @@
+"""
+warmup.py - 무거운 리소스 미리 준비 (Warm-start) 및 import 시간 측정
+===================================================================
+
+목적:
+    Streamlit 워커가 처음 뜰 때 무거운 모듈, 벡터 스토어, LLM 클라이언트를
+    첫 사용자의 질문이 아닌 백그라운드 스레드에서 미리 준비하고,
+    각 모듈의 import 시간을 측정하여 느린 모듈을 찾습니다.
+
+주요 기능:
+    1. 프로세스 전역 리소스 캐시 (벡터 스토어, 웹 캐시, 질의 임베딩 묶음 처리기)
+       (리소스별 잠금: 벡터 스토어를 여는 동안 다른 리소스 요청이 기다리지 않음)
+    2. 백그라운드 워밍업 (프로세스당 한 번만 실행)
+       - LLM 클라이언트는 API 요청 없이 Agent가 공유할 ChatOpenAI만 미리 생성
+    3. 모듈별 import 시간 측정 (새 인터프리터에서 측정)
+
+사용:
+    # import 시간 측정
+    python warmup.py
+
+    # 앱에서 사용
+    from warmup import start_background_warmup, get_d2l_vectorstore
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+# 앱에서 사용하는 무거운 모듈 (측정 대상)
+HEAVY_MODULES = [
+    "streamlit",
+    "langchain_openai",
+    "langchain_community.vectorstores",
+    "langchain_community.tools.tavily_search",
+    "langgraph.graph",
+    "chromadb",
+    "tiktoken",
+    "rag_router_agent",
+]
+
+# 미리 만들 LLM 클라이언트 모델과 온도 (RouterAgent의 기본 모델 / 캐스케이드 모델과 같은 설정)
+WARMUP_MODELS = ("gpt-4.1-mini-2025-04-14", "gpt-4.1-nano-2025-04-14")
+WARMUP_TEMPERATURE = 0.3
+
+_resources: Dict[str, object] = {}
+_resource_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()  # _resources / _resource_locks / _warmup_future 조회용 (잠깐만 잡음)
+_warmup_future: Optional[Future] = None
+
+
+def _get_or_create(key: str, create: Callable[[], object]):
+    """
+    key의 리소스를 한 번만 만듭니다.
+
+    만드는 동안에는 그 리소스의 잠금만 잡으므로 같은 리소스를 요청한 스레드만 기다리고,
+    이미 만들어진 리소스나 다른 리소스는 바로 반환/생성합니다.
+    """
+    with _lock:
+        if key in _resources:
+            return _resources[key]
+        resource_lock = _resource_locks.setdefault(key, threading.Lock())
+    with resource_lock:
+        if key not in _resources:
+            resource = create()
+            with _lock:
+                _resources[key] = resource
+    return _resources[key]
+
+
+def get_d2l_vectorstore(chroma_path: str, api_key: Optional[str]):
+    """
+    D2L 벡터 스토어를 프로세스 전역에서 한 번만 엽니다.
+
+    Args:
+        chroma_path: Chroma DB 경로
+        api_key: OpenAI API 키
+
+    Returns:
+        (벡터 스토어, 벡터 개수)
+    """
+    def create():
+        # 필요할 때만 import (import 비용을 워밍업 스레드에서 지불)
+        from langchain_community.vectorstores import Chroma
+
+        from embedding_backends import (
+            backend_key, batches_queries, check_manifest, index_dimensions, make_embeddings,
+            resolve_backend
+        )
+        from embedding_batcher import shared_batching_embeddings
+        from two_stage_search import truncated_embeddings
+
+        # 인덱스를 만든 임베딩 모델과 같은 설정인지 먼저 확인
+        spec = resolve_backend()
+        check_manifest(chroma_path, spec)
+
+        # 모든 세션의 검색 질의를 몇 ms씩 모아 한 번의 임베딩 요청으로 보냄
+        embeddings = shared_batching_embeddings(
+            f"{backend_key(spec)}:{api_key}",
+            lambda: make_embeddings(**spec, api_key=api_key),
+            batch_queries=batches_queries(spec)
+        )
+        # 축소 차원 인덱스이면 저차원 검색 후 원래 벡터로 재채점 (two_stage_search.py)
+        embeddings = truncated_embeddings(embeddings, index_dimensions(chroma_path), chroma_path)
+        vectorstore = Chroma(
+            persist_directory=chroma_path,
+            embedding_function=embeddings
+        )
+        return vectorstore, vectorstore._collection.count()
+
+    return _get_or_create(f"vectorstore:{chroma_path}", create)
+
+
+def get_web_cache(cache_path: str, api_key: Optional[str]):
+    """
+    웹검색 결과 캐시를 프로세스 전역에서 한 번만 엽니다.
+
+    D2L 벡터 스토어와 같은 질의 임베딩 묶음 처리기를 공유하지만,
+    축소 차원 래퍼 없이 원래 임베딩으로 저장합니다. (web_cache.py)
+
+    Args:
+        cache_path: 웹 캐시 Chroma 경로
+        api_key: OpenAI API 키
+
+    Returns:
+        WebCache 인스턴스
+    """
+    def create():
+        from embedding_backends import backend_key, batches_queries, make_embeddings, resolve_backend
+        from embedding_batcher import shared_batching_embeddings
+        from web_cache import WebCache
+
+        spec = resolve_backend()
+        embeddings = shared_batching_embeddings(
+            f"{backend_key(spec)}:{api_key}",
+            lambda: make_embeddings(**spec, api_key=api_key),
+            batch_queries=batches_queries(spec)
+        )
+        return WebCache(embeddings, cache_path, embedding_spec=spec)
+
+    return _get_or_create(f"web_cache:{cache_path}", create)
+
+
+def warm_llm_clients(api_key: Optional[str], models: Sequence[str] = WARMUP_MODELS) -> List[str]:
+    """
+    Agent가 사용할 ChatOpenAI 클라이언트를 API 요청 없이 미리 만듭니다.
+
+    ResilientChatModel은 같은 설정의 클라이언트를 프로세스 전역에서 공유하므로
+    (resilient_llm.shared_chat_client) 여기서 만든 클라이언트와 HTTP 연결 풀을
+    나중에 만들어지는 Agent가 그대로 사용합니다. 대체 모델 체인까지 함께 만듭니다.
+
+    Returns:
+        클라이언트를 만든 모델 목록
+    """
+    from resilient_llm import ResilientChatModel
+
+    warmed: List[str] = []
+    for model in models:
+        llm = ResilientChatModel(model=model, temperature=WARMUP_TEMPERATURE, api_key=api_key)
+        warmed.extend(m for m in llm.warm_up() if m not in warmed)
+    return warmed
+
+
+def _warm_up(chroma_path: str, api_key: Optional[str]) -> Dict[str, float]:
+    """워밍업 본체: 단계별 소요 시간(초)을 반환"""
+    timings = {}
+
+    start = time.perf_counter()
+    import rag_router_agent  # noqa: F401  (langgraph, langchain 등 무거운 import)
+    timings["import"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        warm_llm_clients(api_key)
+    except Exception as e:
+        print(f"⚠️ LLM 클라이언트 준비 실패: {str(e)}")
+    timings["llm_client"] = time.perf_counter() - start
+
+    if os.path.exists(chroma_path):
+        start = time.perf_counter()
+        vectorstore, _ = get_d2l_vectorstore(chroma_path, api_key)
+        timings["vectorstore_open"] = time.perf_counter() - start
+
+        # 첫 검색 시 HNSW 인덱스를 메모리에 올리는 비용을 미리 지불
+        start = time.perf_counter()
+        try:
+            vectorstore.similarity_search("warm-up", k=1)
+        except Exception as e:
+            print(f"⚠️ 워밍업 검색 실패: {str(e)}")
+        timings["first_search"] = time.perf_counter() - start
+
+    print("🔥 워밍업 완료: " + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    return timings
+
+
+def start_background_warmup(chroma_path: str, api_key: Optional[str]) -> Future:
+    """
+    워밍업을 백그라운드 스레드에서 시작합니다. (프로세스당 한 번)
+
+    이미 시작되었으면 같은 Future를 반환하므로 여러 세션에서 호출해도 안전합니다.
+
+    Args:
+        chroma_path: D2L Chroma DB 경로
+        api_key: OpenAI API 키
+
+    Returns:
+        워밍업 결과 (단계별 소요 시간)를 담을 Future
+    """
+    global _warmup_future
+    with _lock:
+        if _warmup_future is not None:
+            return _warmup_future
+        _warmup_future = Future()
+
+    def run():
+        try:
+            _warmup_future.set_result(_warm_up(chroma_path, api_key))
+        except Exception as e:
+            _warmup_future.set_exception(e)
+
+    threading.Thread(target=run, name="warmup", daemon=True).start()
+    return _warmup_future
+
+
+def measure_import_times(modules: List[str], repeat: int = 3) -> Dict[str, float]:
+    """
+    모듈별 import 시간을 측정합니다.
+
+    이미 import된 모듈의 캐시 영향을 없애기 위해 매번 새 인터프리터에서 측정하고,
+    repeat번 중 가장 짧은 시간을 사용합니다.
+
+    Args:
+        modules: 측정할 모듈 이름 리스트
+        repeat: 반복 횟수
+
+    Returns:
+        {모듈 이름: import 시간(초)} (import 실패 시 -1)
+    """
+    code = (
+        "import time, importlib, sys\n"
+        "start = time.perf_counter()\n"
+        "importlib.import_module(sys.argv[1])\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    results = {}
+    for module in modules:
+        best = None
+        for _ in range(repeat):
+            proc = subprocess.run(
+                [sys.executable, "-c", code, module],
+                capture_output=True,
+                text=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            if proc.returncode != 0:
+                best = -1.0
+                break
+            elapsed = float(proc.stdout.strip().splitlines()[-1])
+            best = elapsed if best is None else min(best, elapsed)
+        results[module] = best
+    return results
+
+
+def main():
+    """모듈별 import 시간 출력"""
+    print("=" * 60)
+    print("모듈별 import 시간 (새 인터프리터, 최솟값)")
+    print("=" * 60)
+
+    for module, seconds in measure_import_times(HEAVY_MODULES).items():
+        if seconds < 0:
+            print(f"  {module:<45} import 실패")
+        else:
+            print(f"  {module:<45} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+web_cache.py - 웹검색 결과 로컬 캐시 (TTL + LRU 벡터 컬렉션)
+============================================================
+
+목적:
+    websearch 경로는 Tavily로 가져온 웹 문서를 답변 하나에만 쓰고 버리므로,
+    다음 사용자가 같은 소식을 물어도 다시 유료 검색을 합니다.
+    가져온 웹 문서를 청크로 나눠 임베딩하고 로컬 Chroma 컬렉션("web_cache")에 저장해 두고,
+    충분히 최근에 비슷한 질문으로 검색한 적이 있으면 네트워크 없이 캐시에서 답합니다.
+
+주요 기능:
+    1. add: 검색 질문 1개 + 웹 문서 청크들을 검색 ID 하나로 묶어 저장
+    2. lookup: 저장된 검색 질문 중 코사인 유사도가 match_threshold 이상인 것이 있으면
+       (TTL 안의) 캐시 청크 중 질문과 가장 가까운 k개를 Tavily 결과 형식으로 반환
+    3. 만료: fetched_at이 ttl_seconds보다 오래된 검색은 조회에서 제외하고 저장할 때 삭제
+    4. LRU 제거: 저장된 검색이 max_searches를 넘으면 가장 오래 사용하지 않은 검색부터 삭제
+       (마지막 사용 시각은 메타데이터에 기록하므로 재시작 후에도 유지)
+    5. 임베딩 모델이 바뀌면 캐시를 비우고 새로 만듦 (embedding_manifest.json)
+    6. python web_cache.py: 저장된 검색 목록 / 나이 / 마지막 사용 시각 확인 (--clear로 비우기)
+
+주의:
+    캐시 적중 여부는 질문끼리의 유사도로 판단합니다. (질문-문서 유사도는 같은 주제여도 낮음)
+    최신성이 중요한 질문이 너무 오래된 답을 받지 않도록 TTL을 짧게 둡니다.
+"""
+
+import argparse
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_backends import read_manifest, write_manifest
+from text_chunker import StructuredTokenSplitter
+
+
+COLLECTION_NAME = "web_cache"
+
+# 캐시한 웹 문서를 사용할 최대 나이 (초)
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+
+# 저장할 최대 검색 수 (넘으면 LRU 제거)
+DEFAULT_MAX_SEARCHES = 500
+
+# 이 코사인 유사도 이상인 이전 검색 질문이 있으면 캐시 적중
+DEFAULT_MATCH_THRESHOLD = 0.88
+
+# 캐시에서 반환할 청크 수 / 청크 크기 (토큰)
+DEFAULT_K = 4
+CHUNK_TOKENS = 300
+CHUNK_OVERLAP_TOKENS = 30
+
+
+class WebCache:
+    """
+    웹검색 결과 벡터 캐시 (모든 스레드 공유)
+
+    검색 하나는 질문 문서(kind="query") 1개와 웹 문서 청크(kind="chunk") 여러 개로 저장되며,
+    모두 같은 search_id / fetched_at 메타데이터를 가집니다.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        persist_directory: Optional[str] = None,
+        embedding_spec: Optional[Dict[str, str]] = None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_searches: int = DEFAULT_MAX_SEARCHES,
+        match_threshold: float = DEFAULT_MATCH_THRESHOLD,
+        k: int = DEFAULT_K
+    ):
+        """
+        Args:
+            embeddings: 임베딩 (축소 차원 래퍼가 아닌 원래 임베딩)
+            persist_directory: 캐시 저장 폴더 (None이면 메모리)
+            embedding_spec: 임베딩 백엔드/모델 (resolve_backend 결과, 바뀌면 캐시를 비움)
+            ttl_seconds: 캐시 문서를 사용할 최대 나이 (초)
+            max_searches: 저장할 최대 검색 수
+            match_threshold: 캐시 적중으로 볼 질문 간 코사인 유사도
+            k: 반환할 청크 수
+        """
+        from langchain_community.vectorstores import Chroma
+
+        if persist_directory and embedding_spec:
+            manifest = read_manifest(persist_directory)
+            if manifest and (manifest["backend"], manifest["model"]) != (
+                embedding_spec["backend"], embedding_spec["model"]
+            ):
+                # 다른 모델의 벡터와는 비교할 수 없으므로 캐시를 새로 시작
+                print(f"🗑️ 임베딩 모델이 바뀌어 웹 캐시를 비웁니다: {persist_directory}")
+                shutil.rmtree(persist_directory)
+                manifest = None
+            if manifest is None:
+                write_manifest(persist_directory, embedding_spec)
+
+        self.embeddings = embeddings
+        self.ttl_seconds = ttl_seconds
+        self.max_searches = max_searches
+        self.match_threshold = match_threshold
+        self.k = k
+        self.splitter = StructuredTokenSplitter(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+
+        self.store = Chroma(
+            collection_name=COLLECTION_NAME,
+            embedding_function=embeddings,
+            persist_directory=persist_directory,
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+        self._collection = self.store._collection
+
+        # search_id → 질문 문서 메타데이터 (앞쪽이 가장 오래 사용하지 않은 검색)
+        self._lock = threading.Lock()
+        self._searches: "OrderedDict[str, dict]" = OrderedDict()
+        self._load_index()
+
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "stored": 0,
+            "stored_chunks": 0,
+            "expired": 0,
+            "evicted": 0
+        }
+
+    def _load_index(self):
+        """저장된 질문 문서로 LRU 순서를 복원합니다."""
+        data = self._collection.get(where={"kind": "query"}, include=["metadatas"])
+        for metadata in sorted(data["metadatas"], key=lambda m: m["last_used"]):
+            self._searches[metadata["search_id"]] = metadata
+
+    # ------------------------------------------------------------------
+    # 조회
+    # ------------------------------------------------------------------
+
+    def _fresh(self, kind: str) -> dict:
+        """TTL 안의 kind 문서만 고르는 Chroma where 조건"""
+        return {"$and": [{"kind": kind}, {"fetched_at": {"$gte": time.time() - self.ttl_seconds}}]}
+
+    def lookup(self, question: str, embedding: Optional[List[float]] = None) -> Optional[List[dict]]:
+        """
+        비슷한 질문으로 최근에 검색한 적이 있으면 캐시 청크를 반환합니다.
+
+        Args:
+            question: 사용자 질문
+            embedding: 미리 계산한 질문 임베딩 (None이면 여기서 계산)
+
+        Returns:
+            Tavily 결과와 같은 형식의 리스트 [{"title", "url", "content"}] (적중하지 않으면 None)
+        """
+        with self._lock:
+            self.stats["lookups"] += 1
+            if not self._searches:
+                return None
+
+        vector = embedding or self.embeddings.embed_query(question)
+        match = self._collection.query(
+            query_embeddings=[vector], n_results=1,
+            where=self._fresh("query"), include=["metadatas", "distances"]
+        )
+        if not match["ids"][0] or 1 - match["distances"][0][0] < self.match_threshold:
+            return None
+
+        # 일치한 검색에서 가져온 청크만 사용 (다른 검색의 청크가 섞이지 않도록)
+        search_id = match["metadatas"][0][0]["search_id"]
+        chunks = self._collection.query(
+            query_embeddings=[vector], n_results=self.k,
+            where={"$and": [{"kind": "chunk"}, {"search_id": search_id}]},
+            include=["documents", "metadatas"]
+        )
+        if not chunks["ids"][0]:
+            return None
+
+        self._touch(search_id)
+        with self._lock:
+            self.stats["hits"] += 1
+        return [
+            {"title": metadata.get("title", "제목 없음"), "url": metadata.get("url", ""), "content": document}
+            for document, metadata in zip(chunks["documents"][0], chunks["metadatas"][0])
+        ]
+
+    def _touch(self, search_id: str):
+        """검색을 LRU 맨 뒤로 옮기고 마지막 사용 시각을 기록합니다."""
+        with self._lock:
+            metadata = self._searches.get(search_id)
+            if metadata is None:
+                return
+            metadata = {**metadata, "last_used": time.time()}
+            self._searches[search_id] = metadata
+            self._searches.move_to_end(search_id)
+        self._collection.update(ids=[f"{search_id}:query"], metadatas=[metadata])
+
+    # ------------------------------------------------------------------
+    # 저장 / 만료 / 제거
+    # ------------------------------------------------------------------
+
+    def add(self, question: str, results: List[dict]):
+        """
+        웹검색 결과를 청크로 나눠 저장하고, 만료/초과된 검색을 정리합니다.
+
+        Args:
+            question: 검색한 질문
+            results: Tavily 결과 리스트 [{"url", "content", ("title")}]
+        """
+        now = time.time()
+        search_id = uuid.uuid4().hex
+        common = {"search_id": search_id, "fetched_at": now}
+        query_metadata = {**common, "kind": "query", "last_used": now, "query": question[:500]}
+
+        texts, metadatas = [question], [query_metadata]
+        for result in results:
+            content = result.get("content") if isinstance(result, dict) else None
+            if not content:
+                continue
+            for chunk in self.splitter.split_text(content):
+                texts.append(chunk)
+                metadatas.append({
+                    **common,
+                    "kind": "chunk",
+                    "title": result.get("title") or "제목 없음",
+                    "url": result.get("url") or ""
+                })
+        if len(texts) == 1:
+            return
+
+        ids = [f"{search_id}:query"] + [f"{search_id}:{i}" for i in range(1, len(texts))]
+        self.store.add_texts(texts, metadatas=metadatas, ids=ids)
+        with self._lock:
+            self._searches[search_id] = query_metadata
+            self.stats["stored"] += 1
+            self.stats["stored_chunks"] += len(texts) - 1
+
+        self.expire()
+        self.evict()
+
+    def _delete(self, search_ids: List[str]):
+        if search_ids:
+            self._collection.delete(where={"search_id": {"$in": search_ids}})
+
+    def expire(self) -> int:
+        """TTL이 지난 검색을 삭제하고 삭제한 검색 수를 반환합니다."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [sid for sid, metadata in self._searches.items() if metadata["fetched_at"] < cutoff]
+            for search_id in expired:
+                del self._searches[search_id]
+            self.stats["expired"] += len(expired)
+        self._delete(expired)
+        return len(expired)
+
+    def evict(self) -> int:
+        """max_searches를 넘는 만큼 가장 오래 사용하지 않은 검색을 삭제합니다."""
+        with self._lock:
+            evicted = []
+            while len(self._searches) > self.max_searches:
+                search_id, _ = self._searches.popitem(last=False)
+                evicted.append(search_id)
+            self.stats["evicted"] += len(evicted)
+        self._delete(evicted)
+        return len(evicted)
+
+    def clear(self):
+        """모든 캐시 항목을 삭제합니다."""
+        with self._lock:
+            search_ids = list(self._searches)
+            self._searches.clear()
+        self._delete(search_ids)
+
+    # ------------------------------------------------------------------
+    # 통계
+    # ------------------------------------------------------------------
+
+    def entries(self) -> List[dict]:
+        """저장된 검색 목록 (최근 사용 순)"""
+        with self._lock:
+            return [dict(metadata) for metadata in reversed(self._searches.values())]
+
+    def summary(self) -> dict:
+        """조회 수, 적중 수/적중률, 저장된 검색 수, 만료/제거 수"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["searches"] = len(self._searches)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from embedding_backends import make_embeddings, resolve_backend
+
+    parser = argparse.ArgumentParser(description="웹검색 캐시 항목 확인")
+    parser.add_argument("--path", default="./chroma_web_cache", help="웹 캐시 폴더")
+    parser.add_argument("--clear", action="store_true", help="모든 항목 삭제")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"⚠️ 웹 캐시가 없습니다: {args.path}")
+        return
+
+    spec = resolve_backend()
+    cache = WebCache(make_embeddings(**spec, api_key=os.getenv("OPENAI_API_KEY")), args.path, spec)
+    if args.clear:
+        cache.clear()
+        print("🗑️ 웹 캐시를 비웠습니다.")
+        return
+
+    now = time.time()
+    entries = cache.entries()
+    print(f"저장된 검색 {len(entries)}개 (TTL {cache.ttl_seconds / 3600:.1f}시간, 최대 {cache.max_searches}개)")
+    for metadata in entries:
+        age_min = (now - metadata["fetched_at"]) / 60
+        last_used = datetime.fromtimestamp(metadata["last_used"]).strftime("%m-%d %H:%M")
+        expired = " (만료)" if now - metadata["fetched_at"] > cache.ttl_seconds else ""
+        print(f"  {age_min:7.1f}분 전 | 마지막 사용 {last_used} | {metadata['query'][:60]}{expired}")
+
+
+if __name__ == "__main__":
+    main()